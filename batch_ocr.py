@@ -0,0 +1,379 @@
+"""
+Batch OCR over a directory or glob of receipt images.
+
+OpenCV preprocessing and Tesseract OCR run in a process pool sized to the number of cores, while item
+classification stays in this process with a single loaded model that classifies whole groups of
+receipts per forward pass. Results are appended to a JSON Lines file, one record per image:
+
+    {"path": "data/receipt_01.jpg", "items": [...], "totals": 123000}
+    {"path": "data/receipt_02.jpg", "error": "ValueError: No suitable ROI found in the image."}
+
+An output ending in ``.parquet`` is written as one row per item instead, and an output directory gets one
+JSON file per image, see ``result_sinks``.
+
+Re-running the same command resumes: images that already have a record in the output are skipped.
+
+Pack files written by ``image_io.py`` are read memory-mapped, each image is then recorded by its
+``"<pack>#<key>"`` reference.
+
+Usage:
+    python batch_ocr.py data/ receipt_dataset/ -o results.jsonl
+    python batch_ocr.py receipts.pack -o results.parquet
+    python batch_ocr.py "scans/**/*.jpg" -o results.jsonl --workers 8 --retry-errors
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+import ocr_model
+from prediction_cache import PredictionCache
+from catalog import Catalog
+from instrumentation import Instrumentation, Metrics, PrometheusExporter
+from image_io import PACK_EXTENSION, PackReader, read_encoded
+from result_sinks import open_sink
+from result_store import ResultStore, content_hash
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+
+def find_images(inputs):
+    """
+    Expand directories, glob patterns and file paths into a sorted list of image paths.
+
+    Pack files are expanded into the references of their images, see ``image_io``.
+
+    Args:
+        inputs (list): Directories, glob patterns, image files or pack files.
+
+    Returns:
+        list: The image paths, without duplicates.
+    """
+    paths = set()
+    for pattern in inputs:
+        if pattern.endswith(PACK_EXTENSION) and os.path.isfile(pattern):
+            reader = PackReader(pattern)
+            paths.update(reader.refs())
+            reader.close()
+            continue
+        if os.path.isdir(pattern):
+            candidates = glob.glob(os.path.join(pattern, "**", "*"), recursive=True)
+        else:
+            candidates = glob.glob(pattern, recursive=True)
+        paths.update(path for path in candidates if path.lower().endswith(IMAGE_EXTENSIONS))
+
+    return sorted(paths)
+
+
+def _init_worker():
+    # One process per core already, so keep OpenCV from starting its own thread pool in each worker
+    cv2.setNumThreads(1)
+
+
+def _read_receipt(job, options):
+    """
+    OCR one image in a worker process, capturing any error instead of raising it.
+
+    Args:
+        job (tuple): ``(path, data)``, the encoded image if it was already read by ``_hash_image``, else None.
+        options (dict): Keyword arguments for ``ocr_model.read_items``.
+    """
+    path, data = job
+    metrics = Metrics()
+    try:
+        return path, ocr_model.read_items(path if data is None else data, metrics=metrics, **options), None, metrics
+    except Exception as e:
+        metrics.count("errors")
+        return path, None, f"{type(e).__name__}: {e}", metrics
+
+
+def _hash_image(path):
+    """
+    Read and hash one image in a worker process, see ``result_store.content_hash``.
+
+    Returns:
+        tuple: ``(content_hash, data)`` of the encoded image, or None if it cannot be read.
+    """
+    try:
+        data = read_encoded(path)
+    except ValueError:
+        return None
+    return content_hash(data), data
+
+
+def _lookup_stored(paths, hashes, result_store, stored, keys):
+    """
+    Yield the ``_read_receipt`` jobs of the images without a stored result, as their hashes arrive from the
+    workers. The bytes read for the hash are passed on, so a missed image is not read again.
+
+    Args:
+        paths (list): The image paths.
+        hashes (iterable): The ``_hash_image`` result of every path, in order.
+        result_store (result_store.ResultStore): The store to look the images up in.
+        stored (list): Receives the ``(path, receipt)`` pairs answered by the store.
+        keys (dict): Receives the ``(content_hash, size)`` of every yielded path, to store its result under.
+    """
+    for path, hashed in zip(paths, hashes):
+        if hashed is None:
+            # Unreadable, the worker reports the error
+            yield path, None
+            continue
+        key, data = hashed
+        receipt = result_store.get(key, len(data))
+        if receipt is None:
+            keys[path] = (key, len(data))
+            yield path, data
+        else:
+            stored.append((path, receipt))
+
+
+def run_batch(
+    paths,
+    output_path,
+    model_path,
+    tokenizer_path,
+    workers=None,
+    classify_every=64,
+    ocr_config=ocr_model.OCR_CONFIG,
+    max_width=None,
+    ocr_mode="block",
+    ocr_backend="auto",
+    reduce=1,
+    grayscale=False,
+    roi_method="contours",
+    cache=None,
+    instrumentation=None,
+    catalog=None,
+    result_store=None,
+):
+    """
+    OCR and classify the given images, writing one result per image to the output.
+
+    Args:
+        paths (list): Paths to the receipt images to process.
+        output_path (str): The output path, see ``result_sinks.open_sink``, or an already open sink. Results
+            are added to what the output already holds.
+        model_path (str): Path to the pre-trained Keras model file.
+        tokenizer_path (str): Path to the tokenizer pickle file.
+        workers (int): Number of OCR worker processes, defaults to the number of cores.
+        classify_every (int): Number of receipts whose items are classified together.
+        ocr_config (str): Custom config passed to pytesseract.
+        max_width (int): Downscale wider images to this width for the ROI search, None to disable.
+        ocr_mode (str): How the ROI is split into Tesseract calls, one of ``ocr_model.OCR_MODES``.
+        ocr_backend (str): The OCR backend used by the workers, one of ``ocr_model.OCR_BACKENDS``.
+        reduce (int): Decode the images at 1/1, 1/2, 1/4 or 1/8 resolution, see ``ocr_model.read_items``.
+        grayscale (bool): Decode the images straight to grayscale.
+        roi_method (str): How the item table is found, one of ``ocr_model.ROI_METHODS``.
+        cache (PredictionCache): Optional prediction cache used by the classifier.
+        instrumentation (instrumentation.Instrumentation): Optional instrumentation the metrics collected in
+            the workers are recorded with, the time of every group classification split between its receipts.
+        catalog (catalog.Catalog): Optional catalog of known item names, consulted before the model.
+        result_store (result_store.ResultStore): Optional store of processed receipts. Images whose content
+            was processed before with the same model and options are written from it without OCR, and new
+            results are added to it.
+
+    Returns:
+        dict: Counts of ``processed`` and ``failed`` images, and of the processed images that were ``stored``.
+    """
+    workers = workers or os.cpu_count() or 1
+    counts = {"processed": 0, "failed": 0, "stored": 0}
+    options = {
+        "ocr_config": ocr_config,
+        "max_width": max_width,
+        "ocr_mode": ocr_mode,
+        "ocr_backend": ocr_backend,
+        "reduce": reduce,
+        "grayscale": grayscale,
+        "roi_method": roi_method,
+    }
+
+    sink = open_sink(output_path) if isinstance(output_path, str) else output_path
+
+    stored, keys = [], {}
+    if result_store is not None:
+        result_store.bind(ocr_model.result_version(model_path, tokenizer_path, catalog, **options))
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor, sink:
+        if result_store is not None:
+            # The workers read and hash the images, each is submitted for OCR with its bytes once the store
+            # misses it
+            hashes = executor.map(_hash_image, paths, chunksize=16)
+            jobs = _lookup_stored(paths, hashes, result_store, stored, keys)
+        else:
+            jobs = ((path, None) for path in paths)
+
+        # Submit the OCR work before loading the model, so the workers are started from a process
+        # that has not initialised TensorFlow yet
+        results = executor.map(_read_receipt, jobs, itertools.repeat(options), chunksize=4)
+        processor = ocr_model.ReceiptProcessor(
+            model_path, tokenizer_path, ocr_config=ocr_config, cache=cache, catalog=catalog
+        )
+
+        for path, receipt in stored:
+            sink.write(path, receipt)
+        counts["processed"] += len(stored)
+        counts["stored"] += len(stored)
+
+        pending = []
+
+        def flush():
+            start = time.perf_counter()
+            processor.classify_receipts([receipt for _, receipt, _ in pending])
+            elapsed = time.perf_counter() - start
+            for path, receipt, metrics in pending:
+                sink.write(path, receipt)
+                if path in keys:
+                    result_store.put(keys[path][0], receipt, keys[path][1])
+                if instrumentation is not None:
+                    metrics.add_time("classify", elapsed / len(pending))
+                    instrumentation.record(metrics)
+            sink.flush()
+            counts["processed"] += len(pending)
+            pending.clear()
+
+        for path, receipt, error, metrics in results:
+            if error is not None:
+                sink.write(path, error=error)
+                counts["failed"] += 1
+                if instrumentation is not None:
+                    instrumentation.record(metrics)
+                continue
+
+            pending.append((path, receipt, metrics))
+            if len(pending) >= classify_every:
+                flush()
+
+        if pending:
+            flush()
+
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OCR and classify a batch of receipt images.")
+    parser.add_argument("inputs", nargs="+", help="Directories, glob patterns, image files or pack files.")
+    parser.add_argument(
+        "-o", "--output", default="ocr_results.jsonl", help="Output .jsonl or .parquet file, or a directory."
+    )
+    parser.add_argument("--model", default="model/model.h5", help="Path to the Keras model file.")
+    parser.add_argument("--tokenizer", default="model/tokenizer.pickle", help="Path to the tokenizer pickle file.")
+    parser.add_argument(
+        "--variant",
+        choices=ocr_model.MODEL_VARIANTS,
+        default=None,
+        help="Use this classifier variant's model and tokenizer, see ocr_model.MODEL_VARIANTS.",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="OCR worker processes (default: number of cores).")
+    parser.add_argument(
+        "--classify-every", type=int, default=64, help="Number of receipts classified per model batch."
+    )
+    parser.add_argument(
+        "--max-width", type=int, default=None, help="Downscale wider images to this width for the ROI search."
+    )
+    parser.add_argument(
+        "--ocr-mode",
+        choices=ocr_model.OCR_MODES,
+        default="block",
+        help="Read the ROI as one block, per text line or per column.",
+    )
+    parser.add_argument(
+        "--ocr-backend",
+        choices=ocr_model.OCR_BACKENDS,
+        default="auto",
+        help="Tesseract subprocesses, pooled tesserocr engines, or tesserocr when installed.",
+    )
+    parser.add_argument(
+        "--reduce", type=int, choices=(1, 2, 4, 8), default=1, help="Decode images at 1/N of their resolution."
+    )
+    parser.add_argument("--grayscale", action="store_true", help="Decode images straight to grayscale.")
+    parser.add_argument(
+        "--roi-method", choices=ocr_model.ROI_METHODS, default="contours", help="How the item table is found."
+    )
+    parser.add_argument("--retry-errors", action="store_true", help="Re-process images that previously failed.")
+    parser.add_argument("--cache-path", default=None, help="Persist the prediction cache to this JSON file.")
+    parser.add_argument(
+        "--result-store", default=None, help="SQLite file of processed receipts, reused for identical images."
+    )
+    parser.add_argument(
+        "--result-store-mb", type=float, default=256, help="Size limit of the stored results, in MiB."
+    )
+    parser.add_argument(
+        "--metrics-file", default=None, help="Write per-stage timings and counters to this Prometheus text file."
+    )
+    parser.add_argument(
+        "--catalog",
+        nargs="*",
+        metavar="CSV",
+        default=None,
+        help="Answer known item names from these catalog CSVs before the model (default: the item lists).",
+    )
+    args = parser.parse_args(argv)
+    if args.variant:
+        args.model, args.tokenizer = ocr_model.MODEL_VARIANTS[args.variant]
+
+    paths = find_images(args.inputs)
+    sink = open_sink(args.output)
+    done = sink.recorded(args.retry_errors)
+    todo = [path for path in paths if path not in done]
+    print(f"{len(paths)} images found, {len(paths) - len(todo)} already done, {len(todo)} to process.")
+    if not todo:
+        return 0
+
+    cache = PredictionCache(path=args.cache_path) if args.cache_path else None
+    instrumentation = Instrumentation([PrometheusExporter(args.metrics_file)]) if args.metrics_file else None
+    catalog = Catalog.from_csv(*args.catalog) if args.catalog is not None else None
+    result_store = (
+        ResultStore(args.result_store, max_bytes=int(args.result_store_mb * 2**20)) if args.result_store else None
+    )
+
+    start = time.perf_counter()
+    counts = run_batch(
+        todo,
+        sink,
+        args.model,
+        args.tokenizer,
+        workers=args.workers,
+        classify_every=args.classify_every,
+        max_width=args.max_width,
+        ocr_mode=args.ocr_mode,
+        ocr_backend=args.ocr_backend,
+        reduce=args.reduce,
+        grayscale=args.grayscale,
+        roi_method=args.roi_method,
+        cache=cache,
+        instrumentation=instrumentation,
+        catalog=catalog,
+        result_store=result_store,
+    )
+    elapsed = time.perf_counter() - start
+
+    if cache is not None:
+        cache.save()
+    if instrumentation is not None:
+        instrumentation.flush()
+    if catalog is not None:
+        print("Catalog lookups:", catalog.stats())
+    if result_store is not None:
+        stats = result_store.stats()
+        print(
+            f"Result store: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%}), "
+            f"{stats['bytes_saved'] / 2**20:.1f} MiB of images not processed again"
+        )
+        result_store.close()
+
+    print(
+        f"{counts['processed']} processed, {counts['failed']} failed in {elapsed:.1f}s "
+        f"({len(todo) / elapsed:.1f} receipts/s). Results written to {args.output}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+Benchmark the catalog lookup in front of the classifier.
+
+The item names of a CSV file, and copies of them with one OCR-style character substitution, are
+classified by the model alone and by the catalog with the model as fallback. Reports the accuracy against
+the CSV's categories, the time per name and how many names each path answered.
+
+Usage:
+    python -m benchmarks.catalog data_csv/data.csv
+"""
+
+import time
+import random
+import argparse
+
+import pandas as pd
+
+import ocr_model
+from catalog import Catalog
+from labels import canonical_label
+
+
+# Characters OCR commonly confuses
+CONFUSIONS = "il1o0ae"
+
+
+def with_typos(texts, seed=0):
+    """
+    Return the texts with one character of every text replaced by a commonly confused one.
+    """
+    rng = random.Random(seed)
+    variants = []
+    for text in texts:
+        i = rng.randrange(len(text))
+        variants.append(text[:i] + rng.choice(CONFUSIONS) + text[i + 1 :])
+    return variants
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the catalog lookup.")
+    parser.add_argument("csv", nargs="?", default="data_csv/data.csv", help="CSV file with nama and kategori.")
+    parser.add_argument("--model", default="model/model.npz", help="Classifier model file.")
+    parser.add_argument("--tokenizer", default="model/tokenizer.json", help="Tokenizer file.")
+    parser.add_argument("--catalog", nargs="*", default=[], metavar="CSV", help="Catalog CSVs (default: item lists).")
+    args = parser.parse_args(argv)
+
+    frame = pd.read_csv(args.csv)
+    names = frame["nama"].astype(str).tolist()
+    truth = [canonical_label(category) for category in frame["kategori"]]
+
+    start = time.perf_counter()
+    catalog = Catalog.from_csv(*args.catalog)
+    print(f"Catalog of {len(catalog)} names built in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    model_only = ocr_model.ReceiptProcessor(args.model, args.tokenizer)
+    with_catalog = ocr_model.ReceiptProcessor(args.model, args.tokenizer, catalog=catalog)
+
+    for label, texts in (("exact names", names), ("one typo", with_typos(names))):
+        print(f"{label} ({len(texts)} names):")
+        for name, processor in (("model", model_only), ("catalog+model", with_catalog)):
+            start = time.perf_counter()
+            categories, sources = processor.classify_texts(texts)
+            elapsed = time.perf_counter() - start
+            accuracy = sum(c == t for c, t in zip(categories, truth)) / len(truth)
+            paths = ", ".join(f"{source} {sources.count(source)}" for source in ("exact", "fuzzy", "model"))
+            print(f"  {name:>14}: {accuracy:.2%} accurate, {elapsed * 1e6 / len(texts):7.1f} us/name, {paths}")
+
+
+if __name__ == "__main__":
+    main()
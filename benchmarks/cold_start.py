@@ -0,0 +1,152 @@
+"""
+Benchmark the cold start of the OCR pipeline and of the HTTP service.
+
+Every measurement runs in a fresh Python process:
+
+- ``import``: importing ``ocr_model``, and importing Keras, which ``ocr_model`` now defers until a Keras
+  model is loaded;
+- ``processor``: loading the shared processor, then the first and the second prediction, which shows
+  what ``ocr_model.warm_up`` takes off the first request;
+- ``service``: the time until ``ocr_service.py`` answers ``/healthz``, until ``/readyz`` reports the
+  model loaded, and the latency of the first two receipts posted after that, with and without
+  ``--no-warm-up``. The receipts need Tesseract.
+
+Usage:
+    python -m benchmarks.cold_start --image data/receipt_09.jpg
+    python -m benchmarks.cold_start --model model/model.npz --tokenizer model/tokenizer.json
+"""
+
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+import urllib.error
+import urllib.request
+
+
+CHILD = """
+import json, sys, time
+model_path, tokenizer_path = sys.argv[1:3]
+start = time.perf_counter()
+import ocr_model
+imported = time.perf_counter()
+tensorflow_imported = "tensorflow" in sys.modules
+import keras
+keras_imported = time.perf_counter()
+processor = ocr_model.get_processor(model_path, tokenizer_path)
+loaded = time.perf_counter()
+processor.predict_texts(["Air Mineral"])
+first = time.perf_counter()
+processor.predict_texts(["Buku Tulis"])
+second = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - start,
+    "tensorflow_imported": tensorflow_imported,
+    "keras_import_s": keras_imported - imported,
+    "load_s": loaded - keras_imported,
+    "first_predict_s": first - loaded,
+    "second_predict_s": second - first,
+}))
+"""
+
+
+def measure_processor(model_path, tokenizer_path):
+    """
+    Import, load and predict in a fresh interpreter, and return its measurements.
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, model_path, tokenizer_path], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, timeout):
+    """
+    Poll ``url`` until it answers 200, and return when it did, or None after ``timeout`` seconds.
+    """
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter()
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def post(url, data):
+    """
+    Post ``data`` to ``url`` and return the seconds until the response, whatever its status.
+    """
+    start = time.perf_counter()
+    try:
+        urllib.request.urlopen(urllib.request.Request(url, data=data), timeout=60).read()
+    except urllib.error.HTTPError:
+        pass
+    return time.perf_counter() - start
+
+
+def measure_service(model_path, tokenizer_path, image, warm_up=True, timeout=120):
+    """
+    Start ``ocr_service.py`` and return the seconds until it is listening and until it is ready, and the
+    latencies of the first two receipts.
+    """
+    port = free_port()
+    command = [sys.executable, "ocr_service.py", "--port", str(port), "--model", model_path]
+    command += ["--tokenizer", tokenizer_path] + ([] if warm_up else ["--no-warm-up"])
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        listening = wait_for(f"http://127.0.0.1:{port}/healthz", timeout)
+        ready = wait_for(f"http://127.0.0.1:{port}/readyz", timeout)
+        requests = [post(f"http://127.0.0.1:{port}/receipts", image) for _ in range(2)]
+    finally:
+        process.terminate()
+        process.wait()
+    return (listening or float("nan")) - start, (ready or float("nan")) - start, *requests
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the cold start of ocr_model and the service.")
+    parser.add_argument("--model", default="model/model.h5", help="Path to the classifier model file.")
+    parser.add_argument("--tokenizer", default="model/tokenizer.pickle", help="Path to the tokenizer file.")
+    parser.add_argument("--image", default="data/receipt_09.jpg", help="Receipt posted to the service.")
+    parser.add_argument("--repeats", type=int, default=3, help="Fresh processes per measurement, the best is kept.")
+    args = parser.parse_args(argv)
+
+    runs = [measure_processor(args.model, args.tokenizer) for _ in range(args.repeats)]
+    best = {key: min(run[key] for run in runs) for key in runs[0] if key != "tensorflow_imported"}
+    print(
+        f"   import: ocr_model {best['import_s'] * 1000:7.1f} ms (TensorFlow imported: "
+        f"{runs[0]['tensorflow_imported']}), keras {best['keras_import_s']:5.2f} s"
+    )
+    print(
+        f"processor: load {best['load_s']:5.2f} s  first predict {best['first_predict_s'] * 1000:7.1f} ms  "
+        f"second predict {best['second_predict_s'] * 1000:7.1f} ms"
+    )
+
+    with open(args.image, "rb") as f:
+        image = f.read()
+    for warm_up in (True, False):
+        listening, ready, first, second = min(
+            (measure_service(args.model, args.tokenizer, image, warm_up) for _ in range(args.repeats)),
+            key=lambda times: times[1],
+        )
+        print(
+            f"  service: listening after {listening:5.2f} s, ready after {ready:5.2f} s, first receipt "
+            f"{first * 1000:7.1f} ms, second {second * 1000:7.1f} ms ({'with' if warm_up else 'without'} warm-up)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Micro-benchmark of the OCR backends in calls per second.
+
+The item table ROIs of the receipt images are read repeatedly with every available backend, from a
+configurable number of threads. Backends that are not installed are reported and skipped.
+
+Usage:
+    python -m benchmarks.ocr_backends data/
+    python -m benchmarks.ocr_backends data/ --calls 200 --threads 4
+"""
+
+import os
+import glob
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+import ocr_model
+from preprocessing import find_rois, select_roi
+
+
+def measure(backend, rois, calls, threads, config):
+    """
+    Return the calls per second of ``backend`` over ``calls`` OCR calls cycling through ``rois``.
+    """
+    images = [rois[i % len(rois)] for i in range(calls)]
+
+    # Warm up, so engine creation and traineddata loading are not counted
+    backend.image_to_string(images[0], config=config)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda image: backend.image_to_string(image, config=config), images))
+    return calls / (time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the OCR backends.")
+    parser.add_argument("directory", nargs="?", default="data", help="Directory of receipt images.")
+    parser.add_argument("--calls", type=int, default=100, help="OCR calls per backend.")
+    parser.add_argument("--threads", type=int, default=1, help="Concurrent calls.")
+    args = parser.parse_args(argv)
+
+    rois = []
+    for path in sorted(glob.glob(os.path.join(args.directory, "*.jpg"))):
+        try:
+            rois.append(select_roi(find_rois(cv2.imread(path))).image)
+        except ValueError:
+            continue
+    if not rois:
+        parser.error(f"no receipt ROIs found in {args.directory}")
+
+    print(f"{len(rois)} ROIs, {args.calls} calls, {args.threads} thread(s)")
+    for name in ("pytesseract", "tesserocr"):
+        try:
+            backend = ocr_model.get_ocr_backend(name)
+            rate = measure(backend, rois, args.calls, args.threads, ocr_model.OCR_CONFIG)
+        except Exception as e:
+            print(f"{name:>12}: unavailable ({type(e).__name__}: {e})")
+            continue
+        print(f"{name:>12}: {rate:8.1f} calls/s")
+        backend.close()
+
+
+if __name__ == "__main__":
+    main()
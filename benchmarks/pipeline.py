@@ -0,0 +1,449 @@
+"""
+Benchmark the full receipt pipeline on synthetic receipts, and compare runs to catch regressions.
+
+``run`` renders receipts with ``receiptGen.render_receipt`` for every combination of item count and image
+scale, then measures:
+
+- ``model_load``: loading the ``ReceiptProcessor`` and warming it up, in a fresh Python process, and the
+  peak RSS of that process;
+- ``latency``: one receipt at a time through ``read_items`` and ``classify_receipts``, the median and 90th
+  percentile per receipt kind and over all of them, with the time of every stage (decode, preprocess, ocr,
+  parse, classify) and the peak RSS of this process;
+- ``throughput``: a mixed batch of 1 to 50 item receipts through ``batch_ocr.run_batch`` at every number of
+  worker processes, each in a fresh Python process. The time covers the whole run as ``batch_ocr.py`` sees
+  it, including the start of the pool and the model load. The peak RSS of the process holding the model
+  and of the largest worker is reported.
+
+The results are written to a JSON file, every metric with its unit and whether lower or higher is better:
+
+    {"meta": {"created": ..., "commit": ..., "cpu_count": ..., "args": {...}},
+     "metrics": {"latency.p50_ms": {"value": 31.2, "unit": "ms", "better": "lower"}, ...}}
+
+``compare`` prints the relative change of every metric between two result files and exits with status 1 if
+any got worse by more than the threshold, so it can gate a change in CI.
+
+Peak RSS is read with ``resource``, which is only available on Unix, and that of the workers from ``/proc``,
+so it is only reported on Linux. The receipts need Tesseract.
+
+Usage:
+    python -m benchmarks.pipeline run --font arial.ttf -o baseline.json
+    python -m benchmarks.pipeline run --font arial.ttf --items 1 50 --scales 1 --workers 1 4 -o current.json
+    python -m benchmarks.pipeline compare baseline.json current.json --threshold 0.1
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+import statistics
+import subprocess
+
+import pandas as pd
+from PIL import Image
+
+import ocr_model
+from instrumentation import Metrics
+from receiptGen import load_fonts, load_logo, random_receipt, render_receipt
+
+
+# Stages timed by ``read_items`` and ``classify_receipts``, in pipeline order
+STAGES = ("decode", "preprocess", "ocr", "parse", "classify")
+
+# JPEG quality of the rendered receipts
+JPEG_QUALITY = 90
+
+MODEL_LOAD_CHILD = """
+import json, resource, sys, time
+model_path, tokenizer_path = sys.argv[1:3]
+start = time.perf_counter()
+import ocr_model
+imported = time.perf_counter()
+processor = ocr_model.ReceiptProcessor(model_path, tokenizer_path)
+loaded = time.perf_counter()
+processor.warm_up()
+warm = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - start,
+    "load_s": loaded - imported,
+    "warm_up_s": warm - loaded,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+BATCH_CHILD = """
+import json, multiprocessing, resource, sys, threading, time
+import batch_ocr
+
+def worker_peak_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:")) / 1024
+    except (OSError, StopIteration):
+        return 0.0
+
+# Sample the peak RSS of the pool workers while they live, as RUSAGE_CHILDREN also counts every helper
+# process forked from this one after the model is loaded
+peaks = {}
+done = threading.Event()
+def sample():
+    while not done.wait(0.05):
+        for child in multiprocessing.active_children():
+            peaks[child.pid] = max(peaks.get(child.pid, 0.0), worker_peak_mb(child.pid))
+threading.Thread(target=sample, daemon=True).start()
+
+options = json.loads(sys.argv[1])
+start = time.perf_counter()
+counts = batch_ocr.run_batch(**options)
+seconds = time.perf_counter() - start
+done.set()
+print(json.dumps({
+    "seconds": seconds,
+    "counts": counts,
+    "parent_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "worker_rss_mb": max(peaks.values(), default=0.0),
+}))
+"""
+
+
+def metric(value, unit, better="lower"):
+    return {"value": value, "unit": unit, "better": better}
+
+
+def percentile(values, fraction):
+    """
+    Return the value below which ``fraction`` of ``values`` lie, interpolating between the nearest two.
+    """
+    values = sorted(values)
+    position = (len(values) - 1) * fraction
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def save_receipt(image, path, scale=1.0):
+    """
+    Save a rendered receipt as JPEG, resized by ``scale`` to mimic larger or smaller scans.
+    """
+    if scale != 1.0:
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+    image.save(path, quality=JPEG_QUALITY)
+
+
+def render_receipts(list_items, fonts, logo, item_counts, scales, batch_size, directory, seed=0):
+    """
+    Render the receipts of a benchmark run into ``directory``.
+
+    Args:
+        list_items (list): Dictionaries with the ``nama`` and ``harga`` of the items to draw from.
+        fonts (tuple): The fonts, see ``receiptGen.load_fonts``.
+        logo: The logo, see ``receiptGen.load_logo``.
+        item_counts (list): Item counts of the latency receipts.
+        scales (list): Image scales of the latency receipts, 1 is the 800 px wide receipt of ``receiptGen``.
+        batch_size (int): Number of throughput receipts, with 1 to 50 items, cycling through ``scales``.
+        directory (str): Directory the images are written to.
+        seed (int): Seed of the random items and quantities.
+
+    Returns:
+        tuple: ``{(item count, scale): path}`` of the latency receipts, and the paths of the batch receipts.
+    """
+    rng = random.Random(seed)
+    single = {}
+    for count in item_counts:
+        chosen_items = rng.sample(list_items, count)
+        quantities = [rng.randint(1, 3) for _ in chosen_items]
+        image, _ = render_receipt(chosen_items, quantities, fonts, logo)
+        for scale in scales:
+            path = os.path.join(directory, f"single_{count:02d}_x{scale:g}.jpg")
+            save_receipt(image, path, scale)
+            single[count, scale] = path
+
+    batch = []
+    for i in range(batch_size):
+        image, _ = render_receipt(*random_receipt(list_items, rng), fonts, logo)
+        path = os.path.join(directory, f"batch_{i:04d}.jpg")
+        save_receipt(image, path, scales[i % len(scales)])
+        batch.append(path)
+    return single, batch
+
+
+def run_child(script, *args):
+    """
+    Run ``script`` in a fresh interpreter and return the JSON it printed last.
+    """
+    output = subprocess.run([sys.executable, "-c", script, *args], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_model_load(model_path, tokenizer_path, repeats):
+    """
+    Return the model load metrics, the fastest of ``repeats`` fresh processes.
+    """
+    runs = [run_child(MODEL_LOAD_CHILD, model_path, tokenizer_path) for _ in range(repeats)]
+    best = min(runs, key=lambda run: run["import_s"] + run["load_s"])
+    return {
+        "model_load.import_s": metric(best["import_s"], "s"),
+        "model_load.load_s": metric(best["load_s"], "s"),
+        "model_load.warm_up_s": metric(best["warm_up_s"], "s"),
+        "model_load.peak_rss_mb": metric(max(run["peak_rss_mb"] for run in runs), "MiB"),
+    }
+
+
+def measure_latency(processor, paths, repeats):
+    """
+    Process every receipt ``repeats`` times, one at a time, and return the latency and stage metrics.
+
+    Args:
+        processor (ocr_model.ReceiptProcessor): The warmed-up processor.
+        paths (dict): ``{(item count, scale): path}``, see ``render_receipts``.
+        repeats (int): Timed runs per receipt.
+    """
+    results = {}
+    latencies = []
+    failed = 0
+    stages = {stage: [] for stage in STAGES}
+    for (count, scale), path in paths.items():
+        runs = []
+        receipt = {"items": []}
+        for _ in range(repeats):
+            metrics = Metrics()
+            start = time.perf_counter()
+            try:
+                receipt = processor.read_items(path, metrics)
+            except ValueError:
+                # No ROI found, the failure is counted instead of timed
+                failed += 1
+                continue
+            with metrics.timer("classify"):
+                processor.classify_receipts([receipt])
+            runs.append((time.perf_counter() - start) * 1000)
+            for stage in STAGES:
+                stages[stage].append(metrics.timings.get(stage, 0.0) * 1000)
+
+        name = f"latency.items_{count}.scale_{scale:g}"
+        if runs:
+            results[f"{name}.p50_ms"] = metric(statistics.median(runs), "ms")
+        results[f"{name}.items_read"] = metric(len(receipt["items"]), "items", "higher")
+        latencies += runs
+
+    if not latencies:
+        raise ValueError("No latency receipt could be read.")
+    results["latency.failed"] = metric(failed, "runs")
+    results["latency.p50_ms"] = metric(percentile(latencies, 0.5), "ms")
+    results["latency.p90_ms"] = metric(percentile(latencies, 0.9), "ms")
+    for stage, times in stages.items():
+        results[f"stage.{stage}.p50_ms"] = metric(statistics.median(times), "ms")
+        results[f"stage.{stage}.mean_ms"] = metric(statistics.mean(times), "ms")
+    results["latency.peak_rss_mb"] = metric(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "MiB")
+    return results
+
+
+def measure_throughput(paths, model_path, tokenizer_path, workers, directory, roi_method="contours"):
+    """
+    Run ``batch_ocr.run_batch`` over ``paths`` with every number of ``workers``, each in a fresh process.
+    """
+    results = {}
+    for count in workers:
+        output_path = os.path.join(directory, f"results_{count}.jsonl")
+        options = {
+            "paths": paths,
+            "output_path": output_path,
+            "model_path": model_path,
+            "tokenizer_path": tokenizer_path,
+            "workers": count,
+            "roi_method": roi_method,
+        }
+        run = run_child(BATCH_CHILD, json.dumps(options))
+        os.remove(output_path)
+
+        name = f"throughput.workers_{count}"
+        results[f"{name}.receipts_per_s"] = metric(len(paths) / run["seconds"], "receipts/s", "higher")
+        results[f"{name}.failed"] = metric(run["counts"]["failed"], "receipts")
+        results[f"{name}.parent_rss_mb"] = metric(run["parent_rss_mb"], "MiB")
+        results[f"{name}.worker_rss_mb"] = metric(run["worker_rss_mb"], "MiB")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    list_items = pd.read_csv(args.csv).to_dict("records")
+    fonts = load_fonts(args.font)
+    logo = load_logo(args.logo)
+    workers = args.workers or list(range(1, (os.cpu_count() or 1) + 1))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        single, batch = render_receipts(
+            list_items, fonts, logo, args.items, args.scales, args.batch_size, directory, args.seed
+        )
+        print(f"{len(single)} latency receipts and {len(batch)} batch receipts rendered")
+
+        results.update(measure_model_load(args.model, args.tokenizer, args.load_repeats))
+        print(
+            f"model load: import {results['model_load.import_s']['value']:5.2f} s  "
+            f"load {results['model_load.load_s']['value']:5.2f} s  "
+            f"warm-up {results['model_load.warm_up_s']['value']:5.2f} s  "
+            f"peak RSS {results['model_load.peak_rss_mb']['value']:6.0f} MiB"
+        )
+
+        # The batches run before the model is loaded here, so their fresh processes do not compete with it
+        results.update(
+            measure_throughput(batch, args.model, args.tokenizer, workers, directory, args.roi_method)
+        )
+        for count in workers:
+            name = f"throughput.workers_{count}"
+            print(
+                f"throughput: {count:2d} workers {results[name + '.receipts_per_s']['value']:7.2f} receipts/s  "
+                f"peak RSS {results[name + '.parent_rss_mb']['value']:6.0f} MiB parent, "
+                f"{results[name + '.worker_rss_mb']['value']:6.0f} MiB worker"
+            )
+
+        processor = ocr_model.ReceiptProcessor(args.model, args.tokenizer, roi_method=args.roi_method)
+        processor.warm_up()
+        results.update(measure_latency(processor, single, args.repeats))
+
+    for count, scale in single:
+        name = f"latency.items_{count}.scale_{scale:g}"
+        p50 = results.get(name + ".p50_ms", {"value": float("nan")})["value"]
+        items_read = results[name + ".items_read"]["value"]
+        print(f"   latency: {count:2d} items x{scale:g} {p50:8.1f} ms ({items_read} items read)")
+    print(
+        f"   latency: p50 {results['latency.p50_ms']['value']:.1f} ms  "
+        f"p90 {results['latency.p90_ms']['value']:.1f} ms  {results['latency.failed']['value']} runs failed  "
+        f"peak RSS {results['latency.peak_rss_mb']['value']:.0f} MiB"
+    )
+    stages = (f"{stage} {results[f'stage.{stage}.mean_ms']['value']:.1f} ms" for stage in STAGES)
+    print("    stages: mean " + "  ".join(stages))
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "metrics": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print("Results have been written to", args.output)
+    return 0
+
+
+def compare_metrics(baseline, current, threshold):
+    """
+    Compare the metrics of two runs.
+
+    Args:
+        baseline (dict): The ``metrics`` of the reference run.
+        current (dict): The ``metrics`` of the run to check.
+        threshold (float): Relative change in the worse direction above which a metric regressed.
+
+    Returns:
+        list: ``(name, baseline value, current value, relative change, regressed)`` of every metric in both
+            runs. The change is None when the baseline value is 0.
+    """
+    rows = []
+    for name in sorted(baseline.keys() & current.keys()):
+        before, after = baseline[name]["value"], current[name]["value"]
+        sign = 1 if current[name]["better"] == "lower" else -1
+        if before:
+            change = (after - before) / abs(before)
+            regressed = sign * change > threshold
+        else:
+            # Any step the worse way from 0 counts, e.g. receipts that started failing
+            change = None
+            regressed = sign * after > 0
+        rows.append((name, before, after, change, regressed))
+    return rows
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    for label, report in (("baseline", baseline), ("current", current)):
+        meta = report["meta"]
+        print(f"{label:>8}: {meta['created']} commit {meta['commit']} on {meta['cpu_count']} cores")
+
+    rows = compare_metrics(baseline["metrics"], current["metrics"], args.threshold)
+    width = max(len(name) for name, *_ in rows)
+    for name, before, after, change, regressed in rows:
+        unit = current["metrics"][name]["unit"]
+        relative = f"{change:+8.1%}" if change is not None else "     n/a"
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<{width}} {before:10.2f} -> {after:10.2f} {unit:<10} {relative}{flag}")
+    for name in sorted(baseline["metrics"].keys() ^ current["metrics"].keys()):
+        print(f"{name:<{width}} only in the {'baseline' if name in baseline['metrics'] else 'current run'}")
+
+    regressions = [name for name, *_, regressed in rows if regressed]
+    print(f"{len(regressions)} of {len(rows)} metrics regressed by more than {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the receipt pipeline and compare runs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Benchmark the pipeline on synthetic receipts.")
+    run_parser.add_argument("-o", "--output", default="benchmark_results.json", help="JSON file the results go to.")
+    run_parser.add_argument("--csv", default="data_csv/data.csv", help="CSV file with nama and harga columns.")
+    run_parser.add_argument("--font", default="arial.ttf", help="Path to the font file.")
+    run_parser.add_argument("--logo", default="indomaret_logo.png", help="Path to the logo image file.")
+    run_parser.add_argument("--model", default="model/model.h5", help="Path to the classifier model file.")
+    run_parser.add_argument("--tokenizer", default="model/tokenizer.pickle", help="Path to the tokenizer file.")
+    run_parser.add_argument(
+        "--variant",
+        choices=ocr_model.MODEL_VARIANTS,
+        default=None,
+        help="Use this classifier variant's model and tokenizer, see ocr_model.MODEL_VARIANTS.",
+    )
+    run_parser.add_argument(
+        "--roi-method", choices=ocr_model.ROI_METHODS, default="contours", help="How the item table is found."
+    )
+    run_parser.add_argument(
+        "--items", type=int, nargs="+", default=[1, 10, 25, 50], help="Item counts of the latency receipts."
+    )
+    run_parser.add_argument(
+        "--scales", type=float, nargs="+", default=[1.0, 2.0], help="Image scales, 1 is 800 px wide."
+    )
+    run_parser.add_argument("--repeats", type=int, default=5, help="Timed runs per latency receipt.")
+    run_parser.add_argument("--batch-size", type=int, default=48, help="Receipts per throughput run.")
+    run_parser.add_argument(
+        "--workers", type=int, nargs="+", default=None, help="Worker counts of the throughput runs (default: 1..cores)."
+    )
+    run_parser.add_argument("--load-repeats", type=int, default=3, help="Fresh processes timing the model load.")
+    run_parser.add_argument("--seed", type=int, default=0, help="Seed of the random items and quantities.")
+
+    compare_parser = commands.add_parser("compare", help="Flag metrics that got worse between two runs.")
+    compare_parser.add_argument("baseline", help="Results of the reference run.")
+    compare_parser.add_argument("current", help="Results of the run to check.")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=0.1, help="Relative change in the worse direction that is a regression."
+    )
+
+    args = parser.parse_args(argv)
+    if args.command == "compare":
+        return compare(args)
+    if args.variant:
+        args.model, args.tokenizer = ocr_model.MODEL_VARIANTS[args.variant]
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
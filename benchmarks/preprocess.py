@@ -0,0 +1,135 @@
+"""
+Benchmark the ROI preprocessing stage against the original inline implementation.
+
+For every image, both implementations are timed over several repeats and their peak traced memory is
+measured with tracemalloc. The ROI picked by both is compared, so a speed-up that changes the result
+shows up as a mismatch.
+
+Usage:
+    python -m benchmarks.preprocess data/
+    python -m benchmarks.preprocess data/ --upscale 4 --max-width 1000
+"""
+
+import glob
+import os
+import time
+import argparse
+import statistics
+import tracemalloc
+
+import cv2
+
+from preprocessing import find_rois, select_roi
+
+
+def legacy_roi(img):
+    """
+    The preprocessing as originally written in ``process_receipt``, returning the ROI coordinates.
+    """
+    base_image = img.copy()
+    blur = cv2.GaussianBlur(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), (7, 7), 0)
+    thresh = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+    kernal = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 22))
+    dilate = cv2.dilate(thresh, kernal, iterations=1)
+
+    cnts = cv2.findContours(dilate, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    cnts = cnts[0] if len(cnts) == 2 else cnts[1]
+    cnts = sorted(cnts, key=lambda x: cv2.boundingRect(x)[0])
+
+    box = None
+    for c in cnts:
+        x, y, w, h = cv2.boundingRect(c)
+        if y > 15 and w > 500:
+            roi = base_image[y : y + h, x : x + w]
+            cv2.rectangle(img, (x, y), (x + w, y + h), (36, 255, 12), 2)
+            box = (x, y, w, h)
+
+    return box
+
+
+def current_roi(img, max_width=None):
+    """
+    The reworked preprocessing stage, returning the ROI coordinates.
+    """
+    try:
+        roi = select_roi(find_rois(img, max_width=max_width))
+    except ValueError:
+        return None
+    return roi.x, roi.y, roi.w, roi.h
+
+
+def overlap(a, b):
+    """
+    Intersection over union of two ``(x, y, w, h)`` boxes, 1.0 if both are missing.
+    """
+    if a is None or b is None:
+        return 1.0 if a == b else 0.0
+    w = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    h = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    inter = max(0, w) * max(0, h)
+    return inter / (a[2] * a[3] + b[2] * b[3] - inter)
+
+
+def measure(func, images, repeats):
+    """
+    Return the per-image latencies in milliseconds, the peak traced memory in bytes and the results.
+    """
+    latencies = []
+    results = []
+    for img in images:
+        # legacy_roi draws on its input, so every call gets a fresh copy outside the timed region
+        samples = []
+        for _ in range(repeats):
+            work = img.copy()
+            start = time.perf_counter()
+            result = func(work)
+            samples.append((time.perf_counter() - start) * 1000)
+        latencies.append(min(samples))
+        results.append(result)
+
+    peak = 0
+    for img in images:
+        work = img.copy()
+        tracemalloc.start()
+        func(work)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return latencies, peak, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ROI preprocessing.")
+    parser.add_argument("directory", nargs="?", default="data", help="Directory of receipt images.")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per image, the fastest is kept.")
+    parser.add_argument("--upscale", type=float, default=1.0, help="Upscale images first to mimic phone photos.")
+    parser.add_argument("--max-width", type=int, default=None, help="Downscale width for the reworked stage.")
+    args = parser.parse_args(argv)
+
+    images = []
+    for path in sorted(glob.glob(os.path.join(args.directory, "*.jpg"))):
+        img = cv2.imread(path)
+        if args.upscale != 1.0:
+            img = cv2.resize(img, None, fx=args.upscale, fy=args.upscale, interpolation=cv2.INTER_CUBIC)
+        images.append(img)
+    if not images:
+        parser.error(f"no .jpg images found in {args.directory}")
+
+    def current(img):
+        return current_roi(img, args.max_width)
+
+    legacy_ms, legacy_peak, legacy_boxes = measure(legacy_roi, images, args.repeats)
+    current_ms, current_peak, current_boxes = measure(current, images, args.repeats)
+
+    matches = sum(overlap(a, b) >= 0.9 for a, b in zip(legacy_boxes, current_boxes))
+    print(f"{len(images)} images, {images[0].shape[1]}x{images[0].shape[0]} first image")
+    for name, latencies, peak in (("legacy", legacy_ms, legacy_peak), ("current", current_ms, current_peak)):
+        print(
+            f"{name:>8}: median {statistics.median(latencies):7.2f} ms  "
+            f"mean {statistics.mean(latencies):7.2f} ms  peak memory {peak / 1024:9.1f} KiB"
+        )
+    print(f"Same ROI (IoU >= 0.9) on {matches}/{len(images)} images")
+
+
+if __name__ == "__main__":
+    main()
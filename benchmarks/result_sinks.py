@@ -0,0 +1,124 @@
+"""
+Benchmark the result sinks: write throughput, size on disk and the time to total the items by category.
+
+The receipts are taken from a JSON Lines file written by ``batch_ocr.py``, e.g. for the generated ``data/``
+set, and repeated under distinct paths to simulate a larger volume. Every sink is flushed after each group
+of ``--flush-every`` receipts, like ``batch_ocr.run_batch`` does after classifying a group.
+
+Usage:
+    python batch_ocr.py data/ -o ocr_results.jsonl
+    python -m benchmarks.result_sinks ocr_results.jsonl --repeat 1000
+"""
+
+import os
+import json
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+from collections import Counter
+
+from result_sinks import JsonFileSink, JsonLinesSink, ParquetSink, pq
+
+
+def disk_size(path):
+    """
+    Return the bytes allocated on disk for a file, or for all files in a directory.
+    """
+    paths = [path] if os.path.isfile(path) else glob.glob(os.path.join(path, "*"))
+    return sum(os.stat(file_path).st_blocks * 512 for file_path in paths)
+
+
+def totals_from_json_files(directory):
+    totals = Counter()
+    for file_path in glob.glob(os.path.join(directory, "*.json")):
+        with open(file_path) as f:
+            for item in json.load(f).get("items", ()):
+                totals[item["category"]] += item["total"]
+    return totals
+
+
+def totals_from_jsonl(path):
+    totals = Counter()
+    with open(path) as f:
+        for line in f:
+            for item in json.loads(line).get("items", ()):
+                totals[item["category"]] += item["total"]
+    return totals
+
+
+def totals_from_parquet(path):
+    # Every row group has its own dictionaries
+    table = pq.read_table(path, columns=["category", "total"]).unify_dictionaries()
+    table = table.group_by("category").aggregate([("total", "sum")])
+    # Receipts without items have a single row with a null category
+    return Counter(
+        {
+            category: total
+            for category, total in zip(table["category"].to_pylist(), table["total_sum"].to_pylist())
+            if category is not None
+        }
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark writing OCR results with each result sink.")
+    parser.add_argument("results", nargs="?", default="ocr_results.jsonl", help="JSON Lines results to write.")
+    parser.add_argument("--repeat", type=int, default=100, help="Times every receipt is written.")
+    parser.add_argument(
+        "--flush-every", type=int, default=64, help="Receipts between flushes, batch_ocr's --classify-every."
+    )
+    args = parser.parse_args(argv)
+
+    with open(args.results) as f:
+        records = [json.loads(line) for line in f]
+    receipts = [(record.pop("path"), record) for record in records]
+    count = len(receipts) * args.repeat
+    print(f"{len(receipts)} receipts x {args.repeat} = {count} receipts")
+
+    directory = tempfile.mkdtemp()
+    sinks = {
+        "json files": (JsonFileSink, os.path.join(directory, "json"), totals_from_json_files),
+        "json lines": (JsonLinesSink, os.path.join(directory, "results.jsonl"), totals_from_jsonl),
+    }
+    if pq is not None:
+        sinks["parquet"] = (ParquetSink, os.path.join(directory, "results.parquet"), totals_from_parquet)
+    else:
+        print("pyarrow is not installed, skipping the Parquet sink.")
+
+    expected = None
+    try:
+        for name, (sink_class, path, aggregate) in sinks.items():
+            start = time.perf_counter()
+            with sink_class(path) as sink:
+                written = 0
+                for copy in range(args.repeat):
+                    for key, record in receipts:
+                        key = f"{copy:06d}-{os.path.basename(key)}"
+                        if "error" in record:
+                            sink.write(key, error=record["error"])
+                        else:
+                            sink.write(key, record)
+                        written += 1
+                        if written % args.flush_every == 0:
+                            sink.flush()
+            written = time.perf_counter() - start
+
+            start = time.perf_counter()
+            totals = aggregate(path)
+            aggregated = time.perf_counter() - start
+            if expected is None:
+                expected = totals
+            row_groups = f", {pq.ParquetFile(path).num_row_groups} row groups" if sink_class is ParquetSink else ""
+            print(
+                f"{name:>10}: {count / written:9.0f} receipts/s, {disk_size(path) / 2**20:8.2f} MiB on disk, "
+                f"totals by category in {aggregated * 1000:8.1f} ms, "
+                f"{'identical' if totals == expected else 'DIFFERENT'}{row_groups}"
+            )
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark the ROI detectors, contours against projection profiles, for speed and correctness.
+
+The receipts come with the ground truth written by ``receiptGen.py``, whose boxes give the expected ROI:
+every item line and the ``Total:`` row. A detected ROI is correct if it contains all of them; its IoU with
+their bounding box shows how tight it is.
+
+Usage:
+    python receiptGen.py --num 200 --shard-dir receipt_dataset/ --font arial.ttf
+    python -m benchmarks.roi_detectors receipt_dataset/
+    python -m benchmarks.roi_detectors receipt_dataset/ --upscale 4 --max-width 1000
+"""
+
+import time
+import argparse
+import statistics
+
+import cv2
+
+from image_io import load_image
+from evaluate_ocr import load_samples
+from preprocessing import ROI_METHODS, find_rois, select_roi
+from benchmarks.preprocess import overlap
+
+
+def expected_roi(ground_truth, img, scale=1.0):
+    """
+    Return the ``(x, y, w, h)`` box of the item lines and the ``Total:`` row of a generated receipt, clipped
+    to the (scaled) image, as long lines can run past its edge.
+    """
+    boxes = [item["boxes"]["line"] for item in ground_truth["items"]] + [ground_truth["boxes"]["totals"]]
+    x0, y0 = min(box[0] for box in boxes), min(box[1] for box in boxes)
+    x1, y1 = max(box[2] for box in boxes), max(box[3] for box in boxes)
+    x0, y0, x1, y1 = (round(v * scale) for v in (x0, y0, x1, y1))
+    x1, y1 = min(x1, img.shape[1]), min(y1, img.shape[0])
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def contains(outer, inner):
+    return (
+        outer is not None
+        and outer[0] <= inner[0]
+        and outer[1] <= inner[1]
+        and outer[0] + outer[2] >= inner[0] + inner[2]
+        and outer[1] + outer[3] >= inner[1] + inner[3]
+    )
+
+
+def detect(img, method, max_width):
+    try:
+        roi = select_roi(find_rois(img, max_width=max_width, method=method))
+    except ValueError:
+        return None
+    return roi.x, roi.y, roi.w, roi.h
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ROI detectors on generated receipts.")
+    parser.add_argument("inputs", nargs="*", default=["receipt_dataset"], help="Directories, globs or .tar shards.")
+    parser.add_argument("--limit", type=int, default=None, help="Only use the first N receipts.")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per image, the fastest is kept.")
+    parser.add_argument("--upscale", type=float, default=1.0, help="Upscale images first to mimic phone photos.")
+    parser.add_argument("--max-width", type=int, default=None, help="Downscale width passed to both detectors.")
+    args = parser.parse_args(argv)
+
+    samples = load_samples(args.inputs)[: args.limit]
+    if not samples:
+        parser.error("no receipts with ground truth found")
+
+    images = []
+    expected = []
+    for _, source, ground_truth in samples:
+        img = load_image(source)
+        if args.upscale != 1.0:
+            img = cv2.resize(img, None, fx=args.upscale, fy=args.upscale, interpolation=cv2.INTER_CUBIC)
+        images.append(img)
+        expected.append(expected_roi(ground_truth, img, args.upscale))
+    print(f"{len(images)} receipts, {images[0].shape[1]}x{images[0].shape[0]} first image")
+
+    for method in ROI_METHODS:
+        latencies = []
+        boxes = []
+        for img in images:
+            runs = []
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                box = detect(img, method, args.max_width)
+                runs.append((time.perf_counter() - start) * 1000)
+            latencies.append(min(runs))
+            boxes.append(box)
+
+        found = sum(box is not None for box in boxes)
+        correct = sum(contains(box, truth) for box, truth in zip(boxes, expected))
+        iou = statistics.mean(overlap(box, truth) for box, truth in zip(boxes, expected))
+        print(
+            f"{method:>10}: median {statistics.median(latencies):7.2f} ms  mean {statistics.mean(latencies):7.2f} ms  "
+            f"found {found}/{len(images)}  contains the table {correct}/{len(images)}  mean IoU {iou:.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Compare startup time and memory of the classifier runtimes.
+
+Each runtime is started in a fresh Python process that imports it, loads the model and tokenizer, and
+classifies one item name. The wall time of those steps and the peak RSS of the process are reported.
+
+Usage:
+    python -m benchmarks.runtime_startup
+"""
+
+import sys
+import json
+import argparse
+import subprocess
+
+
+RUNTIMES = {
+    "keras": ("model/model.h5", "model/tokenizer.pickle"),
+    "numpy": ("model/model.npz", "model/tokenizer.json"),
+    "tflite": ("model/model.tflite", "model/tokenizer.json"),
+}
+
+CHILD = """
+import json, resource, sys, time
+start = time.perf_counter()
+model_path, tokenizer_path = sys.argv[1:3]
+if model_path.endswith(".h5"):
+    import pickle
+    from keras.models import load_model
+    from keras.preprocessing.sequence import pad_sequences
+    model = load_model(model_path)
+    with open(tokenizer_path, "rb") as handle:
+        tokenizer = pickle.load(handle)
+else:
+    import nlp_runtime
+    from nlp_runtime import pad_sequences
+    model = nlp_runtime.load_classifier(model_path)
+    tokenizer = nlp_runtime.Vocabulary.load(tokenizer_path)
+loaded = time.perf_counter()
+model.predict(pad_sequences(tokenizer.texts_to_sequences(["Air Mineral"]), maxlen=100), verbose=0)
+done = time.perf_counter()
+print(json.dumps({
+    "load_s": loaded - start,
+    "first_predict_s": done - loaded,
+    "tensorflow_imported": "tensorflow" in sys.modules,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+
+def measure(model_path, tokenizer_path):
+    """
+    Start a fresh interpreter that loads the runtime and classifies one name, and return its measurements.
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, model_path, tokenizer_path],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark classifier runtime startup.")
+    parser.add_argument("--runtimes", nargs="+", default=list(RUNTIMES), choices=list(RUNTIMES))
+    args = parser.parse_args(argv)
+
+    for name in args.runtimes:
+        try:
+            result = measure(*RUNTIMES[name])
+        except subprocess.CalledProcessError as e:
+            print(f"{name:>7}: failed ({e.stderr.strip().splitlines()[-1]})")
+            continue
+        print(
+            f"{name:>7}: import + load {result['load_s']:6.2f} s  "
+            f"first predict {result['first_predict_s'] * 1000:7.1f} ms  "
+            f"peak RSS {result['peak_rss_mb']:7.1f} MB  "
+            f"TensorFlow imported: {result['tensorflow_imported']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark per-item classification latency with and without length-aware inference.
+
+The item names of a CSV file are classified with the NumPy runtime, once running every padded timestep
+and once skipping the padding (``NumpyClassifier(dynamic_length=True)``). Both one item per call and the
+whole list in one batch are measured, and the largest difference between the two outputs is reported.
+
+Usage:
+    python -m benchmarks.sequence_length data_csv/data.csv
+"""
+
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import nlp_runtime
+
+
+def per_item_ms(classifier, data, repeats):
+    """
+    Return the mean latency in milliseconds of classifying one padded row per call.
+    """
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for row in data:
+            classifier.predict(row[None])
+    return (time.perf_counter() - start) * 1000 / (repeats * len(data))
+
+
+def batched_ms(classifier, data, repeats):
+    """
+    Return the mean latency in milliseconds per item of classifying all rows in one call.
+    """
+    start = time.perf_counter()
+    for _ in range(repeats):
+        classifier.predict(data)
+    return (time.perf_counter() - start) * 1000 / (repeats * len(data))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark length-aware classification.")
+    parser.add_argument("csv", nargs="?", default="data_csv/data.csv", help="CSV file with a nama column.")
+    parser.add_argument("--model", default="model/model.npz", help="Exported NumPy model.")
+    parser.add_argument("--tokenizer", default="model/tokenizer.json", help="Exported tokenizer.")
+    parser.add_argument("--items", type=int, default=200, help="Names classified one per call.")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs, averaged.")
+    args = parser.parse_args(argv)
+
+    vocabulary = nlp_runtime.Vocabulary.load(args.tokenizer)
+    texts = pd.read_csv(args.csv)["nama"].astype(str).tolist()
+    data = nlp_runtime.pad_sequences(vocabulary.texts_to_sequences(texts), vocabulary.maxlen)
+    lengths = np.count_nonzero(data, axis=1)
+    print(f"{len(texts)} names, maxlen {vocabulary.maxlen}, mean {lengths.mean():.2f} tokens, longest {lengths.max()}")
+
+    static = nlp_runtime.NumpyClassifier(args.model, dynamic_length=False)
+    dynamic = nlp_runtime.NumpyClassifier(args.model, dynamic_length=True)
+
+    # Warm up, which also precomputes the padding states of the dynamic classifier
+    dynamic.predict(data)
+
+    for name, classifier in (("full maxlen", static), ("dynamic", dynamic)):
+        print(
+            f"{name:>12}: {per_item_ms(classifier, data[: args.items], args.repeats):7.3f} ms/item one per call  "
+            f"{batched_ms(classifier, data, args.repeats):7.4f} ms/item batched"
+        )
+
+    difference = np.abs(static.predict(data) - dynamic.predict(data)).max()
+    print(f"Max probability difference between the two: {difference:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark loading the tokenizer and turning item names into model input.
+
+Compares the pickled Keras ``Tokenizer`` with the exported ``nlp_runtime.Vocabulary``, both its per-text
+``texts_to_sequences`` and its vectorized ``encode``. With Keras installed, the outputs are also checked to
+be identical to ``Tokenizer.texts_to_sequences`` + ``pad_sequences`` on the names of a CSV file and on noisy
+variants of them (mixed case, punctuation, repeated spaces, very long tokens).
+
+Usage:
+    python -m benchmarks.tokenizer data_csv/data.csv
+"""
+
+import time
+import pickle
+import random
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import nlp_runtime
+
+
+def noisy(texts, seed=0):
+    """
+    Return variants of the texts with the kind of noise OCR produces.
+    """
+    rng = random.Random(seed)
+    variants = []
+    for text in texts:
+        chars = list(text.upper() if rng.random() < 0.3 else text)
+        for _ in range(rng.randint(0, 3)):
+            chars.insert(rng.randint(0, len(chars)), rng.choice(",.:;!?-/()  \t\n"))
+        variants.append("".join(chars))
+    variants += ["", "   ", "x" * 500, "Total: 63,000", "Éclair Café"]
+    return variants
+
+
+def per_item_us(function, texts, repeats):
+    """
+    Return the mean time in microseconds per text of converting all texts in one call.
+    """
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function(texts)
+    return (time.perf_counter() - start) * 1e6 / (repeats * len(texts))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark tokenizer loading and encoding.")
+    parser.add_argument("csv", nargs="?", default="data_csv/data.csv", help="CSV file with a nama column.")
+    parser.add_argument("--tokenizer", default="model/tokenizer.json", help="Exported tokenizer.")
+    parser.add_argument("--keras-tokenizer", default="model/tokenizer.pickle", help="Pickled Keras tokenizer.")
+    parser.add_argument("--repeats", type=int, default=20, help="Timed runs, averaged.")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    vocabulary = nlp_runtime.Vocabulary.load(args.tokenizer)
+    print(f"Vocabulary.load: {(time.perf_counter() - start) * 1000:.2f} ms ({len(vocabulary.word_index)} words)")
+
+    texts = pd.read_csv(args.csv)["nama"].astype(str).tolist()
+    texts += noisy(texts)
+    maxlen = vocabulary.maxlen
+
+    functions = {
+        "texts_to_sequences": lambda batch: nlp_runtime.pad_sequences(vocabulary.texts_to_sequences(batch), maxlen),
+        "encode": lambda batch: vocabulary.encode(batch, maxlen),
+    }
+
+    try:
+        start = time.perf_counter()
+        import keras  # noqa: F401
+        from keras.preprocessing.sequence import pad_sequences
+
+        imported = time.perf_counter()
+        with open(args.keras_tokenizer, "rb") as handle:
+            tokenizer = pickle.load(handle)
+        loaded = time.perf_counter()
+        print(
+            f"Keras tokenizer: {(imported - start) * 1000:.0f} ms to import Keras, "
+            f"{(loaded - imported) * 1000:.2f} ms to unpickle"
+        )
+        functions = {
+            "keras": lambda batch: pad_sequences(tokenizer.texts_to_sequences(batch), maxlen=maxlen),
+            **functions,
+        }
+    except ImportError:
+        print("Keras is not installed, skipping the Keras comparison.")
+
+    expected = None
+    for name, function in functions.items():
+        data = function(texts)
+        if expected is None:
+            expected = data
+        identical = data.dtype == np.int32 and np.array_equal(data, expected)
+        print(
+            f"{name:>18}: {per_item_us(function, texts, args.repeats):7.2f} us/name batched, "
+            f"{per_item_us(lambda batch: [function([text]) for text in batch], texts[:500], 1):7.2f} us/name "
+            f"one per call, {'identical' if identical else 'DIFFERENT'} on {len(texts)} names"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Catalog of known item names and their categories, consulted before the classifier.
+
+Most receipt lines are common stock items whose category is already known from the item lists the model
+was trained on (``data_csv/items_list.csv``, written by ``createData.py``, and ``data_csv/data.csv``).
+``Catalog.lookup`` answers those without running the model:
+
+- ``exact``: the normalized name (see ``prediction_cache.normalize_text``) is in the catalog.
+- ``fuzzy``: a catalog name shares enough character trigrams with the OCR text to be a candidate, and its
+  edit-distance similarity is at least ``min_similarity``, e.g. ``"Paracetamo1"`` for ``"Paracetamol"``.
+
+Categories are read onto the labels the model predicts, see ``labels.canonical_label``, so an item gets
+the same category whichever path answered it.
+
+Names listed under more than one category are never answered from the catalog, nor are fuzzy matches that
+are equally close to names of different categories; those fall back to the model.
+
+Usage:
+    catalog = Catalog.from_csv("data_csv/items_list.csv", "data_csv/data.csv")
+    processor = ReceiptProcessor(model_path, tokenizer_path, catalog=catalog)
+"""
+
+import json
+import heapq
+import hashlib
+import threading
+from collections import Counter, namedtuple
+
+from labels import canonical_label
+from prediction_cache import normalize_text
+
+
+DEFAULT_CATALOG_PATHS = ("data_csv/items_list.csv", "data_csv/data.csv")
+
+# A catalog answer: the category, the similarity of the matched name (1.0 for exact matches), the matched
+# catalog name and the path that answered, "exact" or "fuzzy"
+CatalogMatch = namedtuple("CatalogMatch", ["category", "score", "name", "source"])
+
+# Fuzzy matches need at least this edit-distance similarity, in [0, 1]
+MIN_SIMILARITY = 0.85
+
+# Shorter names are only matched exactly, a single typo changes too much of them
+MIN_FUZZY_LENGTH = 5
+
+# Number of trigram candidates verified with the edit distance
+FUZZY_CANDIDATES = 8
+
+
+def trigrams(text):
+    """
+    Return the set of character trigrams of a normalized text, padded so word boundaries count.
+    """
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit=None):
+    """
+    Return the Levenshtein distance between two strings.
+
+    With a ``limit``, only the band of the distance matrix within ``limit`` of its diagonal is computed and
+    the computation stops as soon as the distance must exceed the limit, returning ``limit + 1``.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is None:
+        limit = len(a)
+    if len(a) - len(b) > limit:
+        return limit + 1
+
+    over = limit + 1
+    previous = [min(j, over) for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, 1):
+        current = [over] * (len(b) + 1)
+        current[0] = min(i, over)
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            cost = previous[j - 1] + (ca != b[j - 1])
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            current[j] = cost
+        if min(current) > limit:
+            return over
+        previous = current
+    return min(previous[-1], over)
+
+
+def similarity(a, b, min_similarity=0.0):
+    """
+    Return the edit-distance similarity of two strings, 1.0 for equal strings and 0.0 for unrelated ones.
+
+    Similarities below ``min_similarity`` are only computed far enough to know they are below it, and
+    returned as 0.0.
+    """
+    length = max(len(a), len(b))
+    if not length:
+        return 1.0
+    limit = int((1.0 - min_similarity) * length + 1e-9)
+    distance = edit_distance(a, b, limit)
+    return 0.0 if distance > limit else 1.0 - distance / length
+
+
+class Catalog:
+    """
+    Index of known item names for exact and fuzzy category lookups.
+
+    Args:
+        items (iterable): ``(name, category)`` pairs.
+        min_similarity (float): Minimum edit-distance similarity of a fuzzy match.
+        fuzzy (bool): Whether to try fuzzy matches when there is no exact one.
+    """
+
+    def __init__(self, items, min_similarity=MIN_SIMILARITY, fuzzy=True):
+        self.min_similarity = min_similarity
+        self.fuzzy = fuzzy
+
+        categories = {}
+        names = {}
+        for name, category in items:
+            key = normalize_text(str(name))
+            if key:
+                categories.setdefault(key, set()).add(category)
+                names.setdefault(key, str(name))
+
+        # Names listed under several categories are left to the model
+        self.ambiguous = {key for key, found in categories.items() if len(found) > 1}
+        self.entries = {key: found.pop() for key, found in categories.items() if key not in self.ambiguous}
+        self.names = {key: names[key] for key in self.entries}
+
+        # Inverted trigram index over the unambiguous names
+        self._keys = list(self.entries)
+        self._trigram_counts = [len(trigrams(key)) for key in self._keys]
+        self._index = {}
+        for position, key in enumerate(self._keys):
+            for trigram in trigrams(key):
+                self._index.setdefault(trigram, []).append(position)
+
+        self._lock = threading.Lock()
+        self.hits = Counter()
+
+    @classmethod
+    def from_csv(cls, *paths, **kwargs):
+        """
+        Build a catalog from CSV files with ``nama`` and ``kategori`` columns.
+
+        Categories are mapped onto ``labels.UNIQUE_LABELS``, see ``labels.canonical_label``.
+
+        Args:
+            *paths (str): The CSV files, defaults to ``DEFAULT_CATALOG_PATHS``.
+            **kwargs: Extra keyword arguments for the constructor.
+
+        Raises:
+            ValueError: If a file has a category that is not one of the labels or an alias of one.
+        """
+        # Imported here, pandas is slow to import and only needed to read the CSVs
+        import pandas as pd
+
+        items = []
+        for path in paths or DEFAULT_CATALOG_PATHS:
+            frame = pd.read_csv(path)
+            try:
+                categories = [canonical_label(category) for category in frame["kategori"]]
+            except ValueError as e:
+                raise ValueError(f"{path}: {e}") from None
+            items.extend(zip(frame["nama"], categories))
+        return cls(items, **kwargs)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, text):
+        """
+        Find the category of a name in the catalog.
+
+        Args:
+            text (str): The item name as read by OCR.
+
+        Returns:
+            CatalogMatch: The match, or None if the name is not confidently in the catalog.
+        """
+        key = normalize_text(text)
+        match = None
+        if key in self.entries:
+            match = CatalogMatch(self.entries[key], 1.0, self.names[key], "exact")
+        elif self.fuzzy and len(key) >= MIN_FUZZY_LENGTH and key not in self.ambiguous:
+            match = self._lookup_fuzzy(key)
+
+        with self._lock:
+            self.hits[match.source if match else "miss"] += 1
+        return match
+
+    def _lookup_fuzzy(self, key):
+        # Candidates sharing the most trigrams, ranked by their Dice coefficient
+        query = trigrams(key)
+        shared = Counter(position for trigram in query for position in self._index.get(trigram, ()))
+        if not shared:
+            return None
+        ranked = heapq.nlargest(
+            FUZZY_CANDIDATES,
+            shared,
+            key=lambda position: 2 * shared[position] / (len(query) + self._trigram_counts[position]),
+        )
+
+        best = None
+        best_categories = set()
+        for position in ranked:
+            candidate = self._keys[position]
+            score = similarity(key, candidate, self.min_similarity)
+            if best is None or score > best[0]:
+                best = (score, candidate)
+                best_categories = {self.entries[candidate]}
+            elif score == best[0]:
+                best_categories.add(self.entries[candidate])
+
+        score, candidate = best
+        if score < self.min_similarity or len(best_categories) > 1:
+            return None
+        return CatalogMatch(self.entries[candidate], score, self.names[candidate], "fuzzy")
+
+    def fingerprint(self):
+        """
+        Return a digest of the entries and settings, which changes whenever the catalog answers differently.
+        """
+        data = json.dumps([sorted(self.entries.items()), self.min_similarity, self.fuzzy], default=str)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def stats(self):
+        """
+        Return the number of lookups answered by each path.
+
+        Returns:
+            dict: Counts of ``exact``, ``fuzzy`` and ``miss`` lookups.
+        """
+        with self._lock:
+            return {source: self.hits[source] for source in ("exact", "fuzzy", "miss")}
@@ -0,0 +1,364 @@
+"""
+Evaluate OCR and classification accuracy, and per-stage latency, on generated receipts.
+
+The generators write the ground truth of every receipt next to its image (``receiptGen.py``,
+``createIMG.py``) or into the same tar shard (``receiptGen.py --shard-dir``). This script runs the OCR
+pipeline over such a set in a process pool, classifies the items with one loaded model, and compares
+everything against the ground truth:
+
+- Field accuracy: the share of ground-truth items whose name, quantity, price and total were read exactly,
+  plus the share of receipts with the right number of items and the right total. OCR items are aligned
+  to the ground truth by name, so one dropped line does not shift every following item.
+- Category accuracy: on the items as read by OCR, and on the ground-truth names, which isolates the
+  classifier from OCR errors. The latter is scored on the model alone; with ``--catalog`` the accuracy
+  with the catalog consulted first is reported separately. Ground-truth categories are mapped onto the
+  labels the model predicts, see ``labels.canonical_label``, as sets generated from
+  ``data_csv/data.csv`` spell one of them differently.
+- Latency percentiles of the decode, preprocess, OCR, parse and classify stages, per receipt.
+
+Usage:
+    python evaluate_ocr.py data/ -o evaluation.json
+    python evaluate_ocr.py "shards/*.tar" --workers 8 --ocr-mode lines
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import tarfile
+import difflib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import ocr_model
+from batch_ocr import _init_worker, find_images
+from prediction_cache import normalize_text
+from catalog import Catalog
+from labels import canonical_label
+from instrumentation import Metrics
+
+
+# Stages timed for every receipt, in pipeline order
+STAGES = ("decode", "preprocess", "ocr", "parse", "classify")
+
+# Item fields compared against the ground truth
+FIELDS = ("name", "quantity", "price", "total")
+
+PERCENTILES = (50, 90, 99)
+
+
+def load_samples(inputs):
+    """
+    Collect the receipts and their ground truth from image directories, globs and tar shards.
+
+    Images are paired with the JSON file of the same name; images without one are skipped. Tar shards are
+    read into memory, pairing ``<key>.jpg`` with ``<key>.json``. Item categories are mapped onto
+    ``labels.UNIQUE_LABELS``, see ``canonical_categories``.
+
+    Args:
+        inputs (list): Directories, glob patterns, image files or ``.tar`` shards.
+
+    Returns:
+        list: ``(key, source, ground_truth)`` tuples, where source is an image path or the encoded image bytes.
+    """
+    samples = []
+    shards = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "**", "*.tar")
+        shards.extend(path for path in glob.glob(pattern, recursive=True) if path.endswith(".tar"))
+
+    for path in find_images(inputs):
+        ground_truth_path = os.path.splitext(path)[0] + ".json"
+        if os.path.exists(ground_truth_path):
+            with open(ground_truth_path) as f:
+                samples.append((path, path, canonical_categories(json.load(f))))
+
+    for shard in sorted(shards):
+        members = {}
+        with tarfile.open(shard) as tar:
+            for member in tar:
+                if member.isfile():
+                    key, extension = os.path.splitext(member.name)
+                    members.setdefault(key, {})[extension] = tar.extractfile(member).read()
+        for key, files in sorted(members.items()):
+            if ".jpg" in files and ".json" in files:
+                samples.append((f"{shard}/{key}", files[".jpg"], canonical_categories(json.loads(files[".json"]))))
+
+    return samples
+
+
+def canonical_categories(ground_truth):
+    """
+    Map the item categories of a ground truth onto ``labels.UNIQUE_LABELS`` in place, and return it.
+
+    Raises:
+        ValueError: If an item has a category that is not one of the labels or an alias of one.
+    """
+    for item in ground_truth["items"]:
+        if item.get("category") is not None:
+            item["category"] = canonical_label(item["category"])
+    return ground_truth
+
+
+def _read_sample(key, source, options):
+    """
+    OCR one receipt in a worker process, returning its stage timings and capturing any error.
+    """
+    metrics = Metrics()
+    try:
+        return key, ocr_model.read_items(source, metrics=metrics, **options), metrics.timings, None
+    except Exception as e:
+        return key, None, metrics.timings, f"{type(e).__name__}: {e}"
+
+
+def align_items(expected, actual):
+    """
+    Pair ground-truth items with OCR items by their normalized names, keeping the order of both.
+
+    Args:
+        expected (list): The ground-truth items.
+        actual (list): The items read by OCR.
+
+    Returns:
+        list: ``(expected_item, actual_item)`` pairs, with None as ``actual_item`` for missed items.
+    """
+    matcher = difflib.SequenceMatcher(
+        None, [normalize_text(item["name"]) for item in expected], [normalize_text(item["name"]) for item in actual]
+    )
+    pairs = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "insert":
+            continue
+        for offset in range(i2 - i1):
+            # Lines replaced by the same number of misread lines pair up in order
+            match = actual[j1 + offset] if tag != "delete" and j1 + offset < j2 else None
+            pairs.append((expected[i1 + offset], match))
+    return pairs
+
+
+def _same(field, expected, actual):
+    if field == "name":
+        return normalize_text(expected) == normalize_text(actual)
+    return expected == actual
+
+
+class Evaluation:
+    """
+    Running accuracy and latency totals of an evaluation.
+    """
+
+    def __init__(self):
+        self.receipts = 0
+        self.failed = []
+        self.items = 0
+        self.correct = dict.fromkeys(FIELDS, 0)
+        self.item_counts = 0
+        self.totals = 0
+        self.categorized = 0
+        self.categories = 0
+        self.latencies = {stage: [] for stage in STAGES + ("total",)}
+
+    def add(self, key, ground_truth, receipt, timings, error=None):
+        """
+        Score one receipt.
+
+        Args:
+            key (str): Identifier of the receipt, used in the failure list.
+            ground_truth (dict): The ground truth written by the generator.
+            receipt (dict): The classified receipt, or None if the pipeline failed.
+            timings (dict): Seconds spent per stage.
+            error (str): The error message if the pipeline failed.
+        """
+        self.receipts += 1
+        self.items += len(ground_truth["items"])
+        self.categorized += sum(item.get("category") is not None for item in ground_truth["items"])
+
+        for stage in STAGES:
+            if stage in timings:
+                self.latencies[stage].append(timings[stage])
+        if error is not None:
+            self.failed.append({"key": key, "error": error})
+            return
+        self.latencies["total"].append(sum(timings.values()))
+
+        self.item_counts += len(receipt["items"]) == len(ground_truth["items"])
+        self.totals += receipt["totals"] == ground_truth["totals"]
+        for expected, actual in align_items(ground_truth["items"], receipt["items"]):
+            if actual is None:
+                continue
+            for field in FIELDS:
+                self.correct[field] += _same(field, expected[field], actual[field])
+            if expected.get("category") is not None:
+                self.categories += expected["category"] == actual["category"]
+
+    def report(self):
+        """
+        Summarize the evaluation.
+
+        Returns:
+            dict: Accuracies as fractions and latency percentiles in milliseconds.
+        """
+        receipts = max(self.receipts, 1)
+        report = {
+            "receipts": self.receipts,
+            "failed": len(self.failed),
+            "items": self.items,
+            "fields": {field: self.correct[field] / max(self.items, 1) for field in FIELDS},
+            "item_count": self.item_counts / receipts,
+            "totals": self.totals / receipts,
+            "category": self.categories / max(self.categorized, 1),
+            "latency_ms": {},
+            "failures": self.failed,
+        }
+        for stage, seconds in self.latencies.items():
+            if seconds:
+                values = np.percentile(np.array(seconds) * 1000, PERCENTILES)
+                report["latency_ms"][stage] = {f"p{p}": float(v) for p, v in zip(PERCENTILES, values)}
+                report["latency_ms"][stage]["mean"] = float(np.mean(seconds) * 1000)
+        return report
+
+
+def evaluate(samples, model_path, tokenizer_path, workers=None, catalog=None, **options):
+    """
+    Run the OCR and classification pipeline over the samples and score it against their ground truth.
+
+    Args:
+        samples (list): ``(key, source, ground_truth)`` tuples as returned by ``load_samples``.
+        model_path (str): Path to the classifier model file.
+        tokenizer_path (str): Path to the tokenizer file.
+        workers (int): Number of OCR worker processes, defaults to the number of cores.
+        catalog (catalog.Catalog): Optional catalog of known item names, consulted before the model.
+        **options: Extra keyword arguments for ``ocr_model.read_items``, e.g. ``ocr_mode``.
+
+    Returns:
+        dict: The report of ``Evaluation.report``, plus the wall time and throughput.
+    """
+    workers = workers or os.cpu_count() or 1
+    evaluation = Evaluation()
+    ground_truths = {key: ground_truth for key, _, ground_truth in samples}
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        # Submit the OCR work before loading the model, see batch_ocr.run_batch
+        results = executor.map(
+            _read_sample,
+            [key for key, _, _ in samples],
+            [source for _, source, _ in samples],
+            [options] * len(samples),
+            chunksize=4,
+        )
+        processor = ocr_model.ReceiptProcessor(model_path, tokenizer_path, catalog=catalog)
+
+        for key, receipt, timings, error in results:
+            if error is None:
+                classify_start = time.perf_counter()
+                processor.classify_receipts([receipt])
+                timings["classify"] = time.perf_counter() - classify_start
+            evaluation.add(key, ground_truths[key], receipt, timings, error)
+    elapsed = time.perf_counter() - start
+
+    report = evaluation.report()
+
+    # Classifier accuracy on the true names, independent of OCR errors. The model alone, without the catalog
+    expected = [item for ground_truth in ground_truths.values() for item in ground_truth["items"]]
+    expected = [item for item in expected if item.get("category") is not None]
+    names = [item["name"] for item in expected]
+    predicted, _ = processor._predict_cached(names)
+    report["category_on_ground_truth_names"] = _category_accuracy(expected, predicted)
+    if catalog is not None:
+        predicted, _ = processor.classify_texts(names)
+        report["category_on_ground_truth_names_with_catalog"] = _category_accuracy(expected, predicted)
+        report["catalog"] = catalog.stats()
+    report["wall_time_s"] = elapsed
+    report["receipts_per_s"] = len(samples) / elapsed if elapsed else 0.0
+    return report
+
+
+def _category_accuracy(expected, predicted):
+    return sum(item["category"] == category for item, category in zip(expected, predicted)) / max(len(expected), 1)
+
+
+def print_report(report):
+    print(f"{report['receipts']} receipts, {report['items']} items, {report['failed']} failed")
+    for field, accuracy in report["fields"].items():
+        print(f"  {field:<10} {accuracy:7.2%}")
+    print(f"  {'items':<10} {report['item_count']:7.2%} of receipts with the right number of items")
+    print(f"  {'totals':<10} {report['totals']:7.2%} of receipts with the right total")
+    print(f"  {'category':<10} {report['category']:7.2%} on OCR items, "
+          f"{report['category_on_ground_truth_names']:.2%} on ground-truth names by the model alone")
+    if "category_on_ground_truth_names_with_catalog" in report:
+        print(f"  {'':<10} {report['category_on_ground_truth_names_with_catalog']:7.2%} on ground-truth names "
+              "with the catalog")
+    print("Latency per receipt (ms):")
+    for stage, stats in report["latency_ms"].items():
+        print(f"  {stage:<10} " + "  ".join(f"{name} {value:8.2f}" for name, value in stats.items()))
+    if "catalog" in report:
+        print("Catalog lookups:", report["catalog"])
+    print(f"{report['wall_time_s']:.1f}s wall time, {report['receipts_per_s']:.1f} receipts/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate OCR and classification on generated receipts.")
+    parser.add_argument("inputs", nargs="+", help="Directories, glob patterns, images or tar shards.")
+    parser.add_argument("-o", "--output", default=None, help="Write the report to this JSON file.")
+    parser.add_argument("--model", default="model/model.h5", help="Path to the classifier model file.")
+    parser.add_argument("--tokenizer", default="model/tokenizer.pickle", help="Path to the tokenizer file.")
+    parser.add_argument(
+        "--variant",
+        choices=ocr_model.MODEL_VARIANTS,
+        default=None,
+        help="Use this classifier variant's model and tokenizer, see ocr_model.MODEL_VARIANTS.",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="OCR worker processes (default: number of cores).")
+    parser.add_argument(
+        "--max-width", type=int, default=None, help="Downscale wider images to this width for the ROI search."
+    )
+    parser.add_argument("--ocr-mode", choices=ocr_model.OCR_MODES, default="block", help="How the ROI is read.")
+    parser.add_argument(
+        "--ocr-backend", choices=ocr_model.OCR_BACKENDS, default="auto", help="Tesseract backend to use."
+    )
+    parser.add_argument(
+        "--roi-method", choices=ocr_model.ROI_METHODS, default="contours", help="How the item table is found."
+    )
+    parser.add_argument(
+        "--catalog",
+        nargs="*",
+        metavar="CSV",
+        default=None,
+        help="Answer known item names from these catalog CSVs before the model (default: the item lists).",
+    )
+    args = parser.parse_args(argv)
+    if args.variant:
+        args.model, args.tokenizer = ocr_model.MODEL_VARIANTS[args.variant]
+
+    samples = load_samples(args.inputs)
+    if not samples:
+        print("No images with ground truth found.")
+        return 1
+
+    report = evaluate(
+        samples,
+        args.model,
+        args.tokenizer,
+        workers=args.workers,
+        catalog=Catalog.from_csv(*args.catalog) if args.catalog is not None else None,
+        max_width=args.max_width,
+        ocr_mode=args.ocr_mode,
+        ocr_backend=args.ocr_backend,
+        roi_method=args.roi_method,
+    )
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print("Report written to", args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
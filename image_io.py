@@ -0,0 +1,288 @@
+"""
+Decode receipt images from any input, and pack many images into one memory-mapped file.
+
+``load_image`` accepts a path, encoded bytes, a file-like object or an already decoded array, so images
+received from a queue or an upload never have to be written to disk first. Encoded images are decoded
+with ``cv2.imdecode``, optionally straight to grayscale and/or at a reduced resolution, which JPEG decodes
+much faster than the full image.
+
+A pack file holds many encoded images back to back, followed by an index of their offsets:
+
+    [image 0][image 1]...[image n-1][JSON index][index offset: uint64][MAGIC]
+
+``PackReader`` memory-maps the file, so a worker streams every image as a zero-copy slice without opening
+a file per receipt. An image in a pack is referenced as ``"<pack path>#<key>"``, see ``load_ref``.
+
+Usage:
+    python image_io.py data/ receipt_dataset/ -o receipts.pack
+    python batch_ocr.py receipts.pack -o results.jsonl
+"""
+
+import os
+import sys
+import mmap
+import json
+import struct
+import argparse
+import functools
+
+import cv2
+import numpy as np
+
+
+MAGIC = b"RCPTPACK"
+PACK_EXTENSION = ".pack"
+
+# Separates the pack path from the image key in a reference
+REF_SEPARATOR = "#"
+
+# cv2.imdecode flags for each reduction factor, in color and in grayscale
+_DECODE_FLAGS = {
+    (1, False): cv2.IMREAD_COLOR,
+    (2, False): cv2.IMREAD_REDUCED_COLOR_2,
+    (4, False): cv2.IMREAD_REDUCED_COLOR_4,
+    (8, False): cv2.IMREAD_REDUCED_COLOR_8,
+    (1, True): cv2.IMREAD_GRAYSCALE,
+    (2, True): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    (4, True): cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    (8, True): cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def decode_flags(reduce=1, grayscale=False):
+    """
+    Return the ``cv2.imdecode`` flags for a reduction factor.
+
+    Raises:
+        ValueError: If ``reduce`` is not 1, 2, 4 or 8.
+    """
+    try:
+        return _DECODE_FLAGS[reduce, bool(grayscale)]
+    except KeyError:
+        raise ValueError(f"Unsupported reduction factor {reduce!r}, expected 1, 2, 4 or 8.") from None
+
+
+def load_image(image, reduce=1, grayscale=False):
+    """
+    Decode a receipt image from a path, bytes, a file-like object or an array.
+
+    Args:
+        image: One of
+            - a path (``str`` or ``os.PathLike``), or a ``"<pack>#<key>"`` reference into a pack file;
+            - the encoded image as ``bytes``, ``bytearray`` or ``memoryview``;
+            - a binary file-like object with a ``read`` method;
+            - a ``numpy.ndarray``: a decoded image is returned as is, a 1-D ``uint8`` array is decoded.
+        reduce (int): Decode at 1/1, 1/2, 1/4 or 1/8 of the resolution. JPEG decodes the reduced image
+            directly, which is much faster than decoding and then resizing.
+        grayscale (bool): Decode to a single channel, which the pipeline converts to anyway.
+
+    Returns:
+        numpy.ndarray: The decoded BGR (or grayscale) image.
+
+    Raises:
+        ValueError: If the image cannot be read or decoded.
+    """
+    if isinstance(image, np.ndarray) and image.ndim != 1:
+        return image
+
+    data = read_encoded(image)
+    buffer = data if isinstance(data, np.ndarray) else np.frombuffer(data, dtype=np.uint8)
+    img = cv2.imdecode(buffer, decode_flags(reduce, grayscale)) if buffer.size else None
+    if img is None:
+        name = f" {image!r}" if isinstance(image, (str, os.PathLike)) else ""
+        raise ValueError(f"Could not decode image{name}.")
+    return img
+
+
+def read_encoded(image):
+    """
+    Return the encoded bytes of an image input without decoding it, e.g. to hash its content.
+
+    Args:
+        image: Any input of ``load_image``.
+
+    Returns:
+        The encoded image as ``bytes``, a ``memoryview`` or a 1-D ``numpy.ndarray``, or None for an already
+        decoded image.
+
+    Raises:
+        ValueError: If the image file cannot be read.
+    """
+    if isinstance(image, np.ndarray):
+        return image if image.ndim == 1 else None
+
+    if isinstance(image, (str, os.PathLike)):
+        path = os.fspath(image)
+        if REF_SEPARATOR in path and path.split(REF_SEPARATOR, 1)[0].endswith(PACK_EXTENSION):
+            return load_ref(path)
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            raise ValueError(f"Could not read image {image!r}.") from None
+
+    if hasattr(image, "read"):
+        return image.read()
+    return image
+
+
+class PackWriter:
+    """
+    Write encoded images into a pack file, see the module docstring for the layout.
+
+    The index is written on ``close``; the file is assembled under a temporary name and only appears at
+    ``path`` once it is complete.
+
+    Args:
+        path (str): The pack file to write.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._tmp_path = path + ".tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._index = {"keys": [], "offsets": [], "lengths": []}
+        self._keys = set()
+
+    def add(self, key, data):
+        """
+        Append one encoded image.
+
+        Args:
+            key (str): Unique key of the image, e.g. its original path.
+            data (bytes): The encoded image.
+
+        Raises:
+            ValueError: If the key is already in the pack or contains the reference separator.
+        """
+        if key in self._keys or REF_SEPARATOR in key:
+            raise ValueError(f"Invalid or duplicate pack key {key!r}.")
+        self._keys.add(key)
+        self._index["keys"].append(key)
+        self._index["offsets"].append(self._file.tell())
+        self._index["lengths"].append(len(data))
+        self._file.write(data)
+
+    def close(self):
+        """
+        Write the index and move the finished pack into place.
+        """
+        index_offset = self._file.tell()
+        self._file.write(json.dumps(self._index).encode())
+        self._file.write(struct.pack("<Q", index_offset) + MAGIC)
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.remove(self._tmp_path)
+
+
+class PackReader:
+    """
+    Memory-mapped read access to the images of a pack file.
+
+    Args:
+        path (str): The pack file.
+
+    Raises:
+        ValueError: If the file is not a pack file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        footer = len(MAGIC) + 8
+        if len(self._mmap) < footer or self._mmap[-len(MAGIC) :] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path!r} is not a pack file.")
+        (index_offset,) = struct.unpack("<Q", self._mmap[-footer : -len(MAGIC)])
+        index = json.loads(self._mmap[index_offset:-footer])
+
+        self.keys = index["keys"]
+        self._offsets = index["offsets"]
+        self._lengths = index["lengths"]
+        self._positions = {key: i for i, key in enumerate(self.keys)}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def read(self, key):
+        """
+        Return the encoded image stored under ``key`` (a key or its position) as a zero-copy ``memoryview``.
+
+        Raises:
+            KeyError: If the key is not in the pack.
+        """
+        position = key if isinstance(key, int) else self._positions[key]
+        offset = self._offsets[position]
+        return memoryview(self._mmap)[offset : offset + self._lengths[position]]
+
+    def refs(self):
+        """
+        Return the ``"<pack>#<key>"`` reference of every image, in pack order.
+        """
+        return [f"{self.path}{REF_SEPARATOR}{key}" for key in self.keys]
+
+    def close(self):
+        self._mmap.close()
+
+
+@functools.lru_cache(maxsize=16)
+def open_pack(path):
+    """
+    Return a ``PackReader`` for the pack file, opened once per process and kept mapped.
+    """
+    return PackReader(path)
+
+
+def load_ref(ref):
+    """
+    Return the encoded bytes of a ``"<pack>#<key>"`` reference, as a zero-copy view into the pack.
+    """
+    path, key = ref.split(REF_SEPARATOR, 1)
+    return open_pack(path).read(key)
+
+
+def write_pack(paths, output_path):
+    """
+    Pack image files into one pack file, keyed by their paths.
+
+    Args:
+        paths (list): The image files.
+        output_path (str): The pack file to write.
+
+    Returns:
+        int: The number of packed images.
+    """
+    with PackWriter(output_path) as writer:
+        for path in paths:
+            with open(path, "rb") as f:
+                writer.add(path, f.read())
+    return len(paths)
+
+
+def main(argv=None):
+    # Imported here, batch_ocr depends on this module through ocr_model
+    from batch_ocr import find_images
+
+    parser = argparse.ArgumentParser(description="Pack receipt images into one memory-mappable file.")
+    parser.add_argument("inputs", nargs="+", help="Directories, glob patterns or image files.")
+    parser.add_argument("-o", "--output", required=True, help="Pack file to write.")
+    args = parser.parse_args(argv)
+
+    count = write_pack(find_images(args.inputs), args.output)
+    print(f"{count} images packed into {args.output} ({os.path.getsize(args.output) / 2**20:.1f} MiB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
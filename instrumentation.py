@@ -0,0 +1,369 @@
+"""
+Per-stage timers, counters and sampled profiling for the receipt pipeline.
+
+A ``Metrics`` object collects the timings and counters of one receipt. ``ocr_model.read_items`` fills in
+the ``decode``, ``preprocess``, ``ocr`` and ``parse`` stages and the ``roi_candidates``, ``ocr_lines``,
+``items_parsed`` and ``lines_dropped`` counters; ``ReceiptProcessor`` adds the ``classify`` stage. Gauges
+hold values that are not summed across requests, such as the ``memory_peak_bytes`` of profiled requests;
+their maximum is kept.
+
+An ``Instrumentation`` hands out ``Metrics`` per request, aggregates them and passes each one to its
+exporters:
+
+- ``LogExporter``: one log line per receipt.
+- ``PrometheusExporter``: the aggregated totals in the Prometheus text format, written to a file, e.g. for
+  the node_exporter textfile collector.
+- ``CallbackExporter``: any function taking the ``Metrics``.
+
+Timing a stage costs two ``perf_counter`` calls, so instrumentation can stay enabled in production.
+Profiling is opt-in: with a ``profile_rate``, that fraction of requests runs under cProfile (and
+tracemalloc with ``trace_memory``), and the profiles are written to ``profile_dir``. cProfile only sees the
+thread that enables it, so a request whose work runs in other threads, e.g. in an executor of an asyncio
+service, is opened with ``request(profile=False)`` and its work is profiled with ``profiling`` in the thread
+that does it.
+
+Usage:
+    instrumentation = Instrumentation([LogExporter(), PrometheusExporter("metrics/receipts.prom")])
+    processor = ReceiptProcessor(model_path, tokenizer_path, instrumentation=instrumentation)
+"""
+
+import os
+import time
+import random
+import logging
+import cProfile
+import threading
+import contextlib
+import tracemalloc
+
+
+logger = logging.getLogger(__name__)
+
+# Number of allocation sites kept from a tracemalloc snapshot
+TOP_ALLOCATIONS = 25
+
+
+class Metrics:
+    """
+    Timings and counters of one receipt.
+
+    Attributes:
+        timings (dict): Seconds spent per stage.
+        counters (dict): Counts per counter name.
+        gauges (dict): Values per gauge name, aggregated as their maximum.
+        profile_path (str): Path of the cProfile output, if this request was profiled and written to disk.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+        self.gauges = {}
+        self.profile_path = None
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        """
+        Time the enclosed block, adding the seconds to ``stage``.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def add_time(self, stage, seconds):
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        self.gauges[name] = max(value, self.gauges.get(name, value))
+
+
+class NullMetrics:
+    """
+    Metrics that record nothing, used when instrumentation is disabled.
+    """
+
+    timings = {}
+    counters = {}
+    gauges = {}
+    profile_path = None
+
+    def timer(self, stage):
+        return contextlib.nullcontext()
+
+    def add_time(self, stage, seconds):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+    def gauge(self, name, value):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+class LogExporter:
+    """
+    Log one line per receipt with its stage timings in milliseconds and its counters.
+
+    Args:
+        logger (logging.Logger): The logger, defaults to this module's logger.
+        level (int): The log level of the lines.
+    """
+
+    def __init__(self, logger=logger, level=logging.INFO):
+        self.logger = logger
+        self.level = level
+
+    def export(self, metrics, instrumentation):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        fields = [f"{stage}={seconds * 1000:.2f}ms" for stage, seconds in metrics.timings.items()]
+        fields += [f"{name}={value}" for name, value in metrics.counters.items()]
+        fields += [f"{name}={value}" for name, value in metrics.gauges.items()]
+        self.logger.log(self.level, "receipt %s", " ".join(fields))
+
+
+class PrometheusExporter:
+    """
+    Write the aggregated metrics to a file in the Prometheus text exposition format.
+
+    The file is replaced atomically, at most once per ``interval`` seconds, and on ``flush``.
+
+    Args:
+        path (str): The output file, e.g. ``receipts.prom`` in a node_exporter textfile directory.
+        prefix (str): Prefix of the metric names.
+        interval (float): Minimum number of seconds between two writes.
+    """
+
+    def __init__(self, path, prefix="receipt", interval=10.0):
+        self.path = path
+        self.prefix = prefix
+        self.interval = interval
+        self._written = None
+        # Serializes the writes of the file, requests are exported from several threads
+        self._write_lock = threading.Lock()
+
+    def export(self, metrics, instrumentation):
+        now = time.monotonic()
+        # Checked and updated under the lock of the totals, so only one thread writes per interval
+        with instrumentation._lock:
+            due = self._written is None or now - self._written >= self.interval
+            if due:
+                self._written = now
+        if due:
+            self.flush(instrumentation)
+
+    def flush(self, instrumentation):
+        """
+        Write the current totals of ``instrumentation`` now.
+        """
+        snapshot = instrumentation.snapshot()
+        p = self.prefix
+        lines = [
+            f"# HELP {p}_requests_total Receipts processed.",
+            f"# TYPE {p}_requests_total counter",
+            f"{p}_requests_total {snapshot['requests']}",
+            f"# HELP {p}_stage_seconds Time spent per pipeline stage.",
+            f"# TYPE {p}_stage_seconds summary",
+        ]
+        for stage, stats in snapshot["stages"].items():
+            lines.append(f'{p}_stage_seconds_sum{{stage="{stage}"}} {stats["seconds"]:.6f}')
+            lines.append(f'{p}_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        for name, value in snapshot["counters"].items():
+            lines.append(f"# TYPE {p}_{name}_total counter")
+            lines.append(f"{p}_{name}_total {value}")
+        for name, value in snapshot["gauges"].items():
+            lines.append(f"# TYPE {p}_{name} gauge")
+            lines.append(f"{p}_{name} {value}")
+
+        tmp_path = self.path + ".tmp"
+        with self._write_lock:
+            with open(tmp_path, "w") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(tmp_path, self.path)
+
+
+class CallbackExporter:
+    """
+    Pass the metrics of every receipt to a function.
+
+    Args:
+        callback (callable): Called with the ``Metrics`` of every receipt.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def export(self, metrics, instrumentation):
+        self.callback(metrics)
+
+
+class Instrumentation:
+    """
+    Hand out per-request ``Metrics``, aggregate them and export them.
+
+    Args:
+        exporters (list): Exporters called with every finished request, see the module docstring.
+        profile_rate (float): Fraction of requests run under cProfile, 0 disables profiling.
+        profile_dir (str): Directory the ``.prof`` files (and tracemalloc snapshots) of profiled requests
+            are written to. If None, the profiles are only passed to the exporters as counters.
+        trace_memory (bool): Also trace allocations of profiled requests with tracemalloc, adding their
+            ``memory_peak_bytes`` gauge. Tracing slows the profiled request down considerably.
+        seed (int): Seed of the request sampling.
+    """
+
+    def __init__(self, exporters=(), profile_rate=0.0, profile_dir=None, trace_memory=False, seed=None):
+        self.exporters = list(exporters)
+        self.profile_rate = profile_rate
+        self.profile_dir = profile_dir
+        self.trace_memory = trace_memory
+        self.requests = 0
+        self.profiled = 0
+        self.stages = {}
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+        # Only one request is profiled at a time, tracemalloc is process-wide
+        self._profile_lock = threading.Lock()
+        self._random = random.Random(seed)
+
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    @contextlib.contextmanager
+    def request(self, profile=True):
+        """
+        Collect the metrics of one request, profiling it if it is sampled, and record them at the end.
+
+        Args:
+            profile (bool): Profile sampled requests in this thread. Pass False when the work of the request
+                runs in other threads, which cProfile does not see, and profile it there with ``profiling``.
+
+        Yields:
+            Metrics: The metrics to fill in.
+        """
+        metrics = Metrics()
+        try:
+            if profile:
+                with self.profiling(metrics):
+                    yield metrics
+            else:
+                yield metrics
+        except Exception:
+            metrics.count("errors")
+            raise
+        finally:
+            self.record(metrics)
+
+    @contextlib.contextmanager
+    def profiling(self, metrics):
+        """
+        Profile the enclosed block, in the thread that runs it, if it is sampled.
+
+        Use this around the work of a request opened with ``request(profile=False)``, e.g. inside the callable
+        an asyncio service runs in its executor.
+
+        Args:
+            metrics (Metrics): The metrics of the request, the profile counters are added to them.
+        """
+        sampled = (
+            self.profile_rate > 0
+            and self._random.random() < self.profile_rate
+            and self._profile_lock.acquire(blocking=False)
+        )
+        if not sampled:
+            yield
+            return
+
+        try:
+            with self._profile(metrics):
+                yield
+        finally:
+            self._profile_lock.release()
+
+    @contextlib.contextmanager
+    def _profile(self, metrics):
+        profiler = cProfile.Profile()
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif self.trace_memory:
+            tracemalloc.reset_peak()
+
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            metrics.count("profiled")
+
+            if self.trace_memory:
+                metrics.gauge("memory_peak_bytes", tracemalloc.get_traced_memory()[1])
+                snapshot = tracemalloc.take_snapshot() if self.profile_dir else None
+                if tracing:
+                    tracemalloc.stop()
+
+            if self.profile_dir:
+                with self._lock:
+                    self.profiled += 1
+                    number = self.profiled
+                base = os.path.join(self.profile_dir, f"request-{os.getpid()}-{number:06d}")
+                profiler.dump_stats(base + ".prof")
+                metrics.profile_path = base + ".prof"
+                if self.trace_memory:
+                    with open(base + ".tracemalloc.txt", "w") as f:
+                        for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+                            f.write(f"{stat}\n")
+
+    def record(self, metrics):
+        """
+        Add the metrics of a finished request to the totals and pass them to the exporters.
+
+        Use this for metrics collected outside ``request``, e.g. in worker processes.
+        """
+        with self._lock:
+            self.requests += 1
+            for stage, seconds in metrics.timings.items():
+                stats = self.stages.setdefault(stage, {"seconds": 0.0, "count": 0})
+                stats["seconds"] += seconds
+                stats["count"] += 1
+            for name, value in metrics.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, value in metrics.gauges.items():
+                self.gauges[name] = max(value, self.gauges.get(name, value))
+
+        for exporter in self.exporters:
+            try:
+                exporter.export(metrics, self)
+            except Exception:
+                logger.exception("Metrics exporter %r failed", exporter)
+
+    def snapshot(self):
+        """
+        Return a copy of the aggregated totals.
+
+        Returns:
+            dict: ``{"requests": int, "stages": {stage: {"seconds", "count"}}, "counters": {name: value},
+                "gauges": {name: maximum}}``.
+        """
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "stages": {stage: dict(stats) for stage, stats in self.stages.items()},
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+            }
+
+    def flush(self):
+        """
+        Write the current totals with every exporter that buffers them, e.g. at shutdown.
+        """
+        for exporter in self.exporters:
+            if hasattr(exporter, "flush"):
+                exporter.flush(self)
@@ -0,0 +1,38 @@
+"""
+Category labels of the item classifier.
+
+The model and its training script (``model/nlp_model.py``) share these labels, in the order of the model
+outputs. The item lists and generated ground truth spell some of them differently, e.g. ``data_csv/data.csv``
+writes ``"Medical & Healthcare"``; ``canonical_label`` maps those spellings onto the labels.
+
+This module has no dependencies, so the data generators and the catalog can import it without loading the
+OCR pipeline.
+"""
+
+
+# Define the unique labels for classification
+UNIQUE_LABELS = [
+    "Clothing",
+    "Food",
+    "Stationery",
+    "Others",
+    "Toiletries",
+    "Medical and Health Care",
+    "Entertainment",
+]
+
+# Other spellings of the labels in the item lists and ground truth, e.g. ``data_csv/data.csv``
+LABEL_ALIASES = {"Medical & Healthcare": "Medical and Health Care"}
+
+
+def canonical_label(label):
+    """
+    Return the label of ``UNIQUE_LABELS`` a category name stands for, see ``LABEL_ALIASES``.
+
+    Raises:
+        ValueError: If the name is neither one of the labels nor an alias of one.
+    """
+    label = LABEL_ALIASES.get(label, label)
+    if label not in UNIQUE_LABELS:
+        raise ValueError(f"Unknown category {label!r}, expected one of {UNIQUE_LABELS}.")
+    return label
@@ -0,0 +1,237 @@
+"""
+Compress the category classifier for CPU serving.
+
+Writes, next to the Keras model by default:
+- model.int8.tflite: the classifier with int8 weights, quantized after training, for the TFLite interpreter.
+- model.distilled.npz: a smaller student, Embedding -> masked average pooling -> Dense -> Dense, trained to
+  reproduce the probabilities of the Keras model (the teacher) on every item name of the CSVs, for
+  ``nlp_runtime.PooledClassifier``. Its weights are stored as int8 with a float32 scale per output column.
+
+Both read the exported ``tokenizer.json``, see ``model.export_model``, and are selected in ``ocr_model`` with
+``--variant``, see ``ocr_model.MODEL_VARIANTS``.
+
+The report compares every variant with the Keras model on the CSV rows: accuracy against the labels,
+agreement with the categories of the Keras model, file size and items per second on CPU. The Keras model
+was trained on these rows, so its accuracy is an upper bound and the agreement is what the variants keep.
+A TFLite variant is skipped when neither ``ai_edge_litert`` nor ``tflite_runtime`` is installed.
+
+Usage (from the repository root):
+    python -m model.compress_model data_csv/data.csv
+"""
+
+import os
+import time
+import pickle
+import argparse
+
+import numpy as np
+import keras
+from keras.layers import Dense, Embedding, GlobalAveragePooling1D, Input
+from sklearn.model_selection import train_test_split
+
+import nlp_runtime
+from model.export_model import export_tflite
+from model.nlp_model import UNIQUE_LABELS, load_dataset
+
+
+# Size of the student's embedding and hidden layer
+STUDENT_EMBEDDING_DIM = 32
+STUDENT_HIDDEN_UNITS = 64
+
+# Weight of the labels in the student's targets, the rest is the teacher's probabilities
+LABEL_WEIGHT = 0.0
+
+# The uncompressed exports of model.export_model, compared as well when present
+EXPORTED_VARIANTS = (("numpy", "model.npz"), ("tflite", "model.tflite"))
+
+
+def build_student(maxlen, num_words, embedding_dim=STUDENT_EMBEDDING_DIM, hidden_units=STUDENT_HIDDEN_UNITS):
+    """
+    Build and compile the distilled classifier, see ``nlp_runtime.PooledClassifier``.
+    """
+    model = keras.Sequential(
+        [
+            Input(shape=(maxlen,)),
+            # Padding is masked out of the average
+            Embedding(num_words, embedding_dim, mask_zero=True),
+            GlobalAveragePooling1D(),
+            Dense(hidden_units, activation="relu"),
+            Dense(len(UNIQUE_LABELS), activation="softmax"),
+        ]
+    )
+    model.compile(loss="categorical_crossentropy", optimizer=keras.optimizers.Adam(3e-3), metrics=["accuracy"])
+    return model
+
+
+def distill(
+    teacher,
+    data,
+    labels,
+    label_weight=LABEL_WEIGHT,
+    epochs=200,
+    batch_size=32,
+    patience=30,
+    validation_split=0.2,
+    seed=0,
+):
+    """
+    Train a student to reproduce the teacher's probabilities, mixed with the labels.
+
+    Names without known tokens are left out, the student answers them from its biases alone.
+
+    Args:
+        teacher: The Keras model.
+        data (numpy.ndarray): Padded token ids of the item names the teacher is imitated on.
+        labels (numpy.ndarray): Their category ids.
+        label_weight (float): Weight of the one-hot labels in the targets, the teacher gets the rest.
+        epochs (int): Maximum number of epochs.
+        batch_size (int): Samples per batch.
+        patience (int): Epochs without a better ``val_loss`` before training stops.
+        validation_split (float): Fraction of ``data`` held out for early stopping.
+        seed (int): Seed of the split and the initialization.
+
+    Returns:
+        keras.Model: The trained student.
+    """
+    keras.utils.set_random_seed(seed)
+    # Names without known tokens have nothing to average, Keras pools them to NaN
+    known = np.count_nonzero(data, axis=1) > 0
+    data, labels = data[known], labels[known]
+
+    targets = (1 - label_weight) * teacher.predict(data, batch_size=256, verbose=0)
+    targets += label_weight * np.eye(len(UNIQUE_LABELS), dtype=np.float32)[labels]
+    x_train, x_val, y_train, y_val = train_test_split(
+        data, targets, test_size=validation_split, random_state=seed, stratify=labels
+    )
+
+    student = build_student(data.shape[1], teacher.layers[0].input_dim)
+    student.fit(
+        x_train,
+        y_train,
+        epochs=epochs,
+        batch_size=batch_size,
+        validation_data=(x_val, y_val),
+        callbacks=[keras.callbacks.EarlyStopping(monitor="val_loss", patience=patience, restore_best_weights=True)],
+        verbose=0,
+    )
+    return student
+
+
+def quantize_weights(weights):
+    """
+    Quantize the matrices of a weight dict to symmetric int8 with a float32 scale per output column.
+
+    Biases and other vectors are kept as they are.
+
+    Returns:
+        dict: The weights, with a ``<name>_scale`` entry for every quantized matrix.
+    """
+    quantized = {}
+    for name, weight in weights.items():
+        if weight.ndim != 2:
+            quantized[name] = weight
+            continue
+        scale = np.abs(weight).max(axis=0) / 127
+        scale[scale == 0] = 1.0
+        quantized[name] = np.round(weight / scale).astype(np.int8)
+        quantized[name + "_scale"] = scale.astype(np.float32)
+    return quantized
+
+
+def export_student(model, path, int8=True):
+    """
+    Save the weights of the student in the layout ``nlp_runtime.PooledClassifier`` expects.
+    """
+    embedding, _, hidden, output = model.layers
+    weights = {
+        "embeddings": embedding.get_weights()[0],
+        "hidden_kernel": hidden.get_weights()[0],
+        "hidden_bias": hidden.get_weights()[1],
+        "output_kernel": output.get_weights()[0],
+        "output_bias": output.get_weights()[1],
+    }
+    if int8:
+        weights = quantize_weights(weights)
+    np.savez(path, architecture=np.array("pooled"), **weights)
+
+
+def measure(classifier, data, labels, expected, repeats=3):
+    """
+    Return the accuracy and agreement of a classifier, and its items per second over the fastest of ``repeats``.
+
+    Args:
+        classifier: Any object with a Keras-style ``predict``.
+        data (numpy.ndarray): Padded token ids of the item names.
+        labels (numpy.ndarray): Their category ids.
+        expected (numpy.ndarray): The categories the Keras model predicts for them.
+    """
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predicted = classifier.predict(data, batch_size=256, verbose=0).argmax(axis=1)
+        seconds.append(time.perf_counter() - start)
+    return {
+        "accuracy": float(np.mean(predicted == labels)),
+        "agreement": float(np.mean(predicted == expected)),
+        "items_per_second": len(data) / min(seconds),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quantize and distill the category classifier.")
+    parser.add_argument("csv", nargs="*", default=["data_csv/data.csv"], help="CSV files with nama and kategori.")
+    parser.add_argument("--model", default="model/model.h5", help="Path to the Keras model file.")
+    parser.add_argument("--tokenizer", default="model/tokenizer.pickle", help="Path to the tokenizer pickle file.")
+    parser.add_argument("--out-dir", default="model", help="Directory the compressed models are written to.")
+    parser.add_argument("--tflite-batch-size", type=int, default=32, help="Fixed batch size of the TFLite model.")
+    parser.add_argument(
+        "--label-weight", type=float, default=LABEL_WEIGHT, help="Weight of the labels in the student's targets."
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the student's split and initialization.")
+    args = parser.parse_args(argv)
+
+    teacher = keras.models.load_model(args.model)
+    with open(args.tokenizer, "rb") as handle:
+        vocabulary = nlp_runtime.Vocabulary.from_tokenizer(pickle.load(handle), teacher.input_shape[1])
+
+    texts, labels = load_dataset(args.csv)
+    data = vocabulary.encode(texts)
+
+    int8_path = os.path.join(args.out_dir, "model.int8.tflite")
+    export_tflite(teacher, int8_path, args.tflite_batch_size, quantize=True)
+    print("Quantized model has been written to", int8_path)
+
+    start = time.perf_counter()
+    student = distill(teacher, data, labels, args.label_weight, seed=args.seed)
+    print(f"Student distilled in {time.perf_counter() - start:.1f} s")
+    distilled_path = os.path.join(args.out_dir, "model.distilled.npz")
+    export_student(student, distilled_path)
+    print("Distilled model has been written to", distilled_path)
+
+    candidates = [(name, os.path.join(args.out_dir, file_name)) for name, file_name in EXPORTED_VARIANTS]
+    candidates += [("int8", int8_path), ("distilled", distilled_path)]
+    variants = {"keras": (teacher, args.model)}
+    for name, path in candidates:
+        if not os.path.exists(path):
+            continue
+        try:
+            variants[name] = (nlp_runtime.load_classifier(path), path)
+        except ImportError as e:
+            # The TFLite models need tflite-runtime or TensorFlow Lite, the files are written regardless
+            print(f"Skipping {name}, {path} cannot be loaded: {e}")
+
+    expected = teacher.predict(data, batch_size=256, verbose=0).argmax(axis=1)
+    baseline = None
+    print(f"{len(data)} item names")
+    for name, (classifier, path) in variants.items():
+        result = measure(classifier, data, labels, expected)
+        baseline = baseline or result
+        print(
+            f"{name:>9}: accuracy {result['accuracy']:.2%} ({result['accuracy'] - baseline['accuracy']:+.2%}), "
+            f"{result['agreement']:.2%} same category as keras, {os.path.getsize(path) / 1024:7.1f} KiB, "
+            f"{result['items_per_second']:9.0f} items/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Export the Keras category classifier and its tokenizer for the TensorFlow-free runtime in ``nlp_runtime``.
+
+Writes, next to the Keras model by default:
+- tokenizer.json: the tokenizer word index and settings.
+- model.npz: the layer weights for ``nlp_runtime.NumpyClassifier``.
+- model.tflite: with ``--tflite``, the model for the standalone TFLite interpreter.
+
+With ``--check``, the exported runtimes are compared against the Keras model on the item names of a CSV
+file, reporting how many predicted categories agree and the largest probability difference.
+
+Usage (from the repository root):
+    python -m model.export_model --tflite --check data_csv/data.csv
+"""
+
+import os
+import pickle
+import argparse
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+import keras
+from keras.models import load_model
+from keras.preprocessing.sequence import pad_sequences
+
+import nlp_runtime
+
+
+# The layer types the NumPy runtime implements, in order
+ARCHITECTURE = ["Embedding", "Dense", "Dense", "LSTM", "Dense"]
+
+
+def export_weights(model, path):
+    """
+    Save the weights of the classifier in the layout ``nlp_runtime.NumpyClassifier`` expects.
+
+    Raises:
+        ValueError: If the model does not have the expected architecture.
+    """
+    layers = [layer.__class__.__name__ for layer in model.layers]
+    if layers != ARCHITECTURE:
+        raise ValueError(f"Expected layers {ARCHITECTURE}, found {layers}.")
+
+    embedding, dense1, dense2, lstm, output = model.layers
+    lstm_config = lstm.get_config()
+    if lstm_config["activation"] != "tanh" or lstm_config["recurrent_activation"] != "sigmoid":
+        raise ValueError("Only LSTMs with tanh activation and sigmoid recurrent activation are supported.")
+
+    np.savez(
+        path,
+        embeddings=embedding.get_weights()[0],
+        dense1_kernel=dense1.get_weights()[0],
+        dense1_bias=dense1.get_weights()[1],
+        dense2_kernel=dense2.get_weights()[0],
+        dense2_bias=dense2.get_weights()[1],
+        lstm_kernel=lstm.get_weights()[0],
+        lstm_recurrent_kernel=lstm.get_weights()[1],
+        lstm_bias=lstm.get_weights()[2],
+        output_kernel=output.get_weights()[0],
+        output_bias=output.get_weights()[1],
+        mask_zero=np.array(embedding.get_config().get("mask_zero", False)),
+    )
+
+
+def export_tflite(model, path, batch_size=32, quantize=False):
+    """
+    Convert the classifier to TFLite with a fixed batch size.
+
+    Dropout is removed first: the LSTM's dropout state cannot be converted, and it is unused at inference.
+    The TFLite LSTM lowering needs a static batch dimension, see ``nlp_runtime.TFLiteClassifier``.
+
+    With ``quantize``, the weights are quantized to int8 after training (dynamic range quantization): the
+    kernels run as int8 with activations quantized on the fly, and the file is about four times smaller.
+    """
+    config = model.get_config()
+    for layer in config["layers"]:
+        if layer["class_name"] == "InputLayer":
+            layer["config"]["batch_shape"] = (batch_size, *layer["config"]["batch_shape"][1:])
+        if layer["class_name"] == "LSTM":
+            layer["config"]["dropout"] = 0.0
+            layer["config"]["recurrent_dropout"] = 0.0
+    inference_model = keras.Sequential.from_config(config)
+    inference_model.set_weights(model.get_weights())
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(inference_model)
+    if quantize:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    with open(path, "wb") as f:
+        f.write(converter.convert())
+
+
+def check_parity(model, tokenizer, csv_path, runtimes, maxlen=100):
+    """
+    Compare exported runtimes against the Keras model on the item names of a CSV file.
+
+    Args:
+        model: The Keras model.
+        tokenizer: The Keras tokenizer.
+        csv_path (str): CSV file with a ``nama`` column.
+        runtimes (dict): Mapping of runtime names to ``(classifier, vocabulary)`` pairs.
+        maxlen (int): Sequence length of the model.
+
+    Returns:
+        dict: For every runtime, the ``agreement`` of predicted categories and the ``max_abs_diff``
+            of the probabilities.
+    """
+    texts = pd.read_csv(csv_path)["nama"].astype(str).tolist()
+    expected = model.predict(pad_sequences(tokenizer.texts_to_sequences(texts), maxlen=maxlen), verbose=0)
+
+    report = {}
+    for name, (classifier, vocabulary) in runtimes.items():
+        data = nlp_runtime.pad_sequences(vocabulary.texts_to_sequences(texts), maxlen)
+        actual = classifier.predict(data, batch_size=256)
+        report[name] = {
+            "agreement": float(np.mean(actual.argmax(axis=1) == expected.argmax(axis=1))),
+            "max_abs_diff": float(np.abs(actual - expected).max()),
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the category classifier for the lightweight runtime.")
+    parser.add_argument("--model", default="model/model.h5", help="Path to the Keras model file.")
+    parser.add_argument("--tokenizer", default="model/tokenizer.pickle", help="Path to the tokenizer pickle file.")
+    parser.add_argument("--out-dir", default="model", help="Directory the exported files are written to.")
+    parser.add_argument("--tflite", action="store_true", help="Also export a TFLite model.")
+    parser.add_argument("--tflite-batch-size", type=int, default=32, help="Fixed batch size of the TFLite model.")
+    parser.add_argument("--check", metavar="CSV", help="Compare the exports against Keras on this CSV's names.")
+    args = parser.parse_args(argv)
+
+    model = load_model(args.model)
+    with open(args.tokenizer, "rb") as handle:
+        tokenizer = pickle.load(handle)
+    maxlen = model.input_shape[1]
+
+    vocabulary_path = os.path.join(args.out_dir, "tokenizer.json")
+    vocabulary = nlp_runtime.Vocabulary.from_tokenizer(tokenizer, maxlen)
+    vocabulary.save(vocabulary_path)
+    print("Tokenizer has been written to", vocabulary_path)
+
+    weights_path = os.path.join(args.out_dir, "model.npz")
+    export_weights(model, weights_path)
+    print("Weights have been written to", weights_path)
+    runtimes = {"numpy": (nlp_runtime.load_classifier(weights_path), vocabulary)}
+
+    if args.tflite:
+        tflite_path = os.path.join(args.out_dir, "model.tflite")
+        export_tflite(model, tflite_path, args.tflite_batch_size)
+        print("TFLite model has been written to", tflite_path)
+        try:
+            runtimes["tflite"] = (nlp_runtime.load_classifier(tflite_path), vocabulary)
+        except ImportError:
+            print("No TFLite interpreter installed, skipping the TFLite parity check.")
+
+    if args.check:
+        for name, result in check_parity(model, tokenizer, args.check, runtimes, maxlen).items():
+            print(
+                f"{name:>8}: {result['agreement']:.2%} same category, "
+                f"max probability difference {result['max_abs_diff']:.2e}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,79 +1,396 @@
+"""
+Train the item category classifier used by ``ocr_model.ReceiptProcessor``.
+
+The item names are fed through a ``tf.data`` pipeline: they are tokenized with TensorFlow string ops in a
+parallel ``map`` (reproducing the Keras ``Tokenizer``), cached after the first epoch, shuffled, batched and
+prefetched. Training stops early when ``val_accuracy`` stops improving and keeps the best weights.
+
+Runs can be resumed and warm-started:
+
+- Resume: the model, optimizer and epoch are backed up to ``--checkpoint-dir`` after every epoch. Running the
+  same command again after an interruption continues from the last finished epoch. The backup is kept per
+  mode, warm-start model and vocabulary size, see ``backup_dir``.
+- Warm start: with ``--warm-start``, training starts from an existing model and tokenizer instead of from
+  scratch. Words of new rows are appended to the tokenizer, so the existing token ids and their embeddings
+  stay valid, and the embedding grows to the whole vocabulary, up to ``--max-words``, so the new words are
+  not dropped as rare.
+  This is meant for retraining after a few hundred products were added to the CSVs.
+
+Every epoch reports its wall time and training throughput in samples per second, also written to
+``training.csv`` in the checkpoint directory.
+
+Usage (from the repository root):
+    python -m model.nlp_model data_csv/data.csv
+    python -m model.nlp_model data_csv/data.csv data_csv/new_items.csv --warm-start model/model.h5
+"""
+
+import os
+import re
+import time
+import pickle
+import argparse
+
 import numpy as np
 import pandas as pd
-import pickle
 import tensorflow as tf
+import keras
+from keras.layers import LSTM, Dense, Embedding, Input
 from tensorflow.keras.preprocessing.text import Tokenizer
-from tensorflow.keras.preprocessing.sequence import pad_sequences
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Dense, Embedding, LSTM
-from tensorflow.keras.utils import to_categorical
 from sklearn.model_selection import train_test_split
 
+import nlp_runtime
+from prediction_cache import file_fingerprint
+from labels import UNIQUE_LABELS, canonical_label
 
-# Dataset
-data = pd.read_csv('data/data.csv')
 
-# Separate the features and the labels
-texts = data['nama']
-labels = data['kategori']
+# Vocabulary size of the tokenizer and input size of the embedding
+NUM_WORDS = 1000
 
+# Largest vocabulary a warm start grows the tokenizer and embedding to, see ``extend_tokenizer``
+MAX_WORDS = 5000
+EMBEDDING_DIM = 128
 
-# Convert labels to integers
-unique_labels = ['Clothing', 'Food', 'Stationery', 'Others', 'Toiletries', 'Medical & Healthcare', 'Entertainment']
-labels = [unique_labels.index(label) for label in labels]
+# Learning rate of the Adam optimizer, lower when fine-tuning existing weights
+LEARNING_RATE = 1e-3
+WARM_START_LEARNING_RATE = 3e-4
 
-# Tokenize the texts
-tokenizer = Tokenizer(num_words=1000)
-tokenizer.fit_on_texts(texts)
-sequences = tokenizer.texts_to_sequences(texts)
 
-# Pad the sequences
-data = pad_sequences(sequences, maxlen=100)
+def load_dataset(paths):
+    """
+    Read the item names and their category ids from CSV files with ``nama`` and ``kategori`` columns.
 
-# Convert labels to categorical
-labels = to_categorical(np.asarray(labels))
+    Rows repeated across files are kept once.
 
-# Split the data into a training set and a validation set
-x_train, x_val, y_train, y_val = train_test_split(data, labels, test_size=0.2)
+    Returns:
+        tuple: ``(texts, labels)``, a list of names and a NumPy array of indices into ``labels.UNIQUE_LABELS``.
 
+    Raises:
+        ValueError: If a row has a category that is neither a label nor an alias of one, see
+            ``labels.canonical_label``.
+    """
+    frame = pd.concat([pd.read_csv(path)[["nama", "kategori"]] for path in paths])
+    frame["kategori"] = frame["kategori"].map(canonical_label)
+    frame = frame.drop_duplicates()
+    labels = frame["kategori"].map(UNIQUE_LABELS.index).to_numpy(dtype=np.int32)
+    return frame["nama"].astype(str).tolist(), labels
 
-# Define the model
-model = Sequential()
-model.add(Embedding(1000, 128, input_length=100))
-model.add(Dense(128, activation='relu'))
-model.add(Dense(64, activation='relu'))
-model.add(LSTM(32, dropout=0.2, recurrent_dropout=0.2))
-model.add(Dense(7, activation='softmax'))
 
-# Compile the model
-model.compile(loss='categorical_crossentropy',
-              optimizer='adam',
-              metrics=['accuracy'])
+def extend_tokenizer(tokenizer, texts, max_words=MAX_WORDS):
+    """
+    Add the words of new texts to a fitted tokenizer without renumbering the existing ones.
 
-# Train the model
-# early_stopping = tf.keras.callbacks.EarlyStopping(monitor='val_accuracy', patience=10, restore_best_weights=True)
+    ``Tokenizer.fit_on_texts`` ranks all words by frequency again, which would move the token ids the
+    embedding was trained with. New words are appended after the existing ids instead, in order of frequency,
+    and ``num_words`` is raised to cover every word, see ``grow_embedding``, up to ``max_words``. Words past
+    the limit are kept in the tokenizer but dropped when encoding, like the rare words of a cold start.
 
-model.fit(x_train, y_train,
-          batch_size=32,
-          epochs=100,
-          validation_data=(x_val, y_val))
+    Args:
+        tokenizer (Tokenizer): The fitted Keras tokenizer, extended in place.
+        texts (list): The texts whose words are added.
+        max_words (int): Largest ``num_words`` the tokenizer is raised to. An existing larger one is kept.
 
+    Returns:
+        int: The number of new words.
+    """
+    counts = Tokenizer(
+        num_words=tokenizer.num_words, filters=tokenizer.filters, lower=tokenizer.lower, split=tokenizer.split
+    )
+    counts.fit_on_texts(texts)
 
-# Predict the category of a new item
-new_text = ['obat demam']
-sequences = tokenizer.texts_to_sequences(new_text)
-data = pad_sequences(sequences, maxlen=100)
-predictions = model.predict(data)
+    new_words = [word for word in counts.word_index if word not in tokenizer.word_index]
+    for word in new_words:
+        index = len(tokenizer.word_index) + 1
+        tokenizer.word_index[word] = index
+        tokenizer.index_word[index] = word
+    for word, count in counts.word_counts.items():
+        tokenizer.word_counts[word] = tokenizer.word_counts.get(word, 0) + count
+    needed = len(tokenizer.word_index) + 1
+    if needed > max_words:
+        print(f"Vocabulary of {needed} words exceeds the limit of {max_words}, the words past it are dropped")
+    tokenizer.num_words = max(tokenizer.num_words or 0, min(needed, max_words))
+    return len(new_words)
 
-# Get the category with the highest probability
-predicted_category = unique_labels[np.argmax(predictions)]
-print(predicted_category)
 
+def backup_dir(checkpoint_dir, warm_start, num_words):
+    """
+    Return the ``BackupAndRestore`` directory of a run.
 
-# Save the model
-model.save('model/model.h5')
+    A backup only fits a run with the same starting point and embedding size, so the directory is keyed on
+    the mode, the content of the warm-start model and the vocabulary size. An interrupted run is resumed by
+    the same command, while a run with other inputs starts fresh instead of restoring mismatched weights.
+    """
+    if warm_start:
+        key = f"warm-{file_fingerprint(warm_start)[:16]}-{num_words}"
+    else:
+        key = f"cold-{num_words}"
+    return os.path.join(checkpoint_dir, f"backup-{key}")
 
-# Save the tokenizer
-import pickle
-with open('model/tokenizer.pickle', 'wb') as handle:
-    pickle.dump(tokenizer, handle, protocol=pickle.HIGHEST_PROTOCOL)
\ No newline at end of file
+
+def grow_embedding(model, input_dim):
+    """
+    Return a copy of the model whose embedding has ``input_dim`` rows, keeping the trained rows and weights.
+
+    The added rows are freshly initialized, the model is returned unchanged if it is already large enough.
+    """
+    config = model.get_config()
+    layer = next(layer for layer in config["layers"] if layer["class_name"] == "Embedding")
+    if layer["config"]["input_dim"] >= input_dim:
+        return model
+    layer["config"]["input_dim"] = input_dim
+
+    grown = keras.Sequential.from_config(config)
+    weights = model.get_weights()
+    embeddings = weights[0]
+    weights[0] = np.concatenate([embeddings, grown.layers[0].get_weights()[0][len(embeddings) :]])
+    grown.set_weights(weights)
+    return grown
+
+
+def text_encoder(vocabulary):
+    """
+    Return a TensorFlow function turning one text into its padded token ids, like ``Vocabulary.encode``.
+
+    The text is lower-cased, the filter characters are replaced by the split character, unknown words are
+    dropped, and the ids are truncated and padded at the front to ``vocabulary.maxlen``.
+    """
+    table = tf.lookup.StaticHashTable(
+        tf.lookup.KeyValueTensorInitializer(
+            list(vocabulary.word_index), tf.constant(list(vocabulary.word_index.values()), dtype=tf.int32)
+        ),
+        default_value=0,
+    )
+    filters = f"[{re.escape(vocabulary.filters)}]" if vocabulary.filters else None
+    maxlen = vocabulary.maxlen
+
+    def encode(text):
+        if vocabulary.lower:
+            text = tf.strings.lower(text, encoding="utf-8")
+        if filters:
+            text = tf.strings.regex_replace(text, filters, vocabulary.split)
+        words = tf.strings.split(text, vocabulary.split)
+        ids = table.lookup(words)
+        ids = tf.boolean_mask(ids, ids > 0)[-maxlen:]
+        return tf.pad(ids, [[maxlen - tf.size(ids), 0]])
+
+    return encode
+
+
+def make_dataset(texts, labels, vocabulary, batch_size=32, shuffle=False, seed=0):
+    """
+    Build the input pipeline of one split.
+
+    The texts are tokenized in parallel on the first epoch and served from the cache afterwards.
+
+    Args:
+        texts (list): The item names.
+        labels (numpy.ndarray): Their category ids.
+        vocabulary (nlp_runtime.Vocabulary): The tokenizer settings and ``maxlen``.
+        batch_size (int): Samples per batch.
+        shuffle (bool): Reshuffle the samples every epoch, for the training split.
+        seed (int): Seed of the shuffle.
+
+    Returns:
+        tf.data.Dataset: Batches of ``(token_ids, one_hot_labels)``.
+    """
+    encode = text_encoder(vocabulary)
+    dataset = tf.data.Dataset.from_tensor_slices((texts, labels))
+    dataset = dataset.map(
+        lambda text, label: (encode(text), tf.one_hot(label, len(UNIQUE_LABELS))),
+        num_parallel_calls=tf.data.AUTOTUNE,
+    )
+    dataset = dataset.cache()
+    if shuffle:
+        dataset = dataset.shuffle(len(texts), seed=seed, reshuffle_each_iteration=True)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def build_model(maxlen, learning_rate=LEARNING_RATE):
+    """
+    Build and compile the classifier, see ``model.export_model.ARCHITECTURE``.
+    """
+    model = keras.Sequential(
+        [
+            Input(shape=(maxlen,)),
+            # Mask the padding so that it does not affect the LSTM state
+            Embedding(NUM_WORDS, EMBEDDING_DIM, mask_zero=True),
+            Dense(128, activation="relu"),
+            Dense(64, activation="relu"),
+            LSTM(32, dropout=0.2, recurrent_dropout=0.2),
+            Dense(len(UNIQUE_LABELS), activation="softmax"),
+        ]
+    )
+    compile_model(model, learning_rate)
+    return model
+
+
+def compile_model(model, learning_rate):
+    model.compile(
+        loss="categorical_crossentropy", optimizer=keras.optimizers.Adam(learning_rate), metrics=["accuracy"]
+    )
+
+
+class Throughput(keras.callbacks.Callback):
+    """
+    Report the wall time and training throughput of every epoch.
+
+    The values are added to the epoch logs as ``epoch_seconds`` and ``samples_per_second``, so callbacks
+    after this one, e.g. ``CSVLogger``, record them too.
+
+    Args:
+        samples (int): Number of training samples per epoch.
+    """
+
+    def __init__(self, samples):
+        super().__init__()
+        self.samples = samples
+        self._start = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = time.perf_counter() - self._start
+        if logs is not None:
+            logs["epoch_seconds"] = seconds
+            logs["samples_per_second"] = self.samples / seconds
+        print(f"Epoch {epoch + 1}: {seconds:.2f} s, {self.samples / seconds:.0f} samples/s")
+
+
+def save_model(model, path):
+    """
+    Save the model under a temporary name first, so an interrupted save never replaces a good model.
+    """
+    base, extension = os.path.splitext(path)
+    tmp_path = f"{base}.tmp{extension}"
+    model.save(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def train(
+    csv_paths,
+    model_path="model/model.h5",
+    tokenizer_path="model/tokenizer.pickle",
+    warm_start=None,
+    warm_start_tokenizer=None,
+    checkpoint_dir="model/checkpoints",
+    max_words=MAX_WORDS,
+    epochs=100,
+    batch_size=32,
+    patience=10,
+    learning_rate=None,
+    validation_split=0.2,
+    seed=0,
+):
+    """
+    Train the classifier and save it with its tokenizer.
+
+    Args:
+        csv_paths (list): CSV files with ``nama`` and ``kategori`` columns.
+        model_path (str): Where the trained model is saved.
+        tokenizer_path (str): Where the tokenizer pickle is saved.
+        warm_start (str): Optional model file to start from instead of random weights.
+        warm_start_tokenizer (str): Tokenizer pickle of the warm-start model, defaults to ``tokenizer_path``.
+        checkpoint_dir (str): Directory of the resumable backups and the per-epoch log, see ``backup_dir``.
+        max_words (int): Largest vocabulary a warm start grows to, see ``extend_tokenizer``.
+        epochs (int): Maximum number of epochs.
+        batch_size (int): Samples per batch.
+        patience (int): Epochs without a better ``val_accuracy`` before training stops.
+        learning_rate (float): Learning rate of Adam, defaults to ``LEARNING_RATE``, or
+            ``WARM_START_LEARNING_RATE`` when warm-starting.
+        validation_split (float): Fraction of the rows held out for validation, stratified by category unless
+            a category has a single row.
+        seed (int): Seed of the split and the shuffle. Keep it when resuming so the split stays the same.
+
+    Returns:
+        keras.callbacks.History: The training history of this run.
+    """
+    keras.utils.set_random_seed(seed)
+    texts, labels = load_dataset(csv_paths)
+
+    if warm_start:
+        with open(warm_start_tokenizer or tokenizer_path, "rb") as handle:
+            tokenizer = pickle.load(handle)
+        new_words = extend_tokenizer(tokenizer, texts, max_words)
+        model = grow_embedding(keras.models.load_model(warm_start), tokenizer.num_words)
+        compile_model(model, learning_rate or WARM_START_LEARNING_RATE)
+        maxlen = model.input_shape[1]
+        print(f"Warm start from {warm_start}: {new_words} new words, vocabulary of {tokenizer.num_words}")
+    else:
+        tokenizer = Tokenizer(num_words=NUM_WORDS)
+        tokenizer.fit_on_texts(texts)
+        # Pad the sequences to the longest name in the corpus, item names are only a few words long
+        maxlen = max(len(sequence) for sequence in tokenizer.texts_to_sequences(texts))
+        model = build_model(maxlen, learning_rate or LEARNING_RATE)
+
+    vocabulary = nlp_runtime.Vocabulary.from_tokenizer(tokenizer, maxlen)
+    # A stratified split needs at least two rows per category, e.g. warm-start CSVs can have a single one
+    single = [UNIQUE_LABELS[label] for label, count in enumerate(np.bincount(labels)) if count == 1]
+    if single:
+        print(f"Validation split not stratified, a single row of {', '.join(single)}")
+    x_train, x_val, y_train, y_val = train_test_split(
+        texts, labels, test_size=validation_split, random_state=seed, stratify=None if single else labels
+    )
+    train_data = make_dataset(x_train, y_train, vocabulary, batch_size, shuffle=True, seed=seed)
+    val_data = make_dataset(x_val, y_val, vocabulary, batch_size)
+    print(f"{len(x_train)} training and {len(x_val)} validation samples, maxlen {maxlen}")
+
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    callbacks = [
+        Throughput(len(x_train)),
+        keras.callbacks.EarlyStopping(monitor="val_accuracy", patience=patience, restore_best_weights=True),
+        keras.callbacks.BackupAndRestore(backup_dir(checkpoint_dir, warm_start, tokenizer.num_words)),
+        keras.callbacks.CSVLogger(os.path.join(checkpoint_dir, "training.csv"), append=True),
+    ]
+
+    start = time.perf_counter()
+    # The training dataset reshuffles itself every epoch
+    history = model.fit(
+        train_data, epochs=epochs, validation_data=val_data, callbacks=callbacks, shuffle=False, verbose=2
+    )
+    print(f"Trained {len(history.epoch)} epochs in {time.perf_counter() - start:.1f} s")
+
+    save_model(model, model_path)
+    with open(tokenizer_path, "wb") as handle:
+        pickle.dump(tokenizer, handle, protocol=pickle.HIGHEST_PROTOCOL)
+    print(f"Model saved to {model_path}, tokenizer to {tokenizer_path}")
+    return history
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the item category classifier.")
+    parser.add_argument("csv", nargs="*", default=["data_csv/data.csv"], help="CSV files with nama and kategori.")
+    parser.add_argument("--model", default="model/model.h5", help="Where the trained model is saved.")
+    parser.add_argument("--tokenizer", default="model/tokenizer.pickle", help="Where the tokenizer is saved.")
+    parser.add_argument("--warm-start", default=None, metavar="MODEL", help="Start from this trained model.")
+    parser.add_argument(
+        "--warm-start-tokenizer", default=None, help="Tokenizer of the warm-start model (default: --tokenizer)."
+    )
+    parser.add_argument("--checkpoint-dir", default="model/checkpoints", help="Backup directory for resuming.")
+    parser.add_argument(
+        "--max-words", type=int, default=MAX_WORDS, help="Largest vocabulary a warm start grows to."
+    )
+    parser.add_argument("--epochs", type=int, default=100, help="Maximum number of epochs.")
+    parser.add_argument("--batch-size", type=int, default=32, help="Samples per batch.")
+    parser.add_argument("--patience", type=int, default=10, help="Epochs without improvement before stopping.")
+    parser.add_argument("--learning-rate", type=float, default=None, help="Adam learning rate.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the validation split and the shuffle.")
+    args = parser.parse_args(argv)
+
+    train(
+        args.csv,
+        model_path=args.model,
+        tokenizer_path=args.tokenizer,
+        warm_start=args.warm_start,
+        warm_start_tokenizer=args.warm_start_tokenizer,
+        checkpoint_dir=args.checkpoint_dir,
+        max_words=args.max_words,
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        patience=args.patience,
+        learning_rate=args.learning_rate,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+"""
+Lightweight inference runtime for the item category classifier.
+
+Nothing in this module imports TensorFlow or Keras. It loads the files written by
+``python -m model.export_model``:
+
+- ``tokenizer.json``: the Keras tokenizer settings and its word index, see ``Vocabulary``.
+- ``model.npz``: the weights of the Embedding -> Dense -> Dense -> LSTM -> Dense stack, run with NumPy.
+- ``model.tflite``: the same model for the TFLite interpreter, if ``ai_edge_litert`` or ``tflite_runtime``
+  is installed.
+
+and the compressed variants written by ``python -m model.compress_model``:
+
+- ``model.int8.tflite``: the model with int8 weights, for the TFLite interpreter.
+- ``model.distilled.npz``: a smaller pooled-embedding model trained to reproduce the Keras model, see
+  ``PooledClassifier``, with int8 weights.
+
+Weights of a ``.npz`` file may be stored as int8 with a float32 ``<name>_scale`` per output column; they are
+dequantized when the file is loaded.
+
+The classifiers and the vocabulary mirror the Keras ``predict`` and ``texts_to_sequences`` signatures, so
+they can be used wherever the Keras model and tokenizer are.
+"""
+
+import json
+import itertools
+
+import numpy as np
+
+
+def pad_sequences(sequences, maxlen):
+    """
+    Pad or truncate token sequences at the front, like Keras ``pad_sequences`` with its defaults.
+
+    Args:
+        sequences (list): Lists of token ids.
+        maxlen (int): Length of the padded rows.
+
+    Returns:
+        numpy.ndarray: An ``int32`` matrix of shape ``(len(sequences), maxlen)``.
+    """
+    data = np.zeros((len(sequences), maxlen), dtype=np.int32)
+    for row, sequence in enumerate(sequences):
+        sequence = sequence[-maxlen:]
+        if sequence:
+            data[row, maxlen - len(sequence) :] = sequence
+    return data
+
+
+# Joins the texts of a batch for ``Vocabulary.encode``, batches that contain it are encoded text by text
+_TEXT_SEPARATOR = "\x1f"
+
+# Smaller batches are encoded text by text, where the fixed cost of the NumPy calls outweighs their savings
+ENCODE_MIN_BATCH = 32
+
+
+class Vocabulary:
+    """
+    Word index of a Keras ``Tokenizer``, reproducing its ``texts_to_sequences`` without Keras.
+
+    Besides the word index, the vocabulary compiles a lookup that also maps the batch separator of
+    ``encode`` to -1, so a whole batch of words is looked up in one ``map`` straight into a NumPy array.
+
+    Args:
+        word_index (dict): Mapping of words to token ids, only ids below ``num_words`` are used.
+        num_words (int): Vocabulary size of the tokenizer.
+        filters (str): Characters replaced by the split character before splitting.
+        lower (bool): Whether texts are lower-cased.
+        split (str): Word separator.
+        maxlen (int): Sequence length the model was trained with.
+    """
+
+    def __init__(self, word_index, num_words=None, filters="", lower=True, split=" ", maxlen=100):
+        self.num_words = num_words
+        self.filters = filters
+        self.lower = lower
+        self.split = split
+        self.maxlen = maxlen
+        self.word_index = {
+            word: index for word, index in word_index.items() if num_words is None or index < num_words
+        }
+        self._translate = str.maketrans({c: split for c in filters})
+        self._lookup = {**self.word_index, _TEXT_SEPARATOR: -1}.get
+
+    @classmethod
+    def from_tokenizer(cls, tokenizer, maxlen=100):
+        """
+        Build a vocabulary from a fitted Keras ``Tokenizer``.
+
+        Raises:
+            ValueError: If the tokenizer uses options the vocabulary does not reproduce.
+        """
+        if tokenizer.char_level or tokenizer.oov_token is not None:
+            raise ValueError("Only word-level tokenizers without an OOV token are supported.")
+
+        return cls(
+            tokenizer.word_index, tokenizer.num_words, tokenizer.filters, tokenizer.lower, tokenizer.split, maxlen
+        )
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a vocabulary written by ``save``.
+        """
+        with open(path) as f:
+            return cls(**json.load(f))
+
+    def save(self, path):
+        """
+        Write the vocabulary to a JSON file.
+        """
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "word_index": self.word_index,
+                    "num_words": self.num_words,
+                    "filters": self.filters,
+                    "lower": self.lower,
+                    "split": self.split,
+                    "maxlen": self.maxlen,
+                },
+                f,
+            )
+
+    def words(self, text):
+        """
+        Return the words of a text as the tokenizer splits it, before they are looked up.
+
+        Texts with the same words get the same token sequence, so their joined words can key a prediction.
+        """
+        if self.lower:
+            text = text.lower()
+        return [word for word in text.translate(self._translate).split(self.split) if word]
+
+    def texts_to_sequences(self, texts):
+        """
+        Convert texts to lists of token ids, dropping unknown words.
+
+        Args:
+            texts (list): The texts to convert.
+
+        Returns:
+            list: One list of token ids per text.
+        """
+        sequences = []
+        for text in texts:
+            if self.lower:
+                text = text.lower()
+            words = text.translate(self._translate).split(self.split)
+            sequences.append([self.word_index[word] for word in words if word in self.word_index])
+        return sequences
+
+    def encode(self, texts, maxlen=None):
+        """
+        Convert texts straight to the padded model input, like ``pad_sequences(texts_to_sequences(texts))``.
+
+        The whole batch is lower-cased, filtered and split as one string, its words are looked up into one
+        ``int32`` array without building a list per text, and the rows are padded with a single scatter.
+        The result is identical to the Keras tokenizer and ``pad_sequences``. Batches of fewer than
+        ``ENCODE_MIN_BATCH`` texts go through ``texts_to_sequences``, which is faster for them.
+
+        Args:
+            texts (list): The texts to convert.
+            maxlen (int): Length of the padded rows, defaults to the length the model was trained with.
+
+        Returns:
+            numpy.ndarray: An ``int32`` matrix of shape ``(len(texts), maxlen)``, padded and truncated at the
+                front.
+        """
+        maxlen = maxlen or self.maxlen
+        if len(texts) < ENCODE_MIN_BATCH:
+            return pad_sequences(self.texts_to_sequences(texts), maxlen)
+
+        text = f"{self.split}{_TEXT_SEPARATOR}{self.split}".join(texts)
+        if text.count(_TEXT_SEPARATOR) != len(texts) - 1 or _TEXT_SEPARATOR in self.filters + self.split:
+            return pad_sequences(self.texts_to_sequences(texts), maxlen)
+
+        if self.lower:
+            text = text.lower()
+        words = text.translate(self._translate).split(self.split)
+
+        # Token id of every word, 0 for unknown words and -1 for the separators between texts
+        ids = np.fromiter(map(self._lookup, words, itertools.repeat(0)), dtype=np.int32, count=len(words))
+
+        # Row of every known word, and its position counted from the end of its row
+        rows = np.cumsum(ids == -1)
+        keep = ids > 0
+        rows, ids = rows[keep], ids[keep]
+        counts = np.bincount(rows, minlength=len(texts))
+        starts = np.cumsum(counts) - counts
+        from_end = counts[rows] - 1 - (np.arange(len(rows)) - starts[rows])
+
+        # Keep the last maxlen words of every row, aligned to the right
+        data = np.zeros((len(texts), maxlen), dtype=np.int32)
+        fits = from_end < maxlen
+        data[rows[fits], maxlen - 1 - from_end[fits]] = ids[fits]
+        return data
+
+
+# Entries of an exported ``.npz`` file that are settings rather than weights
+_SETTINGS = ("mask_zero", "architecture")
+
+# Suffix of the per-column scales of an int8 weight
+_SCALE_SUFFIX = "_scale"
+
+
+def _load_weights(path):
+    """
+    Load the weights of an exported ``.npz`` file as float32, dequantizing int8 weights with their scales.
+
+    Returns:
+        tuple: ``(weights, settings)``, two dicts keyed by the names in the file.
+    """
+    with np.load(path) as data:
+        settings = {name: data[name].item() for name in _SETTINGS if name in data.files}
+        weights = {}
+        for name in data.files:
+            if name in _SETTINGS or name.endswith(_SCALE_SUFFIX):
+                continue
+            weight = data[name].astype(np.float32)
+            if name + _SCALE_SUFFIX in data.files:
+                weight *= data[name + _SCALE_SUFFIX]
+            weights[name] = weight
+    return weights, settings
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class NumpyClassifier:
+    """
+    NumPy implementation of the Embedding -> Dense(relu) -> Dense(relu) -> LSTM -> Dense(softmax) classifier.
+
+    Item names are only a few tokens long, so almost all of the padded timesteps are padding. With
+    ``dynamic_length`` (the default) those steps are not computed per row:
+
+    - Without masking, every padding step feeds the LSTM the same input, so the state after ``k`` leading
+      padding steps is the same for every row. It is precomputed once for every ``k``, and each row only
+      runs its real tokens, starting from that state.
+    - With masking (``mask_zero`` embeddings), padding steps leave the state unchanged, so rows start from
+      the zero state.
+
+    Rows are bucketed by their number of tokens, so every bucket runs exactly as many steps as its rows have
+    tokens. The probabilities are the same as running all ``maxlen`` steps, up to float rounding.
+
+    Args:
+        path (str): Path to the ``.npz`` weights written by ``model.export_model``.
+        dynamic_length (bool): Skip the padding steps as described above, instead of running all of them.
+    """
+
+    def __init__(self, path, dynamic_length=True):
+        self.weights, settings = _load_weights(path)
+        # Exports from before masking was supported have no flag and were trained without a mask
+        self.mask_zero = bool(settings.get("mask_zero", False))
+        self.dynamic_length = dynamic_length
+        self._padding_states = {}
+
+    def predict(self, data, batch_size=None, verbose=0):
+        """
+        Compute the class probabilities of padded token sequences.
+
+        Args:
+            data (numpy.ndarray): Token ids of shape ``(batch, maxlen)``, padded at the front with zeros.
+            batch_size (int): Number of rows computed at once, defaults to all of them.
+            verbose (int): Ignored, accepted for compatibility with Keras ``predict``.
+
+        Returns:
+            numpy.ndarray: Probabilities of shape ``(batch, classes)``.
+        """
+        data = np.asarray(data, dtype=np.int64)
+        batch_size = batch_size or max(len(data), 1)
+        forward = self._forward_dynamic if self.dynamic_length else self._forward
+        outputs = [forward(data[start : start + batch_size]) for start in range(0, len(data), batch_size)]
+        if not outputs:
+            return np.zeros((0, self.weights["output_bias"].shape[0]), dtype=np.float32)
+        return np.concatenate(outputs)
+
+    def _gates(self, ids):
+        # Input contribution to the LSTM gates of every timestep at once
+        w = self.weights
+        x = w["embeddings"][ids]
+        x = np.maximum(x @ w["dense1_kernel"] + w["dense1_bias"], 0)
+        x = np.maximum(x @ w["dense2_kernel"] + w["dense2_bias"], 0)
+        return x @ w["lstm_kernel"] + w["lstm_bias"]
+
+    def _step(self, gates_x, h, c):
+        # Keras orders the gates as input, forget, cell, output
+        units = h.shape[1]
+        z = gates_x + h @ self.weights["lstm_recurrent_kernel"]
+        i = _sigmoid(z[:, :units])
+        f = _sigmoid(z[:, units : 2 * units])
+        g = np.tanh(z[:, 2 * units : 3 * units])
+        o = _sigmoid(z[:, 3 * units :])
+        c = f * c + i * g
+        h = o * np.tanh(c)
+        return h, c
+
+    def _output(self, h):
+        logits = h @ self.weights["output_kernel"] + self.weights["output_bias"]
+        logits = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return logits / logits.sum(axis=1, keepdims=True)
+
+    def _zero_state(self, rows):
+        units = self.weights["lstm_recurrent_kernel"].shape[0]
+        return np.zeros((rows, units), dtype=np.float32), np.zeros((rows, units), dtype=np.float32)
+
+    def _forward(self, ids):
+        gates_x = self._gates(ids)
+        h, c = self._zero_state(len(ids))
+        for t in range(ids.shape[1]):
+            h_next, c_next = self._step(gates_x[:, t], h, c)
+            if self.mask_zero:
+                keep = (ids[:, t] == 0)[:, None]
+                h_next, c_next = np.where(keep, h, h_next), np.where(keep, c, c_next)
+            h, c = h_next, c_next
+        return self._output(h)
+
+    def _padding_state(self, steps):
+        """
+        LSTM state after ``steps`` leading padding timesteps, computed once per number of steps.
+        """
+        if steps not in self._padding_states:
+            h, c = self._zero_state(1)
+            if not self.mask_zero and steps:
+                previous = max((k for k in self._padding_states if k < steps), default=0)
+                if previous:
+                    h, c = self._padding_states[previous]
+                gates_x = self._gates(np.zeros((1, 1), dtype=np.int64))[:, 0]
+                for _ in range(steps - previous):
+                    h, c = self._step(gates_x, h, c)
+            self._padding_states[steps] = (h, c)
+        return self._padding_states[steps]
+
+    def _forward_dynamic(self, ids):
+        maxlen = ids.shape[1]
+        nonzero = ids != 0
+        lengths = np.where(nonzero.any(axis=1), maxlen - nonzero.argmax(axis=1), 0)
+
+        outputs = np.empty((len(ids), self.weights["output_bias"].shape[0]), dtype=np.float32)
+        for length in np.unique(lengths):
+            rows = np.flatnonzero(lengths == length)
+            h, c = self._padding_state(maxlen - length)
+            h, c = np.repeat(h, len(rows), axis=0), np.repeat(c, len(rows), axis=0)
+            if length:
+                gates_x = self._gates(ids[rows, maxlen - length :])
+                for t in range(length):
+                    h, c = self._step(gates_x[:, t], h, c)
+            outputs[rows] = self._output(h)
+
+        return outputs
+
+
+class PooledClassifier:
+    """
+    NumPy implementation of the distilled Embedding -> masked average pooling -> Dense(relu) -> Dense(softmax)
+    classifier written by ``model.compress_model``.
+
+    The embeddings of the tokens of every name are averaged, ignoring padding, so there is no per-timestep
+    work besides the embedding lookup. Names without known tokens get a zero average.
+
+    Args:
+        path (str): Path to the ``.npz`` weights.
+    """
+
+    def __init__(self, path):
+        self.weights, _ = _load_weights(path)
+
+    def predict(self, data, batch_size=None, verbose=0):
+        """
+        Compute the class probabilities of padded token sequences, see ``NumpyClassifier.predict``.
+        """
+        data = np.asarray(data, dtype=np.int64)
+        batch_size = batch_size or max(len(data), 1)
+        outputs = [self._forward(data[start : start + batch_size]) for start in range(0, len(data), batch_size)]
+        if not outputs:
+            return np.zeros((0, self.weights["output_bias"].shape[0]), dtype=np.float32)
+        return np.concatenate(outputs)
+
+    def _forward(self, ids):
+        w = self.weights
+        # Only the few real tokens of every row are looked up, in row order, and summed per row
+        rows, columns = np.nonzero(ids)
+        pooled = np.zeros((len(ids), w["embeddings"].shape[1]), dtype=np.float32)
+        if len(rows):
+            starts = np.flatnonzero(np.diff(rows, prepend=-1))
+            pooled[rows[starts]] = np.add.reduceat(w["embeddings"][ids[rows, columns]], starts, axis=0)
+        pooled /= np.maximum(np.bincount(rows, minlength=len(ids)), 1)[:, None]
+        x = np.maximum(pooled @ w["hidden_kernel"] + w["hidden_bias"], 0)
+        logits = x @ w["output_kernel"] + w["output_bias"]
+        logits = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return logits / logits.sum(axis=1, keepdims=True)
+
+
+class TFLiteClassifier:
+    """
+    Run the exported ``.tflite`` classifier with the standalone TFLite interpreter.
+
+    The model is exported with a fixed batch size, so inputs are fed in chunks of that size and the last
+    chunk is padded.
+
+    Args:
+        path (str): Path to the ``.tflite`` file written by ``model.export_model``.
+
+    Raises:
+        ImportError: If neither ``ai_edge_litert`` nor ``tflite_runtime`` is installed.
+    """
+
+    def __init__(self, path):
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            from tflite_runtime.interpreter import Interpreter
+
+        self.interpreter = Interpreter(model_path=path)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self.batch_size = int(self._input["shape"][0])
+
+    def predict(self, data, batch_size=None, verbose=0):
+        """
+        Compute the class probabilities of padded token sequences.
+
+        Args:
+            data (numpy.ndarray): Token ids of shape ``(batch, maxlen)``.
+            batch_size (int): Ignored, the batch size is fixed by the exported model.
+            verbose (int): Ignored, accepted for compatibility with Keras ``predict``.
+
+        Returns:
+            numpy.ndarray: Probabilities of shape ``(batch, classes)``.
+        """
+        data = np.asarray(data, dtype=self._input["dtype"])
+        outputs = []
+        for start in range(0, len(data), self.batch_size):
+            chunk = data[start : start + self.batch_size]
+            padded = np.zeros((self.batch_size, data.shape[1]), dtype=data.dtype)
+            padded[: len(chunk)] = chunk
+            self.interpreter.set_tensor(self._input["index"], padded)
+            self.interpreter.invoke()
+            outputs.append(self.interpreter.get_tensor(self._output["index"])[: len(chunk)].copy())
+
+        if not outputs:
+            return np.zeros((0, self._output["shape"][1]), dtype=np.float32)
+        return np.concatenate(outputs)
+
+
+def load_classifier(path):
+    """
+    Load an exported classifier, choosing the runtime from the file extension.
+
+    Args:
+        path (str): Path to a ``.npz`` or ``.tflite`` file.
+
+    Returns:
+        NumpyClassifier, PooledClassifier or TFLiteClassifier: The loaded classifier.
+
+    Raises:
+        ValueError: If the extension is not recognized.
+    """
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            architecture = data["architecture"].item() if "architecture" in data.files else "lstm"
+        return PooledClassifier(path) if architecture == "pooled" else NumpyClassifier(path)
+    if path.endswith(".tflite"):
+        return TFLiteClassifier(path)
+    raise ValueError(f"Unknown classifier format {path!r}, expected a .npz or .tflite file.")
@@ -1,52 +1,566 @@
+"""
+Read receipt images with Tesseract and classify their items with the category model.
+
+Importing this module is cheap: Keras (and with it TensorFlow) is only imported when a ``ReceiptProcessor``
+loads a Keras model, and pytesseract on the first Tesseract call, so a short-lived worker or CLI that never
+needs them does not pay several seconds for them. ``warm_up`` loads the shared processor and runs a first
+prediction in a background thread, so a server can accept connections in the meantime.
+
+Usage:
+    python ocr_model.py data/receipt_09.jpg -o data/ocr_result.json
+"""
+
+import os
 import cv2
+import sys
 import json
-import pytesseract
 import pickle
+import time
+import hashlib
+import inspect
+import queue
+import shlex
+import argparse
+import threading
+import functools
 import numpy as np
-from keras.models import load_model
-from keras.preprocessing.sequence import pad_sequences
+from concurrent.futures import Future, ThreadPoolExecutor
+import nlp_runtime
+from preprocessing import ROI_METHODS, find_lines, find_rois, select_roi
+from image_io import load_image, read_encoded
+from prediction_cache import file_fingerprint
+from instrumentation import NULL_METRICS, Metrics
+from receipt_parser import UNRECOGNIZED, parse_receipt_text
+from result_store import content_hash
+from labels import UNIQUE_LABELS
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+
+# Custom config for pytesseract
+OCR_CONFIG = r"--psm 6 oem 3"
+
+# Configs for line-level OCR, where every image holds a single text line
+OCR_LINE_CONFIG = r"--psm 7 --oem 3"
+OCR_NUMBER_CONFIG = r"--psm 7 --oem 3 -c tessedit_char_whitelist=0123456789,"
+
+# OCR modes: the whole ROI in one call, one call per text line, or one call per column of every line
+OCR_MODES = ("block", "lines", "columns")
 
+# x offsets, in image coordinates, at which the quantity, price and total columns start
+RECEIPT_GEN_COLUMNS = (470, 545, 670)  # receiptGen.py, 800 px wide receipts
+CREATE_IMG_COLUMNS = (270, 345, 470)  # createIMG.py, 600 px wide receipts
 
-def process_receipt(image_path, model_path, tokenizer_path, output_json_path):
+# Pixels to the left of a column start at which the previous column is cut off
+COLUMN_MARGIN = 8
+
+# OCR backends: tesseract subprocesses through pytesseract, a pool of in-process tesserocr engines, or
+# tesserocr when it is installed and pytesseract otherwise
+OCR_BACKENDS = ("pytesseract", "tesserocr", "auto")
+
+# Number of item names classified per forward pass of the model
+PREDICT_BATCH_SIZE = 256
+
+# Classifier variants selectable by name, as (model_path, tokenizer_path): the Keras model, its exports for
+# ``nlp_runtime`` (``model.export_model``) and its int8 and distilled versions (``model.compress_model``)
+MODEL_VARIANTS = {
+    "keras": ("model/model.h5", "model/tokenizer.pickle"),
+    "numpy": ("model/model.npz", "model/tokenizer.json"),
+    "tflite": ("model/model.tflite", "model/tokenizer.json"),
+    "int8": ("model/model.int8.tflite", "model/tokenizer.json"),
+    "distilled": ("model/model.distilled.npz", "model/tokenizer.json"),
+}
+
+def parse_ocr_config(config):
     """
-    Process a receipt image, predict item categories using a pre-trained NLP model, and save the results to a JSON file.
+    Split a tesseract command line config into its page segmentation mode, engine mode and variables.
 
     Args:
-        image_path (str): Path to the receipt image file.
-        model_path (str): Path to the pre-trained Keras model file.
-        tokenizer_path (str): Path to the tokenizer pickle file.
-        output_json_path (str): Path to the output JSON file to save the results.
+        config (str): A config such as ``OCR_CONFIG``, e.g. ``"--psm 7 --oem 3 -c name=value"``.
+
+    Returns:
+        tuple: ``(psm, oem, variables)``, where psm and oem are None when not set and variables is a dict.
+    """
+    psm, oem, variables = None, None, {}
+    args = shlex.split(config)
+    for flag, value in zip(args, args[1:]):
+        if flag == "--psm":
+            psm = int(value)
+        elif flag in ("--oem", "oem"):
+            oem = int(value)
+        elif flag == "-c" and "=" in value:
+            name, value = value.split("=", 1)
+            variables[name] = value
+
+    return psm, oem, variables
+
+
+class PytesseractBackend:
+    """
+    OCR backend that runs the tesseract command line through pytesseract.
+
+    Every call starts a new tesseract process and passes the image through a temporary file.
+    """
+
+    name = "pytesseract"
+
+    def image_to_string(self, image, config=OCR_CONFIG):
+        """
+        Recognize the text in an image.
+
+        Args:
+            image (numpy.ndarray): The image to read.
+            config (str): Custom config passed to tesseract.
+
+        Returns:
+            str: The recognized text.
+        """
+        # Imported on first use, see the module docstring
+        import pytesseract
+
+        return pytesseract.image_to_string(image, config=config)
+
+    def close(self):
+        pass
+
+
+class TesserocrBackend:
+    """
+    OCR backend that keeps a pool of warm tesserocr engines and passes images to them in memory.
+
+    Engines are created on demand, up to ``size`` per engine mode and variable set, and are reused by later
+    calls, so the traineddata is only loaded once per engine. Calls from several threads run concurrently,
+    each on its own engine; tesserocr releases the GIL while recognizing.
+
+    Args:
+        size (int): Maximum number of engines per configuration, defaults to the number of cores.
+        lang (str): Tesseract language.
+        path (str): Path to the tessdata directory, or None for the tesserocr default.
 
     Raises:
-        ValueError: If no suitable Region of Interest (ROI) is found in the image.
+        ImportError: If tesserocr is not installed.
     """
 
-    # Custom config for pytesseract
-    myconfig = r"--psm 6 oem 3"
+    name = "tesserocr"
+
+    def __init__(self, size=None, lang="eng", path=None):
+        if tesserocr is None:
+            raise ImportError("The tesserocr OCR backend needs the tesserocr package.")
+
+        self.size = size or os.cpu_count() or 1
+        self.lang = lang
+        self.path = path
+        self._pools = {}
+        self._created = {}
+        self._lock = threading.Lock()
+
+    def _new_engine(self, oem, variables):
+        kwargs = {"lang": self.lang}
+        if self.path is not None:
+            kwargs["path"] = self.path
+        if oem is not None:
+            kwargs["oem"] = oem
+        engine = tesserocr.PyTessBaseAPI(**kwargs)
+        for name, value in variables:
+            engine.SetVariable(name, value)
+        return engine
+
+    def _acquire(self, key):
+        with self._lock:
+            pool = self._pools.setdefault(key, queue.LifoQueue())
+            try:
+                return pool.get_nowait()
+            except queue.Empty:
+                if self._created.get(key, 0) < self.size:
+                    self._created[key] = self._created.get(key, 0) + 1
+                    create = True
+                else:
+                    create = False
+
+        return self._new_engine(*key) if create else pool.get()
+
+    def image_to_string(self, image, config=OCR_CONFIG):
+        """
+        Recognize the text in an image.
+
+        Args:
+            image (numpy.ndarray): The BGR or grayscale image to read.
+            config (str): Tesseract command line config; ``--psm``, ``--oem`` and ``-c`` options are honored.
+
+        Returns:
+            str: The recognized text.
+        """
+        psm, oem, variables = parse_ocr_config(config)
+        key = (oem, tuple(sorted(variables.items())))
+
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else np.ascontiguousarray(image)
+        height, width = gray.shape
+
+        engine = self._acquire(key)
+        try:
+            engine.SetPageSegMode(tesserocr.PSM.SINGLE_BLOCK if psm is None else psm)
+            engine.SetImageBytes(gray.tobytes(), width, height, 1, width)
+            return engine.GetUTF8Text()
+        finally:
+            engine.Clear()
+            self._pools[key].put(engine)
+
+    def close(self):
+        """
+        End every idle engine in the pool.
+        """
+        with self._lock:
+            for pool in self._pools.values():
+                while not pool.empty():
+                    pool.get_nowait().End()
+            self._pools.clear()
+            self._created.clear()
+
+
+@functools.lru_cache(maxsize=None)
+def get_ocr_backend(name="auto"):
+    """
+    Return the shared OCR backend of this process.
 
-    # Load the pre-trained model
-    loaded_model = load_model(model_path)
+    Args:
+        name (str): One of ``OCR_BACKENDS``. ``"auto"`` picks tesserocr when it is installed and falls back to
+            pytesseract otherwise.
 
-    # Load the tokenizer
-    with open(tokenizer_path, "rb") as handle:
-        loaded_tokenizer = pickle.load(handle)
+    Returns:
+        PytesseractBackend or TesserocrBackend: The backend, created on first use.
 
-    # Define the unique labels for classification
-    unique_labels = [
-        "Clothing",
-        "Food",
-        "Stationery",
-        "Others",
-        "Toiletries",
-        "Medical and Health Care",
-        "Entertainment",
-    ]
+    Raises:
+        ValueError: If ``name`` is not one of ``OCR_BACKENDS``.
+    """
+    if name not in OCR_BACKENDS:
+        raise ValueError(f"Unknown OCR backend {name!r}, expected one of {OCR_BACKENDS}.")
+
+    if name == "tesserocr" or (name == "auto" and tesserocr is not None):
+        return TesserocrBackend()
+    return PytesseractBackend()
+
+
+@functools.lru_cache(maxsize=None)
+def tesseract_version():
+    """
+    Return the version of the Tesseract binary, or ``"unknown"`` if it cannot be run.
+    """
+    import pytesseract
+
+    try:
+        return str(pytesseract.get_tesseract_version())
+    except (pytesseract.TesseractNotFoundError, OSError):
+        return "unknown"
+
+
+def _ocr_line_tasks(roi, ocr_mode, columns):
+    """
+    Split a ROI into the images to OCR for the line and column modes.
+
+    Returns:
+        list: For every text line, a list of ``(image, config)`` pairs whose text is joined with spaces.
+    """
+    lines = find_lines(roi.image)
+    cuts = [max(0, x - roi.x - COLUMN_MARGIN) for x in columns]
+    text_height = float(np.median([line.h for line in lines])) if lines else 0.0
+
+    tasks = []
+    for line in lines:
+        # Dashed separators are much flatter than text, and the Total row leaves the name column empty.
+        # Neither follows the column layout, so they are read as a whole line.
+        if (
+            ocr_mode == "lines"
+            or line.h < 0.6 * text_height
+            or line.image[:, : cuts[0]].min() >= 128
+        ):
+            tasks.append([(line.image, OCR_LINE_CONFIG)])
+            continue
+
+        bounds = [0, *cuts, line.w]
+        bands = [line.image[:, start:end] for start, end in zip(bounds, bounds[1:])]
+        tasks.append([(bands[0], OCR_LINE_CONFIG)] + [(band, OCR_NUMBER_CONFIG) for band in bands[1:]])
+
+    return tasks
+
+
+def ocr_roi(
+    roi,
+    ocr_config=OCR_CONFIG,
+    ocr_mode="block",
+    columns=RECEIPT_GEN_COLUMNS,
+    ocr_threads=None,
+    ocr_backend="auto",
+):
+    """
+    Extract the text of a ROI with Tesseract.
+
+    In ``"block"`` mode the whole ROI is read in one call with ``ocr_config``. In ``"lines"`` mode the ROI is
+    split into text lines that are read concurrently with ``--psm 7``. ``"columns"`` additionally splits every
+    item line into name, quantity, price and total bands at the given x offsets, and reads the numeric bands
+    with a digit whitelist. Tesseract runs as a subprocess, so the calls overlap in a thread pool.
+
+    Args:
+        roi (Roi): The ROI, as returned by ``preprocessing.select_roi``.
+        ocr_config (str): Custom config passed to pytesseract in block mode.
+        ocr_mode (str): One of ``OCR_MODES``.
+        columns (tuple): x offsets, in image coordinates, of the quantity, price and total columns.
+        ocr_threads (int): Number of concurrent Tesseract calls, defaults to the thread pool default.
+        ocr_backend (str): One of ``OCR_BACKENDS``, see ``get_ocr_backend``.
+
+    Returns:
+        str: The recognized text, one receipt line per text line, in reading order.
+
+    Raises:
+        ValueError: If ``ocr_mode`` is not one of ``OCR_MODES``.
+    """
+    if ocr_mode not in OCR_MODES:
+        raise ValueError(f"Unknown OCR mode {ocr_mode!r}, expected one of {OCR_MODES}.")
+
+    backend = get_ocr_backend(ocr_backend)
+    if ocr_mode == "block":
+        return backend.image_to_string(roi.image, config=ocr_config)
+
+    tasks = _ocr_line_tasks(roi, ocr_mode, columns)
+    flat = [task for line in tasks for task in line]
+    with ThreadPoolExecutor(max_workers=ocr_threads) as executor:
+        texts = list(executor.map(lambda task: backend.image_to_string(task[0], config=task[1]).strip(), flat))
+
+    # Merge the results back in reading order
+    lines = []
+    for line in tasks:
+        lines.append(" ".join(text for text in texts[: len(line)] if text))
+        texts = texts[len(line) :]
+
+    return "\n".join(lines)
+
+
+def read_items(
+    image,
+    ocr_config=OCR_CONFIG,
+    max_width=None,
+    ocr_mode="block",
+    columns=RECEIPT_GEN_COLUMNS,
+    ocr_backend="auto",
+    metrics=None,
+    reduce=1,
+    grayscale=False,
+    roi_method="contours",
+):
+    """
+    Run OCR on a receipt image and parse its line items, without classifying them.
+
+    This needs no model, so it can run in worker processes while classification stays in one place.
+
+    Args:
+        image: Path to the receipt image file, its encoded bytes, a binary file-like object, a ``"<pack>#<key>"``
+            reference or an already decoded BGR image, see ``image_io.load_image``.
+        ocr_config (str): Custom config passed to pytesseract.
+        max_width (int): Downscale wider images to this width for the ROI search, see ``preprocessing.find_rois``.
+        ocr_mode (str): How the ROI is split into Tesseract calls, see ``ocr_roi``.
+        columns (tuple): x offsets of the quantity, price and total columns, used in ``"columns"`` mode.
+        ocr_backend (str): The OCR backend, one of ``OCR_BACKENDS``.
+        metrics (instrumentation.Metrics): If given, the time of the ``decode``, ``preprocess``, ``ocr`` and
+            ``parse`` stages and the ``roi_candidates``, ``ocr_lines``, ``items_parsed`` and ``lines_dropped``
+            counters are added to it.
+        reduce (int): Decode encoded images at 1/1, 1/2, 1/4 or 1/8 resolution, for scans much larger than
+            the text needs. Coordinates such as ``columns`` are in the reduced image.
+        grayscale (bool): Decode encoded images straight to grayscale.
+        roi_method (str): How the ROI is found, one of ``preprocessing.ROI_METHODS``: ``"contours"`` of the
+            dilated text, or ``"projection"`` profiles, which is faster on large images.
+
+    Returns:
+        dict: The parsed receipt, ``{"items": [...], "totals": int, "errors": [...]}``, with every item category
+            set to None. Lines that cannot be parsed are skipped and reported in ``errors`` together with
+            the other problems found by ``receipt_parser.parse_receipt_text``; ``totals`` is 0 without a
+            Total line.
+
+    Raises:
+        ValueError: If the image cannot be read or no suitable Region of Interest (ROI) is found.
+    """
+    metrics = metrics or NULL_METRICS
 
     # Load the receipt image
-    img = cv2.imread(image_path)
-    base_image = img.copy()
+    with metrics.timer("decode"):
+        img = load_image(image, reduce, grayscale)
+
+    # Find the Region of Interest (ROI) containing the receipt text
+    with metrics.timer("preprocess"):
+        rois = find_rois(img, max_width=max_width, method=roi_method)
+    metrics.count("roi_candidates", len(rois))
+    roi = select_roi(rois)
+
+    # Perform OCR on the ROI to extract text
+    with metrics.timer("ocr"):
+        ocr_result = ocr_roi(roi, ocr_config, ocr_mode, columns, ocr_backend=ocr_backend)
+
+    with metrics.timer("parse"):
+        parsed = parse_receipt_text(ocr_result)
+
+    metrics.count("ocr_lines", len(parsed.lines))
+    metrics.count("items_parsed", len(parsed.items))
+    metrics.count("lines_dropped", sum(line.kind == UNRECOGNIZED for line in parsed.lines))
+
+    # The category is filled in by ReceiptProcessor.classify_receipts
+    totals = parsed.totals if parsed.totals is not None else 0
+    return {"items": parsed.items, "totals": totals, "errors": parsed.errors}
+
+
+def result_version(model_path, tokenizer_path, catalog=None, **read_options):
+    """
+    Return the version of everything the result of a receipt image depends on, see ``result_store``.
+
+    Args:
+        model_path (str): Path to the classifier model file.
+        tokenizer_path (str): Path to the tokenizer file.
+        catalog (catalog.Catalog): The catalog consulted before the model, if any.
+        **read_options: Keyword arguments of ``read_items``, the others count with their defaults.
+
+    Returns:
+        str: A hex digest that changes whenever the model, tokenizer, catalog, Tesseract or an OCR option does.
+    """
+    options = {
+        name: parameter.default
+        for name, parameter in inspect.signature(read_items).parameters.items()
+        if parameter.default is not inspect.Parameter.empty and name != "metrics"
+    }
+    options.update(read_options)
+    parts = {
+        "model": file_fingerprint(model_path, tokenizer_path),
+        "catalog": catalog.fingerprint() if catalog is not None else None,
+        "tesseract": tesseract_version(),
+        "read_options": options,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ReceiptProcessor:
+    """
+    Long-lived receipt processor that owns the loaded Keras model, tokenizer and label list.
+
+    Loading the model and unpickling the tokenizer is done once in the constructor, so a worker
+    that processes many receipts only pays the TensorFlow startup and weight load a single time.
+
+    The model may also be a ``.npz`` or ``.tflite`` file and the tokenizer a ``.json`` file written by
+    ``python -m model.export_model``, in which case they run on ``nlp_runtime`` instead of Keras.
+
+    Args:
+        model_path (str): Path to the pre-trained Keras model file, or an exported ``.npz``/``.tflite`` model.
+        tokenizer_path (str): Path to the tokenizer pickle file, or an exported ``tokenizer.json``.
+        labels (list): Category labels, in the order of the model outputs.
+        ocr_config (str): Custom config passed to pytesseract.
+        max_width (int): Downscale wider images to this width for the ROI search, None to disable.
+        ocr_mode (str): How the ROI is split into Tesseract calls, one of ``OCR_MODES``.
+        columns (tuple): x offsets of the quantity, price and total columns, used in ``"columns"`` mode.
+        ocr_backend (str): The OCR backend, one of ``OCR_BACKENDS``.
+        reduce (int): Decode encoded images at 1/1, 1/2, 1/4 or 1/8 resolution, see ``read_items``.
+        grayscale (bool): Decode encoded images straight to grayscale.
+        roi_method (str): How the ROI is found, one of ``preprocessing.ROI_METHODS``.
+        batch_size (int): Number of item names classified per forward pass of the model.
+        cache (PredictionCache): Optional prediction cache consulted before the model. It is bound to the
+            fingerprint of the model and tokenizer files, so stale entries are dropped when they change.
+        instrumentation (instrumentation.Instrumentation): Optional per-stage timers and counters, recorded
+            for every receipt processed with ``process`` or ``process_many``.
+        catalog (catalog.Catalog): Optional catalog of known item names, consulted before the cache and the
+            model. Names it matches confidently are not sent to the model.
+        result_store (result_store.ResultStore): Optional store of processed receipts. ``process`` returns the
+            stored result of an image it has seen before without decoding it. It is bound to the
+            ``result_version`` of this processor. A store can also be passed to ``process`` per call, e.g. for
+            the processor shared through ``get_processor``.
+    """
+
+    def __init__(
+        self,
+        model_path,
+        tokenizer_path,
+        labels=UNIQUE_LABELS,
+        ocr_config=OCR_CONFIG,
+        max_width=None,
+        ocr_mode="block",
+        columns=RECEIPT_GEN_COLUMNS,
+        ocr_backend="auto",
+        reduce=1,
+        grayscale=False,
+        roi_method="contours",
+        batch_size=PREDICT_BATCH_SIZE,
+        cache=None,
+        instrumentation=None,
+        catalog=None,
+        result_store=None,
+    ):
+        # Load the pre-trained model
+        if model_path.endswith((".npz", ".tflite")):
+            self.model = nlp_runtime.load_classifier(model_path)
+        else:
+            # Imported here, TensorFlow takes seconds to import and the exported runtimes do not need it
+            from keras.models import load_model
+
+            self.model = load_model(model_path)
+
+        # Load the tokenizer
+        if tokenizer_path.endswith(".json"):
+            self.tokenizer = nlp_runtime.Vocabulary.load(tokenizer_path)
+        else:
+            with open(tokenizer_path, "rb") as handle:
+                self.tokenizer = pickle.load(handle)
 
-    def predict_text(text):
+        # Sequence length of the model, shorter for models trained on the corpus's longest name
+        self.maxlen = getattr(self.tokenizer, "maxlen", None) or getattr(self.model, "input_shape", (None, 100))[1]
+
+        # Encode with the vectorized vocabulary index, unless the Keras tokenizer uses options it does not support
+        if not isinstance(self.tokenizer, nlp_runtime.Vocabulary):
+            try:
+                self.tokenizer = nlp_runtime.Vocabulary.from_tokenizer(self.tokenizer, self.maxlen)
+            except ValueError:
+                pass
+
+        self.labels = list(labels)
+        self.ocr_config = ocr_config
+        self.max_width = max_width
+        self.ocr_mode = ocr_mode
+        self.columns = columns
+        self.ocr_backend = ocr_backend
+        self.reduce = reduce
+        self.grayscale = grayscale
+        self.roi_method = roi_method
+        self.batch_size = batch_size
+        self.instrumentation = instrumentation
+        self.catalog = catalog
+
+        self.cache = cache
+        if cache is not None:
+            cache.bind(file_fingerprint(model_path, tokenizer_path))
+
+        self.model_path = model_path
+        self.tokenizer_path = tokenizer_path
+        self._result_version = None
+        self.result_store = result_store
+        if result_store is not None:
+            result_store.bind(self.result_version())
+
+    def result_version(self):
+        """
+        Return the ``result_version`` of this processor's model, tokenizer, catalog and options, computed once.
+        """
+        if self._result_version is None:
+            self._result_version = result_version(
+                self.model_path,
+                self.tokenizer_path,
+                self.catalog,
+                ocr_config=self.ocr_config,
+                max_width=self.max_width,
+                ocr_mode=self.ocr_mode,
+                columns=self.columns,
+                ocr_backend=self.ocr_backend,
+                reduce=self.reduce,
+                grayscale=self.grayscale,
+                roi_method=self.roi_method,
+            )
+        return self._result_version
+
+    def predict_text(self, text):
         """
         Predict the category of the given text using the pre-trained NLP model.
 
@@ -56,76 +570,335 @@ def process_receipt(image_path, model_path, tokenizer_path, output_json_path):
         Returns:
             str: The predicted category label.
         """
-        # Tokenize the input text
-        sequence = loaded_tokenizer.texts_to_sequences([text])
-        # Pad the sequence to the required length
-        data = pad_sequences(sequence, maxlen=100)
+        return self.predict_texts([text])[0]
+
+    def predict_texts(self, texts):
+        """
+        Predict the categories of several texts with a single batched forward pass.
+
+        All texts are tokenized and padded into one matrix, so the result for every text is the same as
+        classifying it on its own, but the model is only dispatched once per ``batch_size`` rows.
+
+        If the processor has a catalog, names found in it are answered without the model, see
+        ``classify_texts``.
+
+        If the processor has a prediction cache, texts are looked up by the words the tokenizer splits them
+        into first, see ``_cache_key``, and only the distinct misses are sent to the model. Texts with the same
+        key get the same token sequence, so cached and fresh predictions agree.
+
+        Args:
+            texts (list): The texts to classify.
+
+        Returns:
+            list: The predicted category labels, in the same order as ``texts``.
+        """
+        return self.classify_texts(texts)[0]
+
+    def classify_texts(self, texts, catalog=None):
+        """
+        Predict the categories of several texts, reporting which path answered each one.
+
+        The catalog is consulted first (exact, then fuzzy matches), then the prediction cache, and only the
+        remaining texts are sent to the model in one batch.
+
+        Args:
+            texts (list): The texts to classify.
+            catalog (catalog.Catalog): Catalog consulted instead of the processor's own, so a caller sharing
+                the processor, see ``get_processor``, does not have to change it for everyone.
+
+        Returns:
+            tuple: ``(labels, sources)``, two lists in the same order as ``texts``. Every source is one of
+                ``"exact"``, ``"fuzzy"``, ``"cache"`` or ``"model"``.
+        """
+        catalog = catalog if catalog is not None else self.catalog
+        labels = [None] * len(texts)
+        sources = [None] * len(texts)
+        if catalog is not None:
+            for i, text in enumerate(texts):
+                match = catalog.lookup(text)
+                if match is not None:
+                    labels[i], sources[i] = match.category, match.source
+
+        remaining = [i for i, label in enumerate(labels) if label is None]
+        predicted, predicted_sources = self._predict_cached([texts[i] for i in remaining])
+        for i, label, source in zip(remaining, predicted, predicted_sources):
+            labels[i], sources[i] = label, source
+
+        return labels, sources
+
+    def _predict_cached(self, texts):
+        """
+        Run the model on the given texts, consulting the cache first if there is one.
+
+        Returns:
+            tuple: ``(labels, sources)``, with every source ``"cache"`` or ``"model"``.
+        """
+        if self.cache is None:
+            return self._predict(texts), ["model"] * len(texts)
+
+        # Look up every distinct key and only run the model on the misses, with the first text of each key
+        keys = [self._cache_key(text) for text in texts]
+        texts_by_key = {}
+        for key, text in zip(keys, texts):
+            texts_by_key.setdefault(key, text)
+        labels = {}
+        for key in texts_by_key:
+            label = self.cache.get(key)
+            if label is not None:
+                labels[key] = label
+        cached = set(labels)
+
+        missing = [key for key in texts_by_key if key not in labels]
+        for key, label in zip(missing, self._predict([texts_by_key[key] for key in missing])):
+            self.cache.put(key, label)
+            labels[key] = label
+
+        return [labels[key] for key in keys], ["cache" if key in cached else "model" for key in keys]
+
+    def _cache_key(self, text):
+        """
+        Return the prediction cache key of a text: the words the tokenizer looks up, joined by its separator.
+
+        Texts with the same key are encoded to the same token sequence, so the cache never changes a
+        prediction. Tokenizers the vocabulary does not reproduce are keyed on their token ids.
+        """
+        if isinstance(self.tokenizer, nlp_runtime.Vocabulary):
+            return self.tokenizer.split.join(self.tokenizer.words(text))
+        return json.dumps(self.tokenizer.texts_to_sequences([text])[0])
+
+    def _predict(self, texts):
+        """
+        Run the model on the given texts, without consulting the cache.
+        """
+        if not texts:
+            return []
+
+        # Tokenize the input texts and pad the sequences to the required length
+        if isinstance(self.tokenizer, nlp_runtime.Vocabulary):
+            data = self.tokenizer.encode(texts, self.maxlen)
+        else:
+            data = nlp_runtime.pad_sequences(self.tokenizer.texts_to_sequences(texts), maxlen=self.maxlen)
         # Perform prediction
-        prediction = loaded_model.predict(data)
-        # Get the predicted label
-        predicted_label = unique_labels[np.argmax(prediction)]
-
-        return predicted_label
-
-    # Preprocess the image for OCR
-    blur = cv2.GaussianBlur(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), (7, 7), 0)
-    thresh = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
-    kernal = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 22))
-    dilate = cv2.dilate(thresh, kernal, iterations=1)
-
-    # Find contours in the dilated image
-    cnts = cv2.findContours(dilate, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    cnts = cnts[0] if len(cnts) == 2 else cnts[1]
-    cnts = sorted(cnts, key=lambda x: cv2.boundingRect(x)[0])
-
-    # Extract the Region of Interest (ROI) containing the receipt text
-    roi = None
-    for c in cnts:
-        x, y, w, h = cv2.boundingRect(c)
-        if y > 15 and w > 500:
-            roi = base_image[y : y + h, x : x + w]
-            cv2.rectangle(img, (x, y), (x + w, y + h), (36, 255, 12), 2)
-
-    if roi is None:
-        raise ValueError("No suitable ROI found in the image.")
+        predictions = self.model.predict(data, batch_size=self.batch_size, verbose=0)
+        # Get the predicted labels
+        return [self.labels[i] for i in np.argmax(predictions, axis=1)]
 
-    # Perform OCR on the ROI to extract text
-    ocr_result = pytesseract.image_to_string(roi, config=myconfig)
+    def warm_up(self):
+        """
+        Run predictions on dummy names, so the first requests do not pay for building the model's prediction
+        function. Neither the catalog nor the cache is consulted.
+        """
+        # Keras traces the prediction function again for a second batch shape before it generalizes over
+        # the batch size, so warm up with two
+        self._predict(["warm up"])
+        self._predict(["warm up"] * 2)
+
+    def read_items(self, image, metrics=None):
+        """
+        Run OCR on a receipt image and parse its line items, without classifying them.
 
-    # Split the OCR result into lines
-    lines = ocr_result.split("\n")
+        Args:
+            image: The receipt image, a path, encoded bytes or a decoded image, see ``image_io.load_image``.
+            metrics (instrumentation.Metrics): Optional metrics the stage timings and counters are added to.
 
-    # Parse each line to extract item details
-    items = []
-    totals = 0
-    for line in lines:
-        # Remove leading and trailing whitespace
-        line = line.strip()
-        # Ignore empty lines
-        if line:
-            parts = line.split()
-            # Check if this is a total line
-            if parts[0] == "Total:":
-                totals = int(parts[1].replace(",", ""))
-            else:
-                # Extract item details
-                name = " ".join(parts[:-3])
-                category = predict_text(name)
-                quantity = int(parts[-3])
-                price = int(parts[-2].replace(",", ""))
-                total = int(parts[-1].replace(",", ""))
-                items.append(
-                    {
-                        "name": name,
-                        "category": category,
-                        "quantity": quantity,
-                        "price": price,
-                        "total": total,
-                    }
-                )
+        Returns:
+            dict: The parsed receipt, see ``read_items``.
+
+        Raises:
+            ValueError: If the image cannot be read or no suitable Region of Interest (ROI) is found.
+        """
+        return read_items(
+            image,
+            self.ocr_config,
+            self.max_width,
+            self.ocr_mode,
+            self.columns,
+            self.ocr_backend,
+            metrics,
+            self.reduce,
+            self.grayscale,
+            self.roi_method,
+        )
+
+    def classify_receipts(self, receipts):
+        """
+        Fill in the category of every item on the given receipts with one batched prediction.
+
+        Args:
+            receipts (list): Parsed receipts as returned by ``read_items``. They are updated in place.
+
+        Returns:
+            list: The same receipts, with every item category set. With a catalog, every item also gets a
+                ``category_source``, see ``classify_texts``.
+        """
+        items = [item for receipt in receipts for item in receipt["items"]]
+        categories, sources = self.classify_texts([item["name"] for item in items])
+        for item, category, source in zip(items, categories, sources):
+            item["category"] = category
+            if self.catalog is not None:
+                item["category_source"] = source
+
+        return receipts
+
+    def process(self, image, result_store=None):
+        """
+        Process a receipt image and predict the category of every item on it.
 
+        With a result store, an encoded image whose content was processed before is answered from the store
+        without being decoded, and new results are added to it.
+
+        Args:
+            image: The receipt image, a path, encoded bytes or a decoded image, see ``image_io.load_image``.
+            result_store (result_store.ResultStore): Store used instead of the processor's own. It is bound to
+                the ``result_version`` of this processor.
+
+        Returns:
+            dict: The parsed receipt, ``{"items": [...], "totals": int, "errors": [...]}``.
+
+        Raises:
+            ValueError: If the image cannot be read or no suitable Region of Interest (ROI) is found.
+        """
+        if result_store is None:
+            result_store = self.result_store
+        elif result_store.version != self.result_version():
+            result_store.bind(self.result_version())
+
+        data = read_encoded(image) if result_store is not None else None
+        if data is None:
+            return self._process(image)
+
+        key = content_hash(data)
+        receipt = result_store.get(key, len(data))
+        if receipt is None:
+            receipt = self._process(data)
+            result_store.put(key, receipt, len(data))
+        return receipt
+
+    def _process(self, image):
+        if self.instrumentation is None:
+            return self.classify_receipts([self.read_items(image)])[0]
+
+        with self.instrumentation.request() as metrics:
+            receipt = self.read_items(image, metrics)
+            with metrics.timer("classify"):
+                return self.classify_receipts([receipt])[0]
+
+    def process_many(self, paths):
+        """
+        Process several receipt images with the same loaded model.
+
+        All receipts are read first and their items are then classified together, so the model is
+        dispatched once per ``batch_size`` items across all receipts rather than once per receipt.
+        With instrumentation, the time of the shared classification is split evenly between the receipts.
+
+        Args:
+            paths (iterable): Paths to the receipt image files.
+
+        Returns:
+            list: The parsed receipts, in the same order as ``paths``.
+        """
+        if self.instrumentation is None:
+            return self.classify_receipts([self.read_items(path) for path in paths])
+
+        metrics = []
+        receipts = []
+        for path in paths:
+            metrics.append(Metrics())
+            receipts.append(self.read_items(path, metrics[-1]))
+
+        start = time.perf_counter()
+        self.classify_receipts(receipts)
+        elapsed = time.perf_counter() - start
+
+        for receipt_metrics in metrics:
+            receipt_metrics.add_time("classify", elapsed / len(metrics))
+            self.instrumentation.record(receipt_metrics)
+        return receipts
+
+
+# Serializes building the shared processors, so a warm-up thread and a first request do not both load them
+_PROCESSOR_LOCK = threading.Lock()
+
+
+def get_processor(model_path, tokenizer_path):
+    """
+    Return a cached ReceiptProcessor for the given model and tokenizer.
+
+    The processor is built on first use and reused by every later call in the same process. Concurrent first
+    calls wait for a single processor to be built. It has no result store, pass one to
+    ``ReceiptProcessor.process`` instead, so every store shares the one loaded model.
+
+    Args:
+        model_path (str): Path to the pre-trained Keras model file.
+        tokenizer_path (str): Path to the tokenizer pickle file.
+
+    Returns:
+        ReceiptProcessor: The shared processor.
+    """
+    with _PROCESSOR_LOCK:
+        return _get_processor(model_path, tokenizer_path)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_processor(model_path, tokenizer_path):
+    return ReceiptProcessor(model_path, tokenizer_path)
+
+
+def warm_up(model_path, tokenizer_path, background=True):
+    """
+    Load the shared processor of ``get_processor`` and run a dummy prediction with it.
+
+    Args:
+        model_path (str): Path to the pre-trained model file.
+        tokenizer_path (str): Path to the tokenizer file.
+        background (bool): Warm up in a daemon thread and return at once. Otherwise warm up before returning.
+
+    Returns:
+        concurrent.futures.Future: Resolves to the warm processor, or to the error raised while loading it.
+    """
+    future = Future()
+
+    def run():
+        try:
+            processor = get_processor(model_path, tokenizer_path)
+            processor.warm_up()
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(processor)
+
+    if background:
+        threading.Thread(target=run, name="ocr-model-warm-up", daemon=True).start()
+    else:
+        run()
+    return future
+
+
+def process_receipt(image_path, model_path, tokenizer_path, output_json_path=None, sink=None, result_store=None):
+    """
+    Process a receipt image, predict item categories using a pre-trained NLP model, and save the results to a JSON file.
+
+    The model and tokenizer are loaded once per process and shared between calls, see ``get_processor``.
+
+    Args:
+        image_path: Path to the receipt image file, or its encoded bytes, see ``image_io.load_image``.
+        model_path (str): Path to the pre-trained Keras model file.
+        tokenizer_path (str): Path to the tokenizer pickle file.
+        output_json_path (str): Path to the output JSON file to save the results.
+        sink: Optional result sink the results are written to instead of ``output_json_path``, see
+            ``result_sinks``, with ``image_path`` as the path of the receipt. The caller closes the sink.
+        result_store (result_store.ResultStore): Optional store of processed receipts. An image processed
+            before is answered from it without being decoded.
+
+    Raises:
+        ValueError: If no suitable Region of Interest (ROI) is found in the image.
+    """
     # Prepare the data to be written to JSON
-    data = {"items": items, "totals": totals}
+    data = get_processor(model_path, tokenizer_path).process(image_path, result_store)
+
+    if sink is not None:
+        sink.write(os.fspath(image_path), data)
+        return
 
     # Write the data to a JSON file
     with open(output_json_path, "w") as f:
@@ -134,10 +907,29 @@ def process_receipt(image_path, model_path, tokenizer_path, output_json_path):
     print("Data has been written to", output_json_path)
 
 
-# Usage example:
-process_receipt(
-    "data/receipt_09.jpg",
-    "model/model.h5",
-    "model/tokenizer.pickle",
-    "data/ocr_result.json",
-)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OCR a receipt image and classify its items.")
+    parser.add_argument("image", nargs="?", default="data/receipt_09.jpg", help="The receipt image.")
+    parser.add_argument("-o", "--output", default="data/ocr_result.json", help="JSON file to write.")
+    parser.add_argument("--model", default="model/model.h5", help="Path to the classifier model file.")
+    parser.add_argument("--tokenizer", default="model/tokenizer.pickle", help="Path to the tokenizer file.")
+    parser.add_argument(
+        "--variant", choices=MODEL_VARIANTS, default=None, help="Use this classifier variant's model and tokenizer."
+    )
+    args = parser.parse_args(argv)
+    if args.variant:
+        args.model, args.tokenizer = MODEL_VARIANTS[args.variant]
+
+    # Load the model while the image is read
+    loading = warm_up(args.model, args.tokenizer)
+    receipt = read_items(args.image)
+    loading.result().classify_receipts([receipt])
+
+    with open(args.output, "w") as f:
+        json.dump(receipt, f)
+    print("Data has been written to", args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
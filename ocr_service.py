@@ -0,0 +1,534 @@
+"""
+Asyncio HTTP service that OCRs uploaded receipt images and classifies their items with one warm model.
+
+OCR runs in a thread pool so it never blocks the event loop. Item names from concurrent requests are
+coalesced into micro-batches, bounded by a maximum batch size and a maximum wait, and classified with
+a single forward pass. The model is loaded, and warmed up with a first prediction, in the background
+while the server already accepts connections; the readiness endpoint reports when it is done. TensorFlow
+is only imported then, see ``ocr_model``, so the server listens within a fraction of a second.
+
+Endpoints:
+    POST /receipts   raw image bytes in the body, returns {"items": [...], "totals": ..., "errors": [...]}
+    GET  /healthz    200 while the server is running
+    GET  /readyz     200 once the model is loaded, 503 before
+    GET  /metrics    aggregated per-stage timings and counters, see ``instrumentation``, and the result store
+                     hit rate
+
+Usage:
+    python ocr_service.py --port 8080
+    curl --data-binary @data/receipt_09.jpg http://127.0.0.1:8080/receipts
+"""
+
+import json
+import asyncio
+import logging
+import argparse
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import ocr_model
+from catalog import Catalog
+from instrumentation import NULL_METRICS, Instrumentation, LogExporter, PrometheusExporter
+from result_store import ResultStore, content_hash
+
+
+# Largest accepted upload, in bytes
+MAX_BODY_SIZE = 20 * 1024 * 1024
+
+HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    422: "Unprocessable Entity",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent classification requests into batches for a single model.
+
+    A batch is dispatched as soon as it holds ``max_batch_size`` texts, or ``max_wait_ms`` after its first
+    request arrived, whichever comes first. Requests are never split across batches. The prediction runs
+    in a dedicated single-thread executor, so the model is only ever used from one thread.
+
+    Args:
+        predict (callable): Function mapping a list of texts to a list of labels, e.g.
+            ``ReceiptProcessor.predict_texts``.
+        max_batch_size (int): Maximum number of texts per batch.
+        max_wait_ms (float): Maximum time a request waits for other requests to join its batch.
+    """
+
+    def __init__(self, predict, max_batch_size=ocr_model.PREDICT_BATCH_SIZE, max_wait_ms=5):
+        self.predict_batch = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.batches = 0
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._task = None
+
+    def start(self):
+        """
+        Start dispatching batches on the running event loop.
+        """
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """
+        Stop dispatching batches and shut the prediction thread down.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=False)
+
+    async def predict(self, texts):
+        """
+        Classify texts as part of the next batch.
+
+        Args:
+            texts (list): The texts to classify.
+
+        Returns:
+            list: The predicted labels, in the same order as ``texts``.
+        """
+        if not texts:
+            return []
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((texts, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_wait_ms / 1000
+
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(request)
+                size += len(request[0])
+
+            texts = [text for request_texts, _ in batch for text in request_texts]
+            try:
+                labels = await loop.run_in_executor(self._executor, self.predict_batch, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            for request_texts, future in batch:
+                if not future.done():
+                    future.set_result(labels[: len(request_texts)])
+                labels = labels[len(request_texts) :]
+
+
+class ReceiptService:
+    """
+    Receipt OCR service state: the OCR thread pool, the micro-batcher and the warm model.
+
+    Args:
+        model_path (str): Path to the pre-trained Keras model file.
+        tokenizer_path (str): Path to the tokenizer pickle file.
+        max_batch_size (int): Maximum number of item names per classification batch.
+        max_wait_ms (float): Maximum time an item name waits for a batch to fill up.
+        ocr_workers (int): Number of concurrent OCR calls, defaults to the thread pool default.
+        processor (ReceiptProcessor): An already loaded processor, or any object with a ``predict_texts``
+            method. If None, the processor is loaded from ``model_path`` and ``tokenizer_path`` on start.
+        instrumentation (instrumentation.Instrumentation): Optional per-stage timers and counters of every
+            request. The ``classify`` stage includes the wait for the micro-batch. Sampled profiles cover the
+            decode, preprocess, OCR and parse stages in the OCR thread; the micro-batched classification is
+            shared between requests and not profiled.
+        catalog (catalog.Catalog): Optional catalog of known item names, consulted before the model. Every
+            item then also gets a ``category_source``, see ``ReceiptProcessor.classify_texts``.
+        result_store (result_store.ResultStore): Optional store of processed receipts. A re-uploaded image is
+            answered from it without being decoded.
+        warm_up (bool): Run a dummy prediction after loading the model and before reporting ready, so the
+            first requests do not pay for building the prediction function.
+        **read_options: Extra keyword arguments for ``ocr_model.read_items``, e.g. ``ocr_mode``.
+    """
+
+    def __init__(
+        self,
+        model_path="model/model.h5",
+        tokenizer_path="model/tokenizer.pickle",
+        max_batch_size=ocr_model.PREDICT_BATCH_SIZE,
+        max_wait_ms=5,
+        ocr_workers=None,
+        processor=None,
+        instrumentation=None,
+        catalog=None,
+        result_store=None,
+        warm_up=True,
+        **read_options,
+    ):
+        self.model_path = model_path
+        self.tokenizer_path = tokenizer_path
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.read_options = read_options
+        self.processor = processor
+        self.instrumentation = instrumentation
+        self.catalog = catalog
+        self.result_store = result_store
+        self.warm_up = warm_up
+        self.batcher = None
+        self._ocr_executor = ThreadPoolExecutor(max_workers=ocr_workers)
+        self._loading = None
+
+    @property
+    def ready(self):
+        return self.batcher is not None
+
+    async def start(self):
+        """
+        Start loading the model in the background. The service answers health checks immediately and
+        reports ready once the model is loaded.
+        """
+        self._loading = asyncio.get_running_loop().create_task(self._load())
+
+    async def _load(self):
+        loop = asyncio.get_running_loop()
+        if self.processor is None and self.warm_up:
+            self.processor = await asyncio.wrap_future(ocr_model.warm_up(self.model_path, self.tokenizer_path))
+        elif self.processor is None:
+            self.processor = await loop.run_in_executor(
+                None, ocr_model.get_processor, self.model_path, self.tokenizer_path
+            )
+        if self.result_store is not None:
+            version = await loop.run_in_executor(
+                None,
+                functools.partial(
+                    ocr_model.result_version, self.model_path, self.tokenizer_path, self.catalog, **self.read_options
+                ),
+            )
+            self.result_store.bind(version)
+
+        predict = self.processor.predict_texts
+        if self.catalog is not None:
+            # Labels paired with the path that answered them. The catalog is passed per call, the processor is
+            # shared with every other user of ``get_processor`` in this process
+            predict = lambda texts: list(  # noqa: E731
+                zip(*self.processor.classify_texts(texts, catalog=self.catalog))
+            )
+
+        batcher = MicroBatcher(predict, self.max_batch_size, self.max_wait_ms)
+        batcher.start()
+        self.batcher = batcher
+
+    async def stop(self):
+        """
+        Stop the OCR thread pool and the micro-batcher, then close the result store.
+        """
+        if self._loading is not None:
+            await self._loading
+        # OCR threads still running may write to the result store, so let them finish before it is closed
+        await asyncio.get_running_loop().run_in_executor(None, self._ocr_executor.shutdown)
+        if self.batcher is not None:
+            await self.batcher.stop()
+        if self.instrumentation is not None:
+            self.instrumentation.flush()
+        if self.result_store is not None:
+            self.result_store.close()
+
+    async def process(self, data):
+        """
+        OCR and classify one receipt image.
+
+        Args:
+            data (bytes): The encoded image, e.g. JPEG or PNG bytes.
+
+        Returns:
+            dict: The parsed receipt, ``{"items": [...], "totals": int, "errors": [...]}``.
+
+        Raises:
+            ValueError: If the image cannot be decoded or no suitable ROI is found.
+        """
+        loop = asyncio.get_running_loop()
+        if self.result_store is not None:
+            # Hashing and the SQLite lookup would block the event loop, they run in the OCR thread as well
+            key, receipt = await loop.run_in_executor(self._ocr_executor, self._lookup, data)
+            if receipt is not None:
+                return receipt
+
+        if self.instrumentation is None:
+            receipt = await self._process(data, NULL_METRICS)
+        else:
+            # The work runs in executor threads, where sampled requests are profiled, see ``_read_items``
+            with self.instrumentation.request(profile=False) as metrics:
+                receipt = await self._process(data, metrics)
+
+        if self.result_store is not None:
+            await loop.run_in_executor(self._ocr_executor, self.result_store.put, key, receipt, len(data))
+        return receipt
+
+    def _lookup(self, data):
+        key = content_hash(data)
+        return key, self.result_store.get(key, len(data))
+
+    async def _process(self, data, metrics):
+        # The upload is decoded from memory in the OCR thread, see ``image_io.load_image``
+        loop = asyncio.get_running_loop()
+        receipt = await loop.run_in_executor(self._ocr_executor, self._read_items, data, metrics)
+
+        with metrics.timer("classify"):
+            categories = await self.batcher.predict([item["name"] for item in receipt["items"]])
+        for item, category in zip(receipt["items"], categories):
+            if self.catalog is not None:
+                category, item["category_source"] = category
+            item["category"] = category
+
+        return receipt
+
+    def _read_items(self, data, metrics):
+        if self.instrumentation is None:
+            return ocr_model.read_items(data, metrics=metrics, **self.read_options)
+        # cProfile only sees the thread it is enabled in, so sampled requests are profiled here in the OCR thread
+        with self.instrumentation.profiling(metrics):
+            return ocr_model.read_items(data, metrics=metrics, **self.read_options)
+
+    async def handle(self, method, path, body=b""):
+        """
+        Route one request.
+
+        Args:
+            method (str): HTTP method.
+            path (str): Request path, without the query string.
+            body (bytes): Request body.
+
+        Returns:
+            tuple: ``(status, payload)``, where payload is JSON-serializable.
+        """
+        if path == "/healthz":
+            return 200, {"status": "ok"}
+
+        if path == "/readyz":
+            if self.ready:
+                return 200, {"status": "ready"}
+            return 503, {"status": "loading"}
+
+        if path == "/metrics":
+            if self.instrumentation is None and self.result_store is None:
+                return 404, {"error": "Instrumentation is disabled."}
+            payload = self.instrumentation.snapshot() if self.instrumentation is not None else {}
+            if self.result_store is not None:
+                payload["result_store"] = self.result_store.stats()
+            return 200, payload
+
+        if path != "/receipts":
+            return 404, {"error": f"Unknown path {path}"}
+        if method != "POST":
+            return 405, {"error": "Use POST with the image bytes as the body."}
+        if not self.ready:
+            return 503, {"error": "The model is still loading."}
+
+        try:
+            return 200, await self.process(body)
+        except ValueError as e:
+            return 422, {"error": str(e)}
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serve one HTTP/1.1 request on a connection, then close it.
+        """
+        try:
+            status, payload = await self._read_and_handle(reader)
+        except Exception as e:
+            status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+
+        body = json.dumps(payload).encode()
+        head = (
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(head.encode() + body)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def _read_and_handle(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) != 3:
+            return 400, {"error": "Malformed request line."}
+        method, target, _ = request_line
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            return 400, {"error": "Content-Length must be a non-negative integer."}
+        if length > MAX_BODY_SIZE:
+            return 413, {"error": f"Uploads are limited to {MAX_BODY_SIZE} bytes."}
+        body = await reader.readexactly(length) if length else b""
+
+        return await self.handle(method, target.split("?", 1)[0], body)
+
+
+async def request(host, port, method, path, body=b""):
+    """
+    Minimal HTTP client for the service, e.g. for local testing without any external tools.
+
+    Args:
+        host (str): Server host.
+        port (int): Server port.
+        method (str): HTTP method.
+        path (str): Request path.
+        body (bytes): Request body, e.g. the bytes of a receipt image.
+
+    Returns:
+        tuple: ``(status, payload)`` with the decoded JSON payload.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(body)}\r\n"
+        "Connection: close\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+
+    response = await reader.read()
+    writer.close()
+
+    head, _, payload = response.partition(b"\r\n\r\n")
+    status = int(head.split()[1])
+    return status, json.loads(payload)
+
+
+async def serve(service, host="127.0.0.1", port=8080):
+    """
+    Run the service until cancelled.
+
+    Args:
+        service (ReceiptService): The service to expose.
+        host (str): Interface to listen on.
+        port (int): Port to listen on.
+    """
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    await service.start()
+    print(f"Serving receipts on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve receipt OCR and item classification over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on.")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on.")
+    parser.add_argument("--model", default="model/model.h5", help="Path to the Keras model file.")
+    parser.add_argument("--tokenizer", default="model/tokenizer.pickle", help="Path to the tokenizer pickle file.")
+    parser.add_argument(
+        "--variant",
+        choices=ocr_model.MODEL_VARIANTS,
+        default=None,
+        help="Use this classifier variant's model and tokenizer, see ocr_model.MODEL_VARIANTS.",
+    )
+    parser.add_argument(
+        "--max-batch-size", type=int, default=ocr_model.PREDICT_BATCH_SIZE, help="Item names per model batch."
+    )
+    parser.add_argument("--max-wait-ms", type=float, default=5, help="Maximum wait for a batch to fill up.")
+    parser.add_argument("--ocr-workers", type=int, default=None, help="Concurrent OCR calls.")
+    parser.add_argument("--ocr-mode", choices=ocr_model.OCR_MODES, default="block", help="How the ROI is read.")
+    parser.add_argument(
+        "--ocr-backend", choices=ocr_model.OCR_BACKENDS, default="auto", help="Tesseract backend to use."
+    )
+    parser.add_argument(
+        "--reduce", type=int, choices=(1, 2, 4, 8), default=1, help="Decode uploads at 1/N of their resolution."
+    )
+    parser.add_argument("--grayscale", action="store_true", help="Decode uploads straight to grayscale.")
+    parser.add_argument(
+        "--roi-method", choices=ocr_model.ROI_METHODS, default="contours", help="How the item table is found."
+    )
+    parser.add_argument(
+        "--result-store", default=None, help="SQLite file of processed receipts, reused for re-uploaded images."
+    )
+    parser.add_argument(
+        "--no-warm-up", action="store_true", help="Report ready without a first prediction on the loaded model."
+    )
+    parser.add_argument("--log-metrics", action="store_true", help="Log the stage timings of every request.")
+    parser.add_argument("--metrics-file", default=None, help="Write the metrics to this Prometheus text file.")
+    parser.add_argument(
+        "--profile-rate", type=float, default=0.0, help="Fraction of requests profiled with cProfile."
+    )
+    parser.add_argument("--profile-dir", default="profiles", help="Directory the request profiles are written to.")
+    parser.add_argument(
+        "--trace-memory", action="store_true", help="Also trace the allocations of profiled requests."
+    )
+    parser.add_argument(
+        "--catalog",
+        nargs="*",
+        metavar="CSV",
+        default=None,
+        help="Answer known item names from these catalog CSVs before the model (default: the item lists).",
+    )
+    args = parser.parse_args(argv)
+    if args.variant:
+        args.model, args.tokenizer = ocr_model.MODEL_VARIANTS[args.variant]
+
+    exporters = []
+    if args.log_metrics:
+        logging.basicConfig(level=logging.INFO)
+        exporters.append(LogExporter())
+    if args.metrics_file:
+        exporters.append(PrometheusExporter(args.metrics_file))
+    instrumentation = Instrumentation(
+        exporters,
+        profile_rate=args.profile_rate,
+        profile_dir=args.profile_dir if args.profile_rate else None,
+        trace_memory=args.trace_memory,
+    )
+
+    service = ReceiptService(
+        args.model,
+        args.tokenizer,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        ocr_workers=args.ocr_workers,
+        ocr_mode=args.ocr_mode,
+        ocr_backend=args.ocr_backend,
+        reduce=args.reduce,
+        grayscale=args.grayscale,
+        roi_method=args.roi_method,
+        instrumentation=instrumentation,
+        catalog=Catalog.from_csv(*args.catalog) if args.catalog is not None else None,
+        result_store=ResultStore(args.result_store) if args.result_store else None,
+        warm_up=not args.no_warm_up,
+    )
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+
+# Characters dropped by the Keras Tokenizer default filters, plus quote marks that OCR tends to
+# insert around or inside words
+NOISE_CHARACTERS = "!\"#$%&()*+,-./:;<=>?@[\\]^_`{|}~'‘’“”·"
+NOISE_PATTERN = re.compile("[" + re.escape(NOISE_CHARACTERS) + "]")
+
+
+def normalize_text(text):
+    """
+    Normalize an item name for matching it against other names, e.g. in the catalog or the evaluation.
+
+    The text is NFKC-normalized, lower-cased, stripped of punctuation and OCR noise characters, and
+    its whitespace is collapsed. This is looser than the Keras tokenizer, which keeps quote marks and does
+    not NFKC-normalize, so names with the same normalized form can still get different predictions: the
+    prediction cache is keyed on the tokenizer's own words instead, see ``ReceiptProcessor._cache_key``.
+
+    Args:
+        text (str): The item name as read by OCR.
+
+    Returns:
+        str: The normalized item name.
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = NOISE_PATTERN.sub(" ", text)
+    return " ".join(text.split())
+
+
+def file_fingerprint(*paths):
+    """
+    Compute a content fingerprint of the given files.
+
+    Args:
+        *paths (str): Paths of the files that determine the cached predictions, e.g. the model and tokenizer.
+
+    Returns:
+        str: A hex digest that changes whenever any of the files changes.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as handle:
+            for chunk in iter(lambda: handle.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    """
+    Bounded, thread-safe LRU cache of predicted categories keyed on item names as the tokenizer splits them.
+
+    Entries are evicted least-recently-used first once ``max_size`` is reached, and expire ``ttl``
+    seconds after they were stored. The cache is tied to a fingerprint of the model and tokenizer
+    files: binding it to a different fingerprint, or loading a persisted cache that was written for
+    another one, drops every entry.
+
+    Args:
+        max_size (int): Maximum number of entries kept in memory.
+        ttl (float): Lifetime of an entry in seconds, or None to keep entries until they are evicted.
+        path (str): Optional JSON file the cache is loaded from and saved to, so it survives restarts.
+        fingerprint (str): Fingerprint of the model and tokenizer the cached predictions belong to.
+    """
+
+    def __init__(self, max_size=10000, ttl=None, path=None, fingerprint=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.fingerprint = fingerprint
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _expired(self, stored_at, now):
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def get(self, key):
+        """
+        Look up a cached prediction.
+
+        Args:
+            key (str): The item name key, see ``ReceiptProcessor._cache_key``.
+
+        Returns:
+            str: The cached category label, or None if the key is missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[1], now):
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """
+        Store a prediction, evicting the least recently used entries if the cache is full.
+
+        Args:
+            key (str): The item name key, see ``ReceiptProcessor._cache_key``.
+            value (str): The predicted category label.
+        """
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def bind(self, fingerprint):
+        """
+        Tie the cache to a model and tokenizer, dropping all entries if they belong to another one.
+
+        Args:
+            fingerprint (str): Fingerprint of the model and tokenizer, see ``file_fingerprint``.
+        """
+        with self._lock:
+            if fingerprint != self.fingerprint:
+                self._entries.clear()
+                self.fingerprint = fingerprint
+
+    def clear(self):
+        """
+        Remove every entry and reset the hit and miss counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Return the cache counters.
+
+        Returns:
+            dict: ``hits``, ``misses``, ``hit_rate`` and the current ``size`` of the cache.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+            }
+
+    def load(self):
+        """
+        Load the entries persisted at ``path``, ignoring them if they were written for another fingerprint.
+        """
+        with open(self.path) as f:
+            data = json.load(f)
+
+        if self.fingerprint is not None and data.get("fingerprint") != self.fingerprint:
+            return
+
+        now = time.time()
+        with self._lock:
+            self.fingerprint = data.get("fingerprint")
+            for key, value, stored_at in data["entries"]:
+                if not self._expired(stored_at, now):
+                    self._entries[key] = (value, stored_at)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def save(self):
+        """
+        Persist the entries to ``path``. The file is replaced atomically.
+        """
+        if self.path is None:
+            raise ValueError("The cache has no path to save to.")
+
+        with self._lock:
+            data = {
+                "fingerprint": self.fingerprint,
+                "entries": [[key, value, stored_at] for key, (value, stored_at) in self._entries.items()],
+            }
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
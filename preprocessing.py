@@ -0,0 +1,229 @@
+import cv2
+import numpy as np
+from collections import namedtuple
+
+
+# A candidate Region of Interest, in full-resolution image coordinates. ``image`` is a view into the
+# source image, not a copy.
+Roi = namedtuple("Roi", ["x", "y", "w", "h", "image"])
+
+# Size of the Gaussian blur and of the dilation kernel that merges text into blocks, at full resolution
+BLUR_SIZE = 7
+DILATE_SIZE = (3, 22)
+
+# A block is an item table candidate if it starts below the top margin and spans most of the receipt
+MIN_ROI_Y = 15
+MIN_ROI_WIDTH = 500
+
+# ROI detectors: contours of the dilated text blocks, or row and column projection profiles
+ROI_METHODS = ("contours", "projection")
+
+# Width of the downscaled copy the projection profiles are computed on
+PROFILE_WIDTH = 400
+
+# A row holds text if its ink covers at least this fraction of the width
+MIN_ROW_INK = 0.005
+
+# A band whose ink covers at least this fraction of its box is a rule, e.g. a line of dashes. Text lines,
+# and the thin runs of descenders below them, are much sparser.
+RULE_DENSITY = 0.4
+
+# A rule at least this fraction of the image wide separates the header from the item table
+HEADER_RULE_WIDTH = 0.6
+
+# Margin kept around a projection ROI, as a fraction of the image width
+ROI_PADDING = 0.01
+
+_KERNELS = {}
+
+
+def _dilate_kernel(scale):
+    size = tuple(max(1, round(s * scale)) for s in DILATE_SIZE)
+    if size not in _KERNELS:
+        _KERNELS[size] = cv2.getStructuringElement(cv2.MORPH_RECT, size)
+    return _KERNELS[size]
+
+
+def find_rois(img, max_width=None, min_y=MIN_ROI_Y, min_width=MIN_ROI_WIDTH, method="contours"):
+    """
+    Find every candidate Region of Interest (ROI) containing receipt text.
+
+    With ``method="projection"``, the ROI is found by ``find_table_roi`` instead, on a copy downscaled to
+    ``max_width`` (``PROFILE_WIDTH`` by default); ``min_y`` and ``min_width`` do not apply.
+
+    The image is converted to grayscale, blurred, Otsu-thresholded and dilated so that text lines merge
+    into blocks, and the bounding rectangle of every external contour is computed once. The source image
+    is never copied; only the single-channel working buffers are allocated, and they are reused in place.
+
+    Args:
+        img (numpy.ndarray): The decoded BGR (or grayscale) receipt image.
+        max_width (int): If the image is wider than this, the contour search runs on a copy downscaled to
+            this width and the coordinates are mapped back to full resolution. None disables downscaling.
+        min_y (int): Minimum top coordinate of a candidate, in full-resolution pixels.
+        min_width (int): Minimum width of a candidate, in full-resolution pixels.
+        method (str): One of ``ROI_METHODS``.
+
+    Returns:
+        list: The candidate ``Roi`` tuples, sorted by their x coordinate.
+
+    Raises:
+        ValueError: If ``method`` is not one of ``ROI_METHODS``.
+    """
+    if method == "projection":
+        return find_table_roi(img, max_width or PROFILE_WIDTH)
+    if method != "contours":
+        raise ValueError(f"Unknown ROI method {method!r}, expected one of {ROI_METHODS}.")
+
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+
+    scale = 1.0
+    if max_width is not None and gray.shape[1] > max_width:
+        scale = max_width / gray.shape[1]
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    # The blur writes into a new buffer, which the threshold and dilation then reuse in place
+    blur_size = max(1, round(BLUR_SIZE * scale)) | 1
+    work = cv2.GaussianBlur(gray, (blur_size, blur_size), 0)
+    cv2.threshold(work, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU, dst=work)
+    cv2.dilate(work, _dilate_kernel(scale), dst=work, iterations=1)
+
+    # Find contours in the dilated image and compute their bounding rectangles once
+    cnts = cv2.findContours(work, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    cnts = cnts[0] if len(cnts) == 2 else cnts[1]
+    rects = sorted((cv2.boundingRect(c) for c in cnts), key=lambda rect: rect[0])
+
+    rois = []
+    for x, y, w, h in rects:
+        if scale != 1.0:
+            x, y, w, h = (round(v / scale) for v in (x, y, w, h))
+        if y > min_y and w > min_width:
+            rois.append(Roi(x, y, w, h, img[y : y + h, x : x + w]))
+
+    return rois
+
+
+def find_table_roi(img, profile_width=PROFILE_WIDTH):
+    """
+    Find the item table and the ``Total:`` row from the row and column projection profiles of the ink.
+
+    A copy downscaled by an integer factor to at most ``profile_width`` is Otsu-thresholded and its rows are
+    summed into a profile; runs of inked rows are the text lines and rules of the receipt. The ``Total:`` row
+    is the last text line, and the table starts after the last rule spanning most of the width above it,
+    which closes the header. The horizontal extent comes from the column profile of those lines, and the box
+    is mapped back to full resolution. Without a header rule, the ROI starts at the first line.
+
+    Args:
+        img (numpy.ndarray): The decoded BGR (or grayscale) receipt image.
+        profile_width (int): Width of the downscaled copy the profiles are computed on.
+
+    Returns:
+        list: A single ``Roi`` in full-resolution coordinates, or no ROI if the image has no text lines.
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    height, width = gray.shape
+
+    # INTER_AREA has a much faster path for integer factors
+    factor = -(-width // profile_width)
+    if factor > 1:
+        gray = cv2.resize(gray, None, fx=1 / factor, fy=1 / factor, interpolation=cv2.INTER_AREA)
+    ink = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+
+    # Runs of inked rows, as [start, end) pairs
+    rows = np.count_nonzero(ink, axis=1) >= max(1, MIN_ROW_INK * ink.shape[1])
+    edges = np.flatnonzero(np.diff(rows, prepend=False, append=False))
+    starts, ends = edges[0::2], edges[1::2]
+    if not len(starts):
+        return []
+
+    # Column profile, horizontal extent and ink density of every run. A run reaching the last row ends at
+    # ``len(ink)``, which reduceat rejects; without that edge its sum runs to the end anyway
+    counts = np.add.reduceat(ink, edges[edges < len(ink)], axis=0, dtype=np.int32)[0::2]
+    inked = counts > 0
+    lefts = inked.argmax(axis=1)
+    rights = inked.shape[1] - inked[:, ::-1].argmax(axis=1)
+    density = counts.sum(axis=1) / ((ends - starts) * (rights - lefts))
+
+    rules = density >= RULE_DENSITY
+    text = np.flatnonzero(~rules)
+    if not len(text):
+        return []
+    last = text[-1]
+
+    header_rules = np.flatnonzero((rules & (rights - lefts >= HEADER_RULE_WIDTH * inked.shape[1]))[:last])
+    first = header_rules[-1] + 1 if len(header_rules) else text[0]
+
+    padding = round(ROI_PADDING * width)
+    x0 = max(0, lefts[first : last + 1].min() * factor - padding)
+    y0 = max(0, starts[first] * factor - padding)
+    x1 = min(width, rights[first : last + 1].max() * factor + padding)
+    y1 = min(height, ends[last] * factor + padding)
+    return [Roi(int(x0), int(y0), int(x1 - x0), int(y1 - y0), img[y0:y1, x0:x1])]
+
+
+def select_roi(rois):
+    """
+    Pick the ROI that holds the item table.
+
+    Args:
+        rois (list): Candidates as returned by ``find_rois``.
+
+    Returns:
+        Roi: The last candidate in x order, which is the block the original pipeline used.
+
+    Raises:
+        ValueError: If there are no candidates.
+    """
+    if not rois:
+        raise ValueError("No suitable ROI found in the image.")
+
+    return rois[-1]
+
+
+# Kernel that merges the characters of one text line without bridging the gap to the next line
+LINE_DILATE_SIZE = (25, 5)
+
+# Lines shorter than this are specks of noise rather than text
+MIN_LINE_HEIGHT = 4
+
+# Pixels of margin kept above and below every line
+LINE_PADDING = 3
+
+
+def find_lines(roi):
+    """
+    Split a ROI into horizontal text lines.
+
+    The ROI is thresholded and dilated with a wide, short kernel so that the characters of one line merge,
+    and the contours are grouped by their vertical extent into line bands.
+
+    Args:
+        roi (numpy.ndarray): The BGR (or grayscale) ROI image, e.g. ``Roi.image``.
+
+    Returns:
+        list: One ``Roi`` per line in reading order, spanning the full ROI width, with coordinates relative to the ROI.
+    """
+    gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY) if roi.ndim == 3 else roi
+    work = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+    cv2.dilate(work, cv2.getStructuringElement(cv2.MORPH_RECT, LINE_DILATE_SIZE), dst=work, iterations=1)
+
+    cnts = cv2.findContours(work, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    cnts = cnts[0] if len(cnts) == 2 else cnts[1]
+    spans = sorted((y, y + h) for _, y, _, h in (cv2.boundingRect(c) for c in cnts))
+
+    # Merge vertically overlapping contours into line bands
+    bands = []
+    for top, bottom in spans:
+        if bands and top <= bands[-1][1]:
+            bands[-1][1] = max(bands[-1][1], bottom)
+        else:
+            bands.append([top, bottom])
+
+    height, width = roi.shape[:2]
+    lines = []
+    for top, bottom in bands:
+        if bottom - top < MIN_LINE_HEIGHT:
+            continue
+        top, bottom = max(0, top - LINE_PADDING), min(height, bottom + LINE_PADDING)
+        lines.append(Roi(0, top, width, bottom - top, roi[top:bottom]))
+
+    return lines
@@ -1,7 +1,16 @@
+import io
+import os
+import json
+import time
 import random
+import tarfile
+import argparse
+import multiprocessing
 import pandas as pd
 from PIL import Image, ImageDraw, ImageFont
 
+from labels import canonical_label
+
 
 # This script generates random receipt images using data from a CSV file.
 # It uses the PIL library to draw text and images onto a blank canvas to simulate a receipt.
@@ -42,95 +51,332 @@ def draw_text(draw, text, position, font, max_width):
     return y
 
 
-def generate_random_receipts(list_items, num_receipts, font_path, logo_path):
+def load_fonts(font_path):
     """
-    Generates random receipt images with varying items and quantities.
+    Loads the fonts used on the receipts.
 
-    :param list_items: A list of dictionaries containing item details.
-    :param num_receipts: The number of receipts to generate.
     :param font_path: Path to the font file used for drawing text.
+    :return: Tuple (font, total_font) for the body text and the total line.
+    """
+    return ImageFont.truetype(font_path, 20), ImageFont.truetype(font_path, 24)
+
+
+def load_logo(logo_path):
+    """
+    Loads the logo and scales it down to the size drawn on the receipts.
+
     :param logo_path: Path to the logo image file.
+    :return: The scaled RGB logo, or None if the file cannot be opened.
+    """
+    try:
+        logo = Image.open(logo_path)
+        logo.thumbnail((200, 200))
+        return logo.convert('RGB')
+    except IOError:
+        print(f"Logo file not found at {logo_path}, skipping logo.")
+        return None
+
+
+def draw_field(draw, position, text, font):
+    """
+    Draws one piece of text and returns its bounding box.
+
+    :param draw: ImageDraw object to draw on the image.
+    :param position: Tuple (x, y) where the text will start.
+    :param text: The text to be drawn.
+    :param font: The font of the text.
+    :return: The bounding box [left, top, right, bottom] of the drawn text, in pixels.
+    """
+    draw.text(position, text, font=font, fill='black')
+    return list(draw.textbbox(position, text, font=font))
+
+
+def union_box(boxes):
+    """
+    Returns the bounding box [left, top, right, bottom] enclosing all of the given boxes.
+    """
+    return [min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes)]
+
+
+def draw_item(draw, y, item, columns, font):
     """
+    Draws one item line and returns its ground truth.
 
-    # Load fonts
-    font = ImageFont.truetype(font_path, 20)
-    total_font = ImageFont.truetype(font_path, 24)
+    :param draw: ImageDraw object to draw on the image.
+    :param y: The y position of the line.
+    :param item: Dictionary with the 'name', 'quantity', 'price' and 'total' of the item, and optionally its
+        'category'.
+    :param columns: The x positions of the name, quantity, price and total columns.
+    :param font: The font of the text.
+    :return: The item dictionary with its integer fields and the bounding box of the line and of every column.
+    """
+    texts = {
+        'name': item['name'],
+        'quantity': "{:.0f}".format(item['quantity']),
+        'price': "{:,.0f}".format(item['price']),
+        'total': "{:,.0f}".format(item['total']),
+    }
+    boxes = {field: draw_field(draw, (x, y), texts[field], font) for field, x in zip(texts, columns)}
+    boxes['line'] = union_box(list(boxes.values()))
+
+    return {
+        'name': item['name'],
+        'category': item.get('category'),
+        'quantity': int(item['quantity']),
+        'price': int(item['price']),
+        'total': int(item['total']),
+        'boxes': boxes,
+    }
+
+
+def render_receipt(chosen_items, quantities, fonts, logo):
+    """
+    Draws one receipt image.
+
+    The ground truth has the same layout as the output of ocr_model.read_items, plus the category of every
+    item (from the 'kategori' column, if present, as one of labels.UNIQUE_LABELS, see
+    labels.canonical_label) and the pixel bounding boxes of every line and column:
+
+        {"width": 800, "height": 1000,
+         "items": [{"name": ..., "category": ..., "quantity": 2, "price": 10000, "total": 20000,
+                    "boxes": {"line": [l, t, r, b], "name": [...], "quantity": [...], "price": [...], "total": [...]}}],
+         "totals": 20000, "boxes": {"separator": [...], "totals": [...]}}
+
+    :param chosen_items: A list of dictionaries with the 'nama' and 'harga' of each item on the receipt.
+    :param quantities: The quantity bought of each item.
+    :param fonts: Tuple (font, total_font) as returned by load_fonts.
+    :param logo: The scaled logo as returned by load_logo, or None.
+    :return: Tuple (image, ground_truth).
+    """
+    font, total_font = fonts
 
     # Set image dimensions and styling parameters
     image_width = 800
     margin = 20
     line_height = 30
+    columns = (margin, margin + 450, margin + 525, margin + 650)
 
-    # Generate each receipt image
-    for receipt_id in range(1, num_receipts + 1):
-        num_items = random.randint(1, 50)
-        chosen_items = random.sample(list_items, num_items)
-        total_price = 0
-
-        # Calculate receipt height based on number of items
-        receipt_height = (num_items + 6) * line_height + 6 * margin
-        image = Image.new('RGB', (image_width, receipt_height), 'white')
-        draw = ImageDraw.Draw(image)
-
-        y = margin
-        # Try to open and paste the logo onto the receipt
-        try:
-            logo = Image.open(logo_path)
-            logo.thumbnail((200, 200))
-            image.paste(logo, (margin + 278, margin))
-        except IOError:
-            print(f"Logo file not found at {logo_path}, skipping logo.")
-
-        # Skip space for logo height
-        y += line_height + 50
-
-        # Header information for the receipt
-        header_info = [
-            f"{'JL. WR. SUPRATMAN, LABUHANBATU':^102}",
-            '-' * 114,
-            f"{'16.06.18-17:00'}{'1.6.24':^77}{'031153/JOKO/5501'}",
-            '-' * 114
-        ]
-
-        # Draw header information on the receipt
-        for info in header_info:
-            draw.text((margin, y), info, font=font, fill='black')
-            y += line_height
-
-        # Draw each item with its quantity and price on the receipt
-        for item in chosen_items:
-            quantity = random.randint(1, 3)
-            item_total = quantity * item['harga']
-            total_price += item_total
-
-            draw.text((margin, y), item['nama'], font=font, fill='black')
-            draw.text((margin + 450, y), "{:.0f}".format(quantity), font=font, fill='black')
-            draw.text((margin + 525, y), "{:,.0f}".format(item['harga']), font=font, fill='black')
-            draw.text((margin + 650, y), "{:,.0f}".format(item_total), font=font, fill='black')
-            y += line_height
-
-        # Draw a line before the total
-        draw.text((margin + 450, y), '-' * 46, font=font, fill='black')
+    num_items = len(chosen_items)
+    total_price = 0
+    items = []
+
+    # Calculate receipt height based on number of items
+    receipt_height = (num_items + 6) * line_height + 6 * margin
+    image = Image.new('RGB', (image_width, receipt_height), 'white')
+    draw = ImageDraw.Draw(image)
+
+    y = margin
+    # Paste the logo onto the receipt
+    if logo is not None:
+        image.paste(logo, (margin + 278, margin))
+
+    # Skip space for logo height
+    y += line_height + 50
+
+    # Header information for the receipt
+    header_info = [
+        f"{'JL. WR. SUPRATMAN, LABUHANBATU':^102}",
+        '-' * 114,
+        f"{'16.06.18-17:00'}{'1.6.24':^77}{'031153/JOKO/5501'}",
+        '-' * 114
+    ]
+
+    # Draw header information on the receipt
+    for info in header_info:
+        draw.text((margin, y), info, font=font, fill='black')
         y += line_height
 
-        # Draw the total price of all items
-        draw.text((margin + 450, y), "Total:", font=total_font, fill='black')
-        draw.text((margin + 630, y), "{:,.0f}".format(total_price), font=total_font, fill='black')
+    # Draw each item with its quantity and price on the receipt
+    for item, quantity in zip(chosen_items, quantities):
+        item_total = quantity * item['harga']
+        total_price += item_total
+
+        # The category is written as the label the model predicts, the item lists spell some differently
+        category = canonical_label(item['kategori']) if item.get('kategori') is not None else None
+        item = {'name': item['nama'], 'category': category, 'quantity': quantity,
+                'price': item['harga'], 'total': item_total}
+        items.append(draw_item(draw, y, item, columns, font))
+        y += line_height
+
+    # Draw a line before the total
+    separator_box = draw_field(draw, (margin + 450, y), '-' * 46, font)
+    y += line_height
+
+    # Draw the total price of all items
+    label_box = draw_field(draw, (margin + 450, y), "Total:", total_font)
+    value_box = draw_field(draw, (margin + 630, y), "{:,.0f}".format(total_price), total_font)
+
+    ground_truth = {
+        'width': image_width,
+        'height': receipt_height,
+        'items': items,
+        'totals': int(total_price),
+        'boxes': {'separator': separator_box, 'totals': union_box([label_box, value_box])},
+    }
+    return image, ground_truth
+
+
+def random_receipt(list_items, rng):
+    """
+    Picks the items and quantities of one random receipt.
 
-        # Save the receipt image with a unique filename
+    :param list_items: A list of dictionaries containing item details.
+    :param rng: The random.Random instance to draw from.
+    :return: Tuple (chosen_items, quantities).
+    """
+    num_items = rng.randint(1, 50)
+    chosen_items = rng.sample(list_items, num_items)
+    quantities = [rng.randint(1, 3) for _ in chosen_items]
+    return chosen_items, quantities
+
+
+def generate_random_receipts(list_items, num_receipts, font_path, logo_path):
+    """
+    Generates random receipt images with varying items and quantities.
+
+    Every data/receipt_NN.jpg is written together with its ground truth as data/receipt_NN.json, see
+    render_receipt.
+
+    :param list_items: A list of dictionaries containing item details.
+    :param num_receipts: The number of receipts to generate.
+    :param font_path: Path to the font file used for drawing text.
+    :param logo_path: Path to the logo image file.
+    """
+
+    # Load fonts and the scaled logo once for all receipts
+    fonts = load_fonts(font_path)
+    logo = load_logo(logo_path)
+
+    # Generate each receipt image
+    for receipt_id in range(1, num_receipts + 1):
+        image, ground_truth = render_receipt(*random_receipt(list_items, random), fonts, logo)
+
+        # Save the receipt image with a unique filename, and its ground truth next to it
         image_filename = f"data/receipt_{receipt_id:02d}.jpg"
         image.save(image_filename)
+        with open(f"data/receipt_{receipt_id:02d}.json", 'w') as f:
+            json.dump(ground_truth, f)
 
     print("Receipt images generated.")
 
-# Load data from a CSV file into a DataFrame and convert it to a list of dictionaries
-receipts_df = pd.read_csv('data_csv/data.csv')
-list_of_dicts = receipts_df.to_dict('records')
 
-# Parameters for receipt generation
-font_path = "arial.ttf"  # Path to the font file
-logo_path = "indomaret_logo.png"  # Path to the logo image file
-num_receipts = 10  # Number of receipts to generate
+# State of a shard worker process, set once by _init_shard_worker
+_worker = {}
+
+
+def _init_shard_worker(list_items, font_path, logo_path, output_dir, shard_size, seed, quality):
+    _worker.update(
+        list_items=list_items,
+        fonts=load_fonts(font_path),
+        logo=load_logo(logo_path),
+        output_dir=output_dir,
+        shard_size=shard_size,
+        seed=seed,
+        quality=quality,
+    )
+
+
+def _add_to_tar(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def write_shard(shard, num_receipts):
+    """
+    Renders one shard of receipts into a tar archive, in a worker set up by _init_shard_worker.
 
-# Generate random receipts images
-generate_random_receipts(list_of_dicts, num_receipts, font_path, logo_path)
\ No newline at end of file
+    Every receipt is stored as <key>.jpg with its ground truth as <key>.json, WebDataset style. The random
+    generator is seeded from the base seed and the shard index, so the output does not depend on the number
+    of workers or on the order in which shards are processed.
+
+    :param shard: Index of the shard.
+    :param num_receipts: Number of receipts in the shard.
+    :return: Path of the written archive.
+    """
+    rng = random.Random(f"{_worker['seed']}:{shard}")
+    path = os.path.join(_worker['output_dir'], f"receipts-{shard:06d}.tar")
+    tmp_path = path + '.tmp'
+
+    with tarfile.open(tmp_path, 'w') as tar:
+        for offset in range(num_receipts):
+            key = f"receipt_{shard * _worker['shard_size'] + offset + 1:09d}"
+            image, ground_truth = render_receipt(
+                *random_receipt(_worker['list_items'], rng), _worker['fonts'], _worker['logo']
+            )
+
+            buffer = io.BytesIO()
+            image.save(buffer, format='JPEG', quality=_worker['quality'])
+            _add_to_tar(tar, key + '.jpg', buffer.getvalue())
+            _add_to_tar(tar, key + '.json', json.dumps(ground_truth).encode())
+
+    os.replace(tmp_path, path)
+    return path
+
+
+def generate_receipt_shards(list_items, num_receipts, font_path, logo_path, output_dir,
+                            shard_size=1000, workers=None, seed=0, quality=75):
+    """
+    Generates random receipts in parallel and streams them into sharded tar archives.
+
+    Fonts and the scaled logo are loaded once per worker process. Finished shards are skipped when the
+    generation is restarted, so an interrupted run can be resumed with the same arguments.
+
+    :param list_items: A list of dictionaries containing item details.
+    :param num_receipts: The number of receipts to generate.
+    :param font_path: Path to the font file used for drawing text.
+    :param logo_path: Path to the logo image file.
+    :param output_dir: Directory the receipts-NNNNNN.tar shards are written to.
+    :param shard_size: Number of receipts per shard.
+    :param workers: Number of worker processes, defaults to the number of cores.
+    :param seed: Base seed of the random generator.
+    :param quality: JPEG quality of the receipt images.
+    :return: The number of receipts generated per second.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    shards = []
+    for shard, start in enumerate(range(0, num_receipts, shard_size)):
+        if not os.path.exists(os.path.join(output_dir, f"receipts-{shard:06d}.tar")):
+            shards.append((shard, min(shard_size, num_receipts - start)))
+    todo = sum(count for _, count in shards)
+
+    start_time = time.perf_counter()
+    initargs = (list_items, font_path, logo_path, output_dir, shard_size, seed, quality)
+    with multiprocessing.Pool(workers, initializer=_init_shard_worker, initargs=initargs) as pool:
+        for done, path in enumerate(pool.imap_unordered(_write_shard_task, shards), 1):
+            print(f"[{done}/{len(shards)}] {path}")
+    elapsed = time.perf_counter() - start_time
+
+    throughput = todo / elapsed if elapsed else 0.0
+    print(f"{todo} receipts generated in {elapsed:.1f}s ({throughput:.1f} receipts/s).")
+    return throughput
+
+
+def _write_shard_task(args):
+    return write_shard(*args)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate random receipt images.')
+    parser.add_argument('--csv', default='data_csv/data.csv', help='CSV file with nama and harga columns.')
+    parser.add_argument('--font', default='arial.ttf', help='Path to the font file.')
+    parser.add_argument('--logo', default='indomaret_logo.png', help='Path to the logo image file.')
+    parser.add_argument('--num', type=int, default=10, help='Number of receipts to generate.')
+    parser.add_argument('--shard-dir', help='Write tar shards with ground truth to this directory '
+                                            'instead of loose images to data/.')
+    parser.add_argument('--shard-size', type=int, default=1000, help='Receipts per shard.')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: number of cores).')
+    parser.add_argument('--seed', type=int, default=0, help='Base seed of the random generator.')
+    args = parser.parse_args()
+
+    # Load data from a CSV file into a DataFrame and convert it to a list of dictionaries
+    receipts_df = pd.read_csv(args.csv)
+    list_of_dicts = receipts_df.to_dict('records')
+
+    if args.shard_dir:
+        generate_receipt_shards(list_of_dicts, args.num, args.font, args.logo, args.shard_dir,
+                                shard_size=args.shard_size, workers=args.workers, seed=args.seed)
+    else:
+        # Generate random receipts images
+        generate_random_receipts(list_of_dicts, args.num, args.font, args.logo)
@@ -0,0 +1,161 @@
+"""
+Parse the OCR text of a receipt's item table into items and a total.
+
+Every line is classified by one precompiled regular expression as an item, a separator, a header, a
+``Total:`` line or unrecognized, so a stray OCR artifact only costs its own line instead of the whole
+receipt. Numbers may use ``,`` or ``.`` as thousands separators and may contain the usual OCR digit
+confusions (``O``/``o`` for 0, ``l``/``I``/``|`` for 1). Only those exact letters count as digits, the
+rest of the line is matched case-insensitively, so sizes like ``L`` or ``XL`` stay part of the name.
+
+Problems are reported as error codes rather than exceptions:
+
+- ``unrecognized``: the line is none of the known kinds and was skipped.
+- ``invalid_number``: the line looked like an item or ``Total:`` line but a number did not convert; it was
+  skipped.
+- ``missing_quantity``: the item had only a price and a total; the quantity was recovered from them.
+- ``item_total_mismatch``: quantity times price is not the item total. The item is kept as read.
+- ``duplicate_total``: a second ``Total:`` line; the first one is kept.
+- ``missing_total``: there is no ``Total:`` line.
+- ``totals_mismatch``: the item totals do not add up to the ``Total:`` line.
+
+Usage:
+    parsed = parse_receipt_text(ocr_text)
+    parsed.items, parsed.totals, parsed.errors
+"""
+
+import re
+from collections import namedtuple
+
+
+# A number as OCR reads it: digits, possibly confused with letters, in groups of three. The digit class is
+# case-sensitive, ``i`` or ``L`` would not convert
+_DIGIT = r"(?-i:[0-9OoIl|])"
+_NUMBER = rf"{_DIGIT}{{1,3}}(?:[,.]{_DIGIT}{{3}})+|{_DIGIT}+"
+
+LINE_PATTERN = re.compile(
+    rf"""
+    ^\s*(?:
+        (?P<separator>[-=_~–— ]*[-=_~–—]{{3,}}[-=_~–— ]*)
+      | T[o0]t[a4][l1I|]\s*[:;.]?\s*(?P<totals>{_NUMBER})
+      | (?P<name>.*?\S)\s+(?P<quantity>{_DIGIT}{{1,4}})\s+(?P<price>{_NUMBER})\s+(?P<total>{_NUMBER})
+      | (?P<short_name>.*?\S)\s+(?P<short_price>{_NUMBER})\s+(?P<short_total>{_NUMBER})
+      | (?P<header>.*\d{{1,2}}[./-]\d{{1,2}}[./-]\d{{2,4}}.*|JL\b.*)
+    )\s*$
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+
+_DIGIT_CONFUSIONS = str.maketrans("OoIl|", "00111", ",.")
+
+UNRECOGNIZED = "unrecognized"
+INVALID_NUMBER = "invalid_number"
+MISSING_QUANTITY = "missing_quantity"
+ITEM_TOTAL_MISMATCH = "item_total_mismatch"
+DUPLICATE_TOTAL = "duplicate_total"
+MISSING_TOTAL = "missing_total"
+TOTALS_MISMATCH = "totals_mismatch"
+
+# One classified line: its 1-based number, kind ("item", "separator", "header", "total" or "unrecognized"),
+# text and error code (None if the line parsed cleanly)
+ParsedLine = namedtuple("ParsedLine", ["number", "kind", "text", "error"])
+
+# The parse of a whole receipt. ``totals`` is None without a Total line, ``errors`` lists
+# {"line", "code", "text"} dictionaries, with a None line for receipt-level errors.
+ParsedReceipt = namedtuple("ParsedReceipt", ["items", "totals", "lines", "errors"])
+
+
+def parse_number(text):
+    """
+    Convert a number as read by OCR to an int, e.g. ``"2O,0l0"`` to ``20010``.
+    """
+    return int(text.translate(_DIGIT_CONFUSIONS))
+
+
+def parse_line(line):
+    """
+    Classify one line of OCR text.
+
+    Args:
+        line (str): The line.
+
+    Returns:
+        tuple: ``(kind, value, error)``. For items the value is the item dictionary, for ``Total:`` lines
+            the total, otherwise None.
+    """
+    match = LINE_PATTERN.match(line)
+    if match is None:
+        return UNRECOGNIZED, None, UNRECOGNIZED
+
+    try:
+        return _classify(match)
+    except ValueError:
+        return UNRECOGNIZED, None, INVALID_NUMBER
+
+
+def _classify(match):
+    if match["separator"] is not None:
+        return "separator", None, None
+    if match["totals"] is not None:
+        return "total", parse_number(match["totals"]), None
+    if match["header"] is not None:
+        return "header", None, None
+
+    error = None
+    if match["name"] is not None:
+        name = match["name"]
+        quantity, price, total = (parse_number(match[group]) for group in ("quantity", "price", "total"))
+    else:
+        # Only a price and a total, the quantity column was lost
+        name = match["short_name"]
+        price, total = parse_number(match["short_price"]), parse_number(match["short_total"])
+        if not price or total % price:
+            return UNRECOGNIZED, None, UNRECOGNIZED
+        quantity = total // price
+        error = MISSING_QUANTITY
+
+    if error is None and quantity * price != total:
+        error = ITEM_TOTAL_MISMATCH
+
+    item = {"name": name, "category": None, "quantity": quantity, "price": price, "total": total}
+    return "item", item, error
+
+
+def parse_receipt_text(text):
+    """
+    Parse the OCR text of a receipt's item table.
+
+    Args:
+        text (str): The OCR output, one receipt line per text line.
+
+    Returns:
+        ParsedReceipt: The items and total that could be read, every classified line and the error codes.
+    """
+    items = []
+    totals = None
+    lines = []
+    errors = []
+
+    for number, line in enumerate(text.split("\n"), 1):
+        line = line.strip()
+        if not line:
+            continue
+
+        kind, value, error = parse_line(line)
+        if kind == "item":
+            items.append(value)
+        elif kind == "total":
+            if totals is None:
+                totals = value
+            else:
+                error = DUPLICATE_TOTAL
+
+        lines.append(ParsedLine(number, kind, line, error))
+        if error is not None:
+            errors.append({"line": number, "code": error, "text": line})
+
+    if totals is None:
+        errors.append({"line": None, "code": MISSING_TOTAL, "text": None})
+    elif sum(item["total"] for item in items) != totals:
+        errors.append({"line": None, "code": TOTALS_MISMATCH, "text": None})
+
+    return ParsedReceipt(items, totals, lines, errors)
@@ -0,0 +1,281 @@
+"""
+Sinks the OCR results of processed receipts are written to.
+
+Every sink takes one result per receipt with ``write(path, receipt)``, or ``write(path, error=message)`` for
+receipts that failed. ``flush`` makes the results written so far durable where the format allows it, e.g.
+after every classified group in ``batch_ocr``, and ``close`` finishes the output:
+
+- ``JsonFileSink``: one small JSON file per receipt in a directory, like ``ocr_model.process_receipt``.
+  Every result is on disk once ``write`` returns.
+- ``JsonLinesSink``: one record per line appended to a file, see ``batch_ocr``. Durable on ``flush``.
+- ``ParquetSink``: one row per item in a Parquet file, written in row groups. The ``path``, ``name``,
+  ``category``, ``category_source`` and ``error`` columns are dictionary-encoded, the amounts are int64, so
+  a day of receipts is one compact file that aggregates by category without parsing JSON. Needs pyarrow.
+  A Parquet file is only readable once its footer is written, so its results are only durable on
+  ``close``: ``flush`` does nothing, and a run killed before ``close`` loses everything it wrote.
+
+``open_sink`` picks the sink from the output path. Every sink also reports the receipts it already holds,
+so an interrupted batch can resume where it stopped.
+
+Usage:
+    with open_sink("results.parquet") as sink:
+        sink.write("data/receipt_01.jpg", receipt)
+"""
+
+import os
+import json
+import glob
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+# Records buffered by a JSON Lines sink before they are written
+JSONL_BUFFER_SIZE = 256
+
+# Item rows per Parquet row group
+ROW_GROUP_SIZE = 65536
+
+# Columns of the Parquet sink, one row per item. Receipts without items, e.g. failed ones, get one row with
+# null item columns.
+DICTIONARY_COLUMNS = ("path", "name", "category", "category_source", "error")
+INTEGER_COLUMNS = ("quantity", "price", "total", "receipt_total")
+
+
+def _record(path, receipt, error):
+    return {"path": path, "error": error} if error is not None else {"path": path, **receipt}
+
+
+class _Sink:
+    def flush(self):
+        """
+        Make the results written so far durable, if the format allows it before ``close``.
+        """
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Results written before an interruption are kept, so the batch can resume after them
+        self.close()
+
+
+class JsonFileSink(_Sink):
+    """
+    Write every receipt to its own JSON file, named after the image.
+
+    Images with the same file name in different directories overwrite each other's results.
+
+    Args:
+        directory (str): The output directory, created if needed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _file_path(self, path):
+        name = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(self.directory, name + ".json")
+
+    def write(self, path, receipt=None, error=None):
+        with open(self._file_path(path), "w") as f:
+            json.dump(_record(path, receipt, error), f)
+
+    def recorded(self, retry_errors=False):
+        """
+        Return the paths of the receipts already written, see ``JsonLinesSink.recorded``.
+        """
+        done = set()
+        for file_path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                with open(file_path) as f:
+                    record = json.load(f)
+            except ValueError:
+                continue
+            if "path" in record and not (retry_errors and "error" in record):
+                done.add(record["path"])
+        return done
+
+
+class JsonLinesSink(_Sink):
+    """
+    Append one JSON record per receipt to a JSON Lines file.
+
+    Args:
+        path (str): The output file. Records are appended.
+        buffer_size (int): Records buffered before they are written.
+    """
+
+    def __init__(self, path, buffer_size=JSONL_BUFFER_SIZE):
+        self.path = path
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._file = None
+
+    def write(self, path, receipt=None, error=None):
+        self._buffer.append(json.dumps(_record(path, receipt, error)) + "\n")
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        if self._file is None:
+            self._file = open(self.path, "a")
+        self._file.write("".join(self._buffer))
+        self._file.flush()
+        self._buffer.clear()
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def recorded(self, retry_errors=False):
+        """
+        Read the paths that already have a record in the output file.
+
+        Args:
+            retry_errors (bool): If True, images whose record is an error are not considered done.
+
+        Returns:
+            set: The paths to skip.
+        """
+        done = set()
+        if not os.path.exists(self.path):
+            return done
+
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A partially written last line from an interrupted run
+                    continue
+                if "path" in record and not (retry_errors and "error" in record):
+                    done.add(record["path"])
+
+        return done
+
+
+class ParquetSink(_Sink):
+    """
+    Write one row per item to a Parquet file, see the module docstring for the columns.
+
+    Rows are buffered and written ``row_group_size`` at a time, and the rest as the last row group on
+    ``close``. The file is assembled under a temporary name and replaces ``path`` on ``close``; the row
+    groups of an existing file are carried over first, so a resumed batch adds to it.
+
+    The results are only durable on ``close``, see the module docstring. ``flush`` does not write a row
+    group, so frequent flushes, e.g. by ``batch_ocr``, do not split the file into small row groups.
+
+    Args:
+        path (str): The output ``.parquet`` file.
+        row_group_size (int): Item rows per row group.
+        compression (str): Parquet compression codec.
+
+    Raises:
+        ImportError: If pyarrow is not installed.
+    """
+
+    def __init__(self, path, row_group_size=ROW_GROUP_SIZE, compression="zstd"):
+        if pa is None:
+            raise ImportError("ParquetSink needs pyarrow, install it with `pip install pyarrow`.")
+        self.path = path
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.schema = pa.schema(
+            [(name, pa.dictionary(pa.int32(), pa.string())) for name in DICTIONARY_COLUMNS]
+            + [(name, pa.int64()) for name in INTEGER_COLUMNS]
+        )
+        self._columns = {name: [] for name in self.schema.names}
+        self._rows = 0
+        self._writer = None
+
+    def write(self, path, receipt=None, error=None):
+        items = receipt["items"] if receipt is not None else []
+        receipt_total = receipt.get("totals") if receipt is not None else None
+        for item in items or [{}]:
+            self._columns["path"].append(path)
+            self._columns["error"].append(error)
+            self._columns["receipt_total"].append(receipt_total)
+            for name in ("name", "category", "category_source", "quantity", "price", "total"):
+                self._columns[name].append(item.get(name))
+        self._rows += len(items) or 1
+        if self._rows >= self.row_group_size:
+            self._write_row_group()
+
+    def flush(self):
+        # Nothing is readable before the footer is written on close, see the class docstring
+        pass
+
+    def _write_row_group(self):
+        if not self._rows:
+            return
+        if self._writer is None:
+            self._open()
+        table = pa.table(
+            {name: pa.array(values, type=self.schema.field(name).type) for name, values in self._columns.items()},
+            schema=self.schema,
+        )
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        for values in self._columns.values():
+            values.clear()
+        self._rows = 0
+
+    def _open(self):
+        self._tmp_path = self.path + ".tmp"
+        self._writer = pq.ParquetWriter(self._tmp_path, self.schema, compression=self.compression)
+        if os.path.exists(self.path):
+            existing = pq.ParquetFile(self.path)
+            for index in range(existing.num_row_groups):
+                self._writer.write_table(existing.read_row_group(index))
+
+    def close(self):
+        self._write_row_group()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            os.replace(self._tmp_path, self.path)
+
+    def recorded(self, retry_errors=False):
+        """
+        Return the paths of the receipts already in the output file, see ``JsonLinesSink.recorded``.
+        """
+        if not os.path.exists(self.path):
+            return set()
+        table = pq.read_table(self.path, columns=["path", "error"])
+        paths = table.column("path").to_pylist()
+        if not retry_errors:
+            return set(paths)
+        return {path for path, error in zip(paths, table.column("error").to_pylist()) if error is None}
+
+
+def open_sink(path, **kwargs):
+    """
+    Open the sink matching the output path: ``.jsonl`` for JSON Lines, ``.parquet`` for Parquet, and a
+    directory (a path without extension) for one JSON file per receipt.
+
+    Args:
+        path (str): The output path.
+        **kwargs: Extra keyword arguments for the sink.
+
+    Raises:
+        ValueError: If the extension has no sink.
+    """
+    extension = os.path.splitext(path.rstrip("/" + os.sep))[1].lower()
+    if extension == ".jsonl":
+        return JsonLinesSink(path, **kwargs)
+    if extension == ".parquet":
+        return ParquetSink(path, **kwargs)
+    if not extension or os.path.isdir(path):
+        return JsonFileSink(path, **kwargs)
+    raise ValueError(f"No result sink for {path!r}, expected a .jsonl or .parquet file or a directory.")
@@ -0,0 +1,169 @@
+"""
+Store of processed receipts keyed by the content hash of their image, so a receipt is only OCRed once.
+
+A re-uploaded photo, or an image a batch job already processed, has the same bytes and therefore the same
+hash: its stored result is returned without decoding the image. Results are also tied to a version of
+everything they depend on (model, tokenizer, catalog, Tesseract and its configuration, see
+``ocr_model.result_version``), so results of another setup are never returned.
+
+The store is one SQLite file. It is bounded by the size of the stored results: once ``max_bytes`` is
+exceeded, the least recently used entries are evicted.
+
+Usage:
+    store = ResultStore("results.sqlite")
+    processor = ReceiptProcessor(model_path, tokenizer_path, result_store=store)
+    processor.process("data/receipt_01.jpg")
+    store.stats()
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+# Size of the content hash in bytes
+HASH_SIZE = 16
+
+# Stored results are bounded to this many bytes by default
+MAX_BYTES = 256 * 2**20
+
+# Eviction frees space down to this fraction of ``max_bytes``, so it does not run on every insert
+EVICT_TO = 0.9
+
+
+def content_hash(data):
+    """
+    Return the hex digest of the content of an encoded image.
+
+    Args:
+        data: The encoded image as ``bytes``, a ``memoryview`` or a 1-D ``numpy.ndarray``.
+    """
+    return hashlib.blake2b(data, digest_size=HASH_SIZE).hexdigest()
+
+
+class ResultStore:
+    """
+    Thread-safe, size-bounded SQLite store of receipt results keyed by image content hash.
+
+    Args:
+        path (str): The SQLite file, created if needed.
+        max_bytes (int): Maximum size of the stored results, before least recently used ones are evicted.
+        version (str): Version of the pipeline the results belong to, see ``bind``.
+    """
+
+    def __init__(self, path, max_bytes=MAX_BYTES, version=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "version TEXT NOT NULL, hash TEXT NOT NULL, result TEXT NOT NULL, image_bytes INTEGER NOT NULL, "
+            "used_at REAL NOT NULL, PRIMARY KEY (version, hash)) WITHOUT ROWID"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_used_at ON results (used_at)")
+        (self._size,) = self._db.execute("SELECT COALESCE(SUM(LENGTH(result)), 0) FROM results").fetchone()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def bind(self, version):
+        """
+        Tie lookups and inserts to a pipeline version. Results of other versions are kept until evicted.
+
+        Args:
+            version (str): The version, see ``ocr_model.result_version``.
+        """
+        self.version = version
+
+    def get(self, key, image_bytes=0):
+        """
+        Look up the stored result of an image.
+
+        Args:
+            key (str): The content hash of the image, see ``content_hash``.
+            image_bytes (int): Size of the encoded image, added to ``bytes_saved`` on a hit.
+
+        Returns:
+            dict: The stored result, or None if the image was not processed with this version.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT result FROM results WHERE version = ? AND hash = ?", (self.version, key)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._db.execute(
+                "UPDATE results SET used_at = ? WHERE version = ? AND hash = ?", (time.time(), self.version, key)
+            )
+            self.hits += 1
+            self.bytes_saved += image_bytes
+        return json.loads(row[0])
+
+    def put(self, key, result, image_bytes=0):
+        """
+        Store the result of an image, evicting the least recently used results if the store is full.
+
+        Args:
+            key (str): The content hash of the image.
+            result (dict): The processed receipt.
+            image_bytes (int): Size of the encoded image.
+        """
+        text = json.dumps(result)
+        with self._lock:
+            previous = self._db.execute(
+                "SELECT LENGTH(result) FROM results WHERE version = ? AND hash = ?", (self.version, key)
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (self.version, key, text, image_bytes, time.time()),
+            )
+            self._size += len(text) - (previous[0] if previous else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        target = self.max_bytes * EVICT_TO
+        evicted = []
+        for version, key, size in self._db.execute(
+            "SELECT version, hash, LENGTH(result) FROM results ORDER BY used_at"
+        ):
+            if self._size <= target:
+                break
+            evicted.append((version, key))
+            self._size -= size
+        self._db.executemany("DELETE FROM results WHERE version = ? AND hash = ?", evicted)
+
+    def stats(self):
+        """
+        Return the store counters.
+
+        Returns:
+            dict: ``hits``, ``misses``, ``hit_rate``, the ``bytes_saved`` of images that were not processed
+                again, and the current ``size_bytes`` of the stored results.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "size_bytes": self._size,
+            }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
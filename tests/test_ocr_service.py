@@ -0,0 +1,138 @@
+import asyncio
+import threading
+
+import pytest
+
+import ocr_model
+from ocr_service import ReceiptService, request
+
+
+class StubProcessor:
+    """
+    Stands in for ``ReceiptProcessor``, labelling every name ``"Food"`` and recording each batch it gets.
+    """
+
+    def __init__(self):
+        self.batches = []
+
+    def predict_texts(self, texts):
+        self.batches.append(list(texts))
+        return ["Food"] * len(texts)
+
+
+def fake_read_items(data, metrics=None, **options):
+    # One item per line of the "image", e.g. b"Roti 5000\nSusu 7000"
+    items = []
+    for line in data.decode().splitlines():
+        name, _, price = line.rpartition(" ")
+        items.append({"name": name, "price": int(price)})
+    return {"items": items, "totals": sum(item["price"] for item in items), "errors": []}
+
+
+@pytest.fixture(autouse=True)
+def stub_ocr(monkeypatch):
+    monkeypatch.setattr(ocr_model, "read_items", fake_read_items)
+
+
+async def start(service):
+    server = await asyncio.start_server(service.handle_connection, "127.0.0.1", 0)
+    await service.start()
+    return server, server.sockets[0].getsockname()[1]
+
+
+async def stop(service, server):
+    server.close()
+    await server.wait_closed()
+    await service.stop()
+
+
+def test_health_and_readiness(monkeypatch):
+    loaded = threading.Event()
+
+    def get_processor(model_path, tokenizer_path):
+        loaded.wait(5)
+        return StubProcessor()
+
+    monkeypatch.setattr(ocr_model, "get_processor", get_processor)
+
+    async def main():
+        service = ReceiptService("model.npz", "tokenizer.json", warm_up=False)
+        server, port = await start(service)
+        try:
+            assert await request("127.0.0.1", port, "GET", "/healthz") == (200, {"status": "ok"})
+            assert await request("127.0.0.1", port, "GET", "/readyz") == (503, {"status": "loading"})
+            status, _ = await request("127.0.0.1", port, "POST", "/receipts", b"Roti 5000")
+            assert status == 503
+
+            loaded.set()
+            await service._loading
+            assert await request("127.0.0.1", port, "GET", "/readyz") == (200, {"status": "ready"})
+        finally:
+            loaded.set()
+            await stop(service, server)
+
+    asyncio.run(main())
+
+
+def test_upload_returns_classified_items():
+    async def main():
+        service = ReceiptService(processor=StubProcessor())
+        server, port = await start(service)
+        try:
+            status, payload = await request("127.0.0.1", port, "POST", "/receipts", b"Roti Tawar 5000\nSusu 7000")
+        finally:
+            await stop(service, server)
+        return status, payload
+
+    status, payload = asyncio.run(main())
+    assert status == 200
+    assert payload["totals"] == 12000
+    assert [(item["name"], item["category"]) for item in payload["items"]] == [("Roti Tawar", "Food"), ("Susu", "Food")]
+
+
+@pytest.mark.parametrize("length", ["abc", "-5"])
+def test_invalid_content_length(length):
+    async def main():
+        service = ReceiptService(processor=StubProcessor())
+        server, port = await start(service)
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(f"POST /receipts HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode())
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+        finally:
+            await stop(service, server)
+        return response
+
+    assert asyncio.run(main()).startswith(b"HTTP/1.1 400 ")
+
+
+@pytest.mark.parametrize(
+    "max_batch_size, max_wait_ms, expected",
+    [
+        # The first upload waits long enough for the others to join its batch
+        (64, 200, [8]),
+        # A full batch is dispatched without waiting, uploads are never split across batches
+        (4, 10_000, [4, 4]),
+    ],
+)
+def test_concurrent_uploads_share_a_batch(max_batch_size, max_wait_ms, expected):
+    processor = StubProcessor()
+
+    async def main():
+        service = ReceiptService(processor=processor, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+        server, port = await start(service)
+        try:
+            await service._loading
+            uploads = [f"Item {i}a 1000\nItem {i}b 2000".encode() for i in range(4)]
+            return await asyncio.wait_for(
+                asyncio.gather(*(request("127.0.0.1", port, "POST", "/receipts", body) for body in uploads)), 5
+            )
+        finally:
+            await stop(service, server)
+
+    responses = asyncio.run(main())
+    assert [status for status, _ in responses] == [200] * 4
+    assert [payload["totals"] for _, payload in responses] == [3000] * 4
+    assert [len(batch) for batch in processor.batches] == expected
@@ -0,0 +1,51 @@
+import csv
+
+import pytest
+
+from ocr_model import ReceiptProcessor
+from prediction_cache import PredictionCache
+
+
+def load_names(path="data_csv/data.csv", limit=300):
+    with open(path, newline="") as f:
+        return [row["nama"] for row, _ in zip(csv.DictReader(f), range(limit))]
+
+
+def variants(name):
+    """
+    Return OCR-like variants of a name: quote marks inside words, other cases, punctuation and spacing.
+    """
+    first, _, rest = name.partition(" ")
+    return [
+        name,
+        name.upper(),
+        f"{first}’{rest}",
+        f"{first}'{rest}",
+        f"“{name}”",
+        f"{name}.",
+        "  ".join(name.split()),
+    ]
+
+
+@pytest.fixture(scope="module")
+def processor():
+    return ReceiptProcessor("model/model.npz", "model/tokenizer.json")
+
+
+def test_cached_predictions_match_uncached(processor):
+    texts = [variant for name in load_names() for variant in variants(name)]
+    expected = processor.predict_texts(texts)
+
+    processor.cache = PredictionCache()
+    try:
+        # Once filling the cache, once answered from it, in another order
+        assert processor.predict_texts(texts) == expected
+        assert processor.predict_texts(texts[::-1]) == expected[::-1]
+        assert processor.cache.hits > 0
+    finally:
+        processor.cache = None
+
+
+def test_cache_key_is_the_tokenizer_words(processor):
+    assert processor._cache_key("Biskuit’Roma  Kelapa!") == "biskuit’roma kelapa"
+    assert processor._cache_key("Biskuit’Roma Kelapa") != processor._cache_key("Biskuit Roma Kelapa")
@@ -0,0 +1,33 @@
+import cv2
+import pytest
+
+from preprocessing import find_table_roi
+
+
+@pytest.fixture(scope="module")
+def receipt():
+    return cv2.imread("data/receipt_01.jpg")
+
+
+@pytest.mark.parametrize("edge", ["top", "bottom", "both"])
+def test_ink_touching_the_image_edge(receipt, edge):
+    # A dark strip along the edge, as the table or background around a phone photo of a receipt
+    img = receipt.copy()
+    if edge in ("top", "both"):
+        img[:3] = 20
+    if edge in ("bottom", "both"):
+        img[-3:] = 20
+
+    (roi,) = find_table_roi(img)
+    (expected,) = find_table_roi(receipt)
+    assert roi[:4] == expected[:4]
+
+
+def test_text_reaching_the_last_row(receipt):
+    # The receipt cropped through its ``Total:`` row, so the last text line runs into the bottom edge
+    (full,) = find_table_roi(receipt)
+    img = receipt[: full.y + full.h - 8]
+
+    (roi,) = find_table_roi(img)
+    assert roi.y == full.y
+    assert roi.y + roi.h == img.shape[0]
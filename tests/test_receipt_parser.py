@@ -0,0 +1,39 @@
+import pytest
+
+from receipt_parser import INVALID_NUMBER, MISSING_QUANTITY, UNRECOGNIZED, parse_line, parse_receipt_text
+
+
+@pytest.mark.parametrize("size", ["L", "M", "S", "XL", "XXL", "i"])
+def test_one_letter_tokens_stay_in_the_name(size):
+    kind, item, error = parse_line(f"Kaos {size} 2 50,000 100,000")
+    assert (kind, error) == ("item", None)
+    assert item["name"] == f"Kaos {size}"
+    assert (item["quantity"], item["price"], item["total"]) == (2, 50000, 100000)
+
+
+@pytest.mark.parametrize(
+    "line, expected",
+    [
+        ("Kaos L 50,000", (UNRECOGNIZED, None, UNRECOGNIZED)),
+        ("Kopi i 3,000 3,000", ("item", "Kopi i", MISSING_QUANTITY)),
+        ("Kaos M 50,000 50,000", ("item", "Kaos M", MISSING_QUANTITY)),
+    ],
+)
+def test_size_letters_are_not_digits(line, expected):
+    kind, item, error = parse_line(line)
+    assert (kind, item and item["name"], error) == expected
+
+
+def test_digit_confusions_are_still_read():
+    kind, item, error = parse_line("Teh Botol I 3,0O0 3,OOO")
+    assert (kind, error) == ("item", None)
+    assert (item["name"], item["quantity"], item["price"], item["total"]) == ("Teh Botol", 1, 3000, 3000)
+    assert parse_line("TOTAL: l2,O00") == ("total", 12000, None)
+
+
+def test_receipt_with_size_letters_parses():
+    parsed = parse_receipt_text("Kaos L 50,000\nKopi i 3,000 3,000\nKaos XL 1 75,000 75,000\nTotal: 78,000")
+    assert [item["name"] for item in parsed.items] == ["Kopi i", "Kaos XL"]
+    assert parsed.totals == 78000
+    assert [error["code"] for error in parsed.errors] == [UNRECOGNIZED, MISSING_QUANTITY]
+    assert all(error["code"] != INVALID_NUMBER for error in parsed.errors)